@@ -2,7 +2,8 @@ import sys
 from PyQt6.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
     QTabWidget, QGroupBox, QFormLayout, QLabel, QLineEdit,
-    QPushButton, QMessageBox, QTextEdit, QFileDialog, QSizePolicy, QScrollArea
+    QPushButton, QMessageBox, QTextEdit, QFileDialog, QSizePolicy, QScrollArea, QComboBox,
+    QCheckBox
 )
 from PyQt6.QtGui import QPixmap, QImage
 from PyQt6.QtCore import Qt, QSize
@@ -15,6 +16,7 @@ from mpl_toolkits.mplot3d import Axes3D  # Уже импортировано
 # Убедитесь, что illumination_calculator.py находится в том же каталоге
 # или доступен в PYTHONPATH
 from illumination_calculator import IlluminationCalculator
+from illumination_statistics import disk_illumination_statistics, compare_with_grid
 
 
 class IlluminationApp(QMainWindow):
@@ -91,6 +93,24 @@ class IlluminationApp(QMainWindow):
         circle_form_layout.addRow("Радиус:", self.entry_circle_r)
         layout.addWidget(circle_group)
 
+        # Секция "Тональная Компрессия" - перевод освещенности в 0-255 для изображения
+        tone_group = QGroupBox("Тональная Компрессия Изображения")
+        tone_form_layout = QFormLayout(tone_group)
+        self.combo_tone_curve = QComboBox()
+        self.combo_tone_curve.addItem("Линейная", "linear")
+        self.combo_tone_curve.addItem("Гамма", "gamma")
+        self.combo_tone_curve.addItem("Логарифмическая", "log")
+        self.entry_white_percentile = QLineEdit("100")  # 100 - деление на максимум
+        self.entry_tone_gamma = QLineEdit("2.2")
+        tone_form_layout.addRow("Кривая:", self.combo_tone_curve)
+        tone_form_layout.addRow("Белая точка (процентиль):", self.entry_white_percentile)
+        tone_form_layout.addRow("Гамма:", self.entry_tone_gamma)
+        layout.addWidget(tone_group)
+
+        # Радиальный режим: освещенность по таблице E(rho^2) с интерполяцией (погрешность <= 1e-6)
+        self.check_radial = QCheckBox("Быстрый радиальный расчет (отн. погрешность не больше 1e-6)")
+        layout.addWidget(self.check_radial)
+
         calc_button = QPushButton("Рассчитать и Визуализировать")
         calc_button.clicked.connect(self._calculate_and_visualize)
         layout.addWidget(calc_button)
@@ -269,10 +289,30 @@ class IlluminationApp(QMainWindow):
             QMessageBox.critical(self, "Ошибка Ввода", f"Некорректные данные: {e}")
             return None
 
+    def _get_tone_mapping_params(self):
+        try:
+            white_percentile = float(self.entry_white_percentile.text())
+            gamma = float(self.entry_tone_gamma.text())
+            if not (0 < white_percentile <= 100):
+                raise ValueError("Процентиль белой точки должен быть в диапазоне (0, 100].")
+            if not (gamma > 0):
+                raise ValueError("Показатель гаммы должен быть положительным.")
+            return {
+                "curve": self.combo_tone_curve.currentData(),
+                "white_percentile": white_percentile,
+                "gamma": gamma,
+            }
+        except ValueError as e:
+            QMessageBox.critical(self, "Ошибка Ввода", f"Некорректные данные: {e}")
+            return None
+
     def _calculate_and_visualize(self):
         params = self._get_params()
         if params is None:
             return
+        tone_params = self._get_tone_mapping_params()
+        if tone_params is None:
+            return
 
         W, H, Wres, Hres, xL, yL, zL, I0, circle_cx, circle_cy, circle_r = params
 
@@ -280,15 +320,19 @@ class IlluminationApp(QMainWindow):
         y_min, y_max = -H / 2, H / 2
 
         try:
-            self.raw_illumination_data = self.calculator.calculate_illumination(
+            calculate = (self.calculator.calculate_illumination_radial if self.check_radial.isChecked()
+                         else self.calculator.calculate_illumination)
+            self.raw_illumination_data = calculate(
                 x_min, y_min, x_max, y_max,
                 Wres, Hres,
                 xL, yL, zL, I0,
                 circle_cx, circle_cy, circle_r
             )
 
-            # Нормализуем для 2D изображения (0-255)
-            self.normalized_illumination_image = self.calculator.normalize_illumination(self.raw_illumination_data)
+            # Нормализуем для 2D изображения (0-255) с выбранной тональной кривой
+            self.normalized_illumination_image = self.calculator.tone_map_illumination(
+                self.raw_illumination_data, **tone_params
+            )
 
             self._display_illumination_image(self.normalized_illumination_image)
 
@@ -415,16 +459,26 @@ class IlluminationApp(QMainWindow):
         stats_output.append(f"Пересечение Y- ({circle_cx:.1f}, {circle_cy - circle_r:.1f}): {e_y_minus:.7f}\n")
 
         # 3. Максимальное, минимальное и среднее значения в пределах круга
-        # illumination_data > 0 уже фильтрует те точки, которые были вне круга или имели нулевую освещенность
-        illum_values_in_circle = self.raw_illumination_data[self.raw_illumination_data > 0]
-
-        max_illum = np.max(illum_values_in_circle) if illum_values_in_circle.size > 0 else 0.0
-        min_illum = np.min(illum_values_in_circle) if illum_values_in_circle.size > 0 else 0.0
-        avg_illum = np.mean(illum_values_in_circle) if illum_values_in_circle.size > 0 else 0.0
-
-        stats_output.append(f"\nМаксимальная освещенность в круге: {max_illum:.7f}\n")
-        stats_output.append(f"Минимальная освещенность в круге (ненулевая): {min_illum:.7f}\n")
-        stats_output.append(f"Средняя освещенность в круге (ненулевая): {avg_illum:.7f}\n")
+        # Положительные значения - точки круга; статистика считается по полосам строк,
+        # без копии значений круга
+        grid_stats = self.calculator.summarize_illumination(self.raw_illumination_data, x_min, y_min, x_max, y_max)
+
+        stats_output.append(f"\nМаксимальная освещенность в круге: {grid_stats['max']:.7f}\n")
+        stats_output.append(f"Минимальная освещенность в круге (ненулевая): {grid_stats['min']:.7f}\n")
+        stats_output.append(f"Средняя освещенность в круге (ненулевая): {grid_stats['mean']:.7f}\n")
+        stats_output.append(f"Точек сетки в круге: {grid_stats['count']}\n")
+        stats_output.append(f"Поток на круг (сумма E·dx·dy): {grid_stats['flux_W']:.7f} Вт\n")
+
+        # 4. Точные значения по кругу (не зависят от разрешения) и отклонение значений сетки
+        exact_stats = disk_illumination_statistics(xL, yL, zL, I0, circle_cx, circle_cy, circle_r)
+        labels = {"max": "Максимальная освещенность", "min": "Минимальная освещенность",
+                  "mean": "Средняя освещенность", "flux_W": "Поток на круг, Вт"}
+        stats_output.append("\n--- Точные значения в круге (аналитически) ---\n")
+        for name, (grid_value, exact_value, deviation) in compare_with_grid(exact_stats, grid_stats).items():
+            stats_output.append(f"{labels[name]}: {exact_value:.7f} (сетка: {deviation * 100:+.4f}%)\n")
+        max_point, min_point = exact_stats["max_point_mm"], exact_stats["min_point_mm"]
+        stats_output.append(f"Точка максимума: ({max_point[0]:.1f}, {max_point[1]:.1f}), "
+                            f"точка минимума: ({min_point[0]:.1f}, {min_point[1]:.1f})\n")
 
         self.stats_text.setText("".join(stats_output))
 
@@ -1,7 +1,71 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
 
+from tone_mapping import ToneMapper, iter_row_bands
+
+
+class IlluminationStatsAccumulator:
+    """
+    Потоковая статистика освещенности в круге: максимум, минимум, среднее, число точек и
+    полный поток (сумма E * dx * dy, Вт). Точками круга считаются положительные значения
+    (вне круга карта равна нулю). Полосы обрабатываются без копий: минимум - с where,
+    сумма и число - по всей полосе (нули в них не влияют).
+    """
+
+    def __init__(self, pixel_area_m2):
+        self.pixel_area_m2 = pixel_area_m2
+        self.max_value = 0.0
+        self.min_value = np.inf
+        self.total = 0.0
+        self.count = 0
+
+    @classmethod
+    def for_grid(cls, x_min, y_min, x_max, y_max, width_res, height_res):
+        """Накопитель для сетки np.linspace: площадь ячейки - произведение шагов (в м^2)."""
+        step_x_m = (x_max - x_min) / 1000 / max(width_res - 1, 1)
+        step_y_m = (y_max - y_min) / 1000 / max(height_res - 1, 1)
+        return cls(step_x_m * step_y_m)
+
+    def update(self, band):
+        positive = band > 0
+        band_count = int(np.count_nonzero(positive))
+        if band_count == 0:
+            return
+        self.count += band_count
+        self.max_value = max(self.max_value, float(band.max()))
+        self.min_value = min(self.min_value, float(np.min(band, where=positive, initial=np.inf)))
+        self.total += float(band.sum(dtype=np.float64))
+
+    def result(self):
+        if self.count == 0:
+            return {"max": 0.0, "min": 0.0, "mean": 0.0, "count": 0, "flux_W": 0.0,
+                    "pixel_area_m2": self.pixel_area_m2}
+        return {
+            "max": self.max_value,
+            "min": self.min_value,
+            "mean": self.total / self.count,
+            "count": self.count,
+            "flux_W": self.total * self.pixel_area_m2,
+            "pixel_area_m2": self.pixel_area_m2,
+        }
+
 
 class IlluminationCalculator:
+    # Элементов во временных массивах круговой маски (маска строится полосами строк)
+    MASK_CHUNK_ELEMENTS = 1 << 20
+    # Бюджет памяти на временные массивы (источники x точки) расчета от многих источников
+    MULTI_SOURCE_MEMORY_BUDGET_BYTES = 64 * 1024 * 1024
+    # Полос строк на поток: мелкие полосы выравнивают нагрузку потоков
+    BANDS_PER_WORKER = 4
+    # Радиальный режим: допустимая относительная погрешность интерполяции по умолчанию
+    # и наибольший размер таблицы (при большем расчет выполняется точно)
+    RADIAL_REL_TOL = 1e-6
+    RADIAL_MAX_TABLE_SIZE = 1 << 22
+    # Элементов в полосе потокового расчета
+    STREAM_BAND_ELEMENTS = 1 << 22
+
     def __init__(self):
         pass
 
@@ -10,7 +74,8 @@ class IlluminationCalculator:
                                width_res, height_res,
                                light_pos_x, light_pos_y, light_pos_z,
                                light_intensity_I0,
-                               circle_center_x, circle_center_y, circle_radius):
+                               circle_center_x, circle_center_y, circle_radius,
+                               dtype=np.float64, out=None):
         """
         Рассчитывает распределение освещенности на заданной области.
 
@@ -28,12 +93,22 @@ class IlluminationCalculator:
             Координаты центра круга в миллиметрах.
         circle_radius : float
             Радиус круга в миллиметрах, в пределах которого производится расчет.
+        dtype : numpy.dtype
+            Тип результата: np.float64 (по умолчанию) или np.float32 (вдвое меньше памяти).
+        out : numpy.ndarray, optional
+            Массив (height_res, width_res) типа dtype для результата (например, np.memmap).
 
         Возвращает:
         -----------
         numpy.ndarray
             Двумерный массив с рассчитанными значениями освещенности.
+
+        Полные сетки координат не строятся: координаты - векторы x (W,) и y (H,), которые
+        совмещаются трансляцией, а все вычисления выполняются на месте в одном массиве
+        результата. Круговая маска строится полосами строк. При dtype=np.float64 результат
+        совпадает побитно с расчетом по полным сеткам np.meshgrid.
         """
+        dtype = self._check_output_buffer(out, (height_res, width_res), dtype)
 
         # *** Преобразуем все миллиметры в метры для корректного расчета Вт/м^2 ***
         x_min_m, y_min_m = x_min / 1000, y_min / 1000
@@ -46,35 +121,382 @@ class IlluminationCalculator:
             circle_center_x / 1000, circle_center_y / 1000
         circle_radius_m = circle_radius / 1000
 
+        if light_pos_z_m <= 0:
+            raise ValueError("Координата Z источника света (zL) должна быть строго больше нуля.")
+
+        illumination_map = np.empty((height_res, width_res), dtype=dtype) if out is None else out
+
+        # Координаты столбцов (x) и строк (y) - векторы, а не сетки
         x_coords_m = np.linspace(x_min_m, x_max_m, width_res)
         y_coords_m = np.linspace(y_min_m, y_max_m, height_res)
 
-        # Создаем 2D сетку координат. Y_grid соответствует строкам, X_grid - столбцам.
-        X_grid_m, Y_grid_m = np.meshgrid(x_coords_m, y_coords_m)
+        self._fill_illumination(illumination_map,
+                                np.square(x_coords_m - light_pos_x_m), np.square(y_coords_m - light_pos_y_m),
+                                light_pos_z_m, light_intensity_I0)
+        self._apply_circle_mask(illumination_map, x_coords_m, y_coords_m,
+                                circle_center_x_m, circle_center_y_m, circle_radius_m)
+        return illumination_map
 
-        illumination_map = np.zeros((height_res, width_res))
+    def _fill_illumination(self, target, dx_sq_m, dy_sq_m, light_pos_z_m, light_intensity_I0):
+        """
+        Освещенность в target (строки x столбцы) на месте по векторам dx^2 (столбцы)
+        и dy^2 (строки) - смещениям от проекции источника в метрах.
+        """
+        dtype = target.dtype
+        dz_sq_m = light_pos_z_m ** 2  # dz - это zL
 
+        # r^2 = dx^2 + dy^2 + zL^2 (порядок сложения как у расчета по сеткам), затем r, r^3
+        np.add(dy_sq_m.astype(dtype)[:, np.newaxis], dx_sq_m.astype(dtype)[np.newaxis, :], out=target)
+        target += dtype.type(dz_sq_m)
+        np.sqrt(target, out=target)
+        np.power(target, 3, out=target)
+
+        # Расчет освещенности E = I0 * zL / r^3 (все в метрах, результат Вт/м^2)
+        # Избегаем деления на ноль, так как r > 0 (так как zL > 0)
+        np.divide(dtype.type(light_intensity_I0 * light_pos_z_m), target, out=target)
+
+    def iter_illumination_bands(self,
+                                x_min, y_min, x_max, y_max,
+                                width_res, height_res,
+                                light_pos_x, light_pos_y, light_pos_z,
+                                light_intensity_I0,
+                                circle_center_x, circle_center_y, circle_radius,
+                                band_rows=None, dtype=np.float64, out=None, stats=None):
+        """
+        Потоковый расчет освещенности полосами строк: генератор пар (row_start, полоса).
+
+        Параметры те же, что у calculate_illumination, и дополнительно:
+        band_rows : int, optional
+            Строк в полосе (по умолчанию полоса около STREAM_BAND_ELEMENTS элементов).
+        out : numpy.ndarray, optional
+            Массив (height_res, width_res) типа dtype, обычно np.memmap: полосы записываются
+            в него и выдаются как его срезы. Без out полоса - один временный буфер,
+            перезаписываемый следующей полосой (значения нужно скопировать, если они нужны позже).
+        stats : IlluminationStatsAccumulator, optional
+            Накопитель статистики, обновляемый каждой полосой.
+
+        В памяти находится только одна полоса, поэтому карты любого размера (100k x 100k)
+        обрабатываются за один проход. Значения совпадают с calculate_illumination.
+        """
+        dtype = self._check_output_buffer(out, (height_res, width_res), dtype)
+        light_pos_x_m, light_pos_y_m, light_pos_z_m = \
+            light_pos_x / 1000, light_pos_y / 1000, light_pos_z / 1000
+        circle_center_x_m, circle_center_y_m = circle_center_x / 1000, circle_center_y / 1000
+        circle_radius_m = circle_radius / 1000
         if light_pos_z_m <= 0:
             raise ValueError("Координата Z источника света (zL) должна быть строго больше нуля.")
+        if band_rows is None:
+            band_rows = max(1, self.STREAM_BAND_ELEMENTS // width_res)
+
+        x_coords_m = np.linspace(x_min / 1000, x_max / 1000, width_res)
+        y_coords_m = np.linspace(y_min / 1000, y_max / 1000, height_res)
+        bounds = self._circle_bounds(x_coords_m, y_coords_m, circle_center_x_m, circle_center_y_m,
+                                     circle_radius_m ** 2)
+        if bounds is not None:
+            circle_row_start, circle_row_stop, col_start, col_stop = bounds
+            x_circle_m = x_coords_m[col_start:col_stop]
+            dx_sq_m = np.square(x_circle_m - light_pos_x_m)
+        buffer = np.empty((min(band_rows, height_res), width_res), dtype=dtype) if out is None else None
+
+        for row_start in range(0, height_res, band_rows):
+            row_stop = min(row_start + band_rows, height_res)
+            band = out[row_start:row_stop] if out is not None else buffer[:row_stop - row_start]
+            band[...] = 0
+            # Расчет только в строках и столбцах, пересекающих круг
+            if bounds is not None:
+                rows_start, rows_stop = max(row_start, circle_row_start), min(row_stop, circle_row_stop)
+                if rows_start < rows_stop:
+                    target = band[rows_start - row_start:rows_stop - row_start, col_start:col_stop]
+                    y_circle_m = y_coords_m[rows_start:rows_stop]
+                    self._fill_illumination(target, dx_sq_m, np.square(y_circle_m - light_pos_y_m),
+                                            light_pos_z_m, light_intensity_I0)
+                    self._apply_circle_mask(target, x_circle_m, y_circle_m,
+                                            circle_center_x_m, circle_center_y_m, circle_radius_m)
+            if stats is not None:
+                stats.update(band)
+            yield row_start, band
+
+    def calculate_illumination_stats(self,
+                                     x_min, y_min, x_max, y_max,
+                                     width_res, height_res,
+                                     light_pos_x, light_pos_y, light_pos_z,
+                                     light_intensity_I0,
+                                     circle_center_x, circle_center_y, circle_radius,
+                                     band_rows=None, dtype=np.float64, out=None):
+        """
+        Статистика освещенности в круге за один потоковый проход (см. iter_illumination_bands)
+        без хранения карты; с out карта записывается в него (например, в np.memmap).
+        Возвращает словарь IlluminationStatsAccumulator.result().
+        """
+        stats = IlluminationStatsAccumulator.for_grid(x_min, y_min, x_max, y_max, width_res, height_res)
+        for _ in self.iter_illumination_bands(
+                x_min, y_min, x_max, y_max, width_res, height_res,
+                light_pos_x, light_pos_y, light_pos_z, light_intensity_I0,
+                circle_center_x, circle_center_y, circle_radius,
+                band_rows=band_rows, dtype=dtype, out=out, stats=stats):
+            pass
+        return stats.result()
+
+    def summarize_illumination(self, illumination_map, x_min, y_min, x_max, y_max, band_rows=None):
+        """
+        Статистика готовой карты освещенности (в том числе np.memmap) по полосам строк,
+        без копий значений в круге.
+        """
+        height_res, width_res = illumination_map.shape
+        if band_rows is None:
+            band_rows = max(1, self.STREAM_BAND_ELEMENTS // width_res)
+        stats = IlluminationStatsAccumulator.for_grid(x_min, y_min, x_max, y_max, width_res, height_res)
+        for band in iter_row_bands(illumination_map, band_rows):
+            stats.update(band)
+        return stats.result()
+
+    def calculate_illumination_radial(self,
+                                      x_min, y_min, x_max, y_max,
+                                      width_res, height_res,
+                                      light_pos_x, light_pos_y, light_pos_z,
+                                      light_intensity_I0,
+                                      circle_center_x, circle_center_y, circle_radius,
+                                      rel_tol=RADIAL_REL_TOL, dtype=np.float64, out=None):
+        """
+        Быстрый расчет освещенности от одного источника по радиальной таблице.
+
+        E = I0 * zL / (s + zL^2)^(3/2) зависит только от квадрата расстояния s = rho^2 от
+        точки до проекции источника (xL, yL), поэтому E рассчитывается один раз в узлах
+        таблицы по s с шагом h = zL^2 * sqrt(32 * rel_tol / 15), а значения пикселей -
+        линейной интерполяцией по s (корень на пиксель не нужен). Погрешность линейной
+        интерполяции не больше h^2/8 * max|E''|, а E''/E = 15 / (4 (s + zL^2)^2) <= 15 / (4 zL^4),
+        поэтому относительная погрешность каждого пикселя не больше
+            h^2 * 15 / (32 zL^4) * (1 + h / zL^2)^(3/2) = rel_tol * (1 + h / zL^2)^(3/2)
+        (множитель учитывает убывание E внутри шага; при rel_tol = 1e-6 он меньше 1.003).
+        Если таблица получается больше RADIAL_MAX_TABLE_SIZE узлов (zL мало по сравнению
+        с областью), выполняется точный расчет calculate_illumination.
+
+        Рассчитываются только строки и столбцы, пересекающие круг. Если строки и (или)
+        столбцы этой области симметричны относительно проекции источника (например,
+        источник над центром круга), таблица интерполируется для одной четверти (или
+        половины), остальные значения заполняются зеркальным отражением.
+        Параметры и результат - как у calculate_illumination; маска круга строится так же
+        по всей области после отражения (пиксели на самой окружности не зависят от того,
+        в какой половине они лежат).
+        """
+        dtype = self._check_output_buffer(out, (height_res, width_res), dtype)
+        if not 0 < rel_tol < 1:
+            raise ValueError("Допустимая погрешность (rel_tol) должна быть в диапазоне (0, 1).")
 
-        dx_m = X_grid_m - light_pos_x_m
-        dy_m = Y_grid_m - light_pos_y_m
-        dz_sq_m = light_pos_z_m ** 2  # dz - это zL
+        light_pos_x_m, light_pos_y_m, light_pos_z_m = \
+            light_pos_x / 1000, light_pos_y / 1000, light_pos_z / 1000
+        circle_center_x_m, circle_center_y_m = circle_center_x / 1000, circle_center_y / 1000
+        circle_radius_m = circle_radius / 1000
+        if light_pos_z_m <= 0:
+            raise ValueError("Координата Z источника света (zL) должна быть строго больше нуля.")
 
-        # Расстояние от источника до каждой точки на плоскости (в метрах)
-        r_squared_m = dx_m ** 2 + dy_m ** 2 + dz_sq_m
-        r_m = np.sqrt(r_squared_m)
+        if out is None:
+            illumination_map = np.zeros((height_res, width_res), dtype=dtype)
+        else:
+            illumination_map = out
+            illumination_map[...] = 0
+
+        x_coords_m = np.linspace(x_min / 1000, x_max / 1000, width_res)
+        y_coords_m = np.linspace(y_min / 1000, y_max / 1000, height_res)
+        bounds = self._circle_bounds(x_coords_m, y_coords_m, circle_center_x_m, circle_center_y_m,
+                                     circle_radius_m ** 2)
+        if bounds is None:
+            return illumination_map
+        row_start, row_stop, col_start, col_stop = bounds
+
+        dx_sq_m = np.square(x_coords_m[col_start:col_stop] - light_pos_x_m)
+        dy_sq_m = np.square(y_coords_m[row_start:row_stop] - light_pos_y_m)
+
+        # Таблица E по s на отрезке [0, max s] области круга (+ узел для интерполяции)
+        step = light_pos_z_m ** 2 * np.sqrt(32 * rel_tol / 15)
+        table_size = int((dx_sq_m.max() + dy_sq_m.max()) / step) + 2
+        if table_size > self.RADIAL_MAX_TABLE_SIZE:
+            return self.calculate_illumination(
+                x_min, y_min, x_max, y_max, width_res, height_res,
+                light_pos_x, light_pos_y, light_pos_z, light_intensity_I0,
+                circle_center_x, circle_center_y, circle_radius,
+                dtype=dtype, out=out
+            )
+        table_s = np.arange(table_size + 1) * step
+        table_values = (light_intensity_I0 * light_pos_z_m) / (table_s + light_pos_z_m ** 2) ** 1.5
+        table_slopes = np.diff(table_values)
+
+        # Зеркальная симметрия: интерполируется только первая половина строк и/или столбцов.
+        # Отражаются только значения E; маска круга строится потом по всей области
+        num_rows, num_cols = row_stop - row_start, col_stop - col_start
+        rows_symmetric = self._is_mirror_symmetric(dy_sq_m)
+        cols_symmetric = self._is_mirror_symmetric(dx_sq_m)
+        eval_rows = -(-num_rows // 2) if rows_symmetric else num_rows
+        eval_cols = -(-num_cols // 2) if cols_symmetric else num_cols
+
+        block = illumination_map[row_start:row_start + eval_rows, col_start:col_start + eval_cols]
+        scaled_dx_sq = dx_sq_m[:eval_cols] / step
+        scaled_dy_sq = dy_sq_m[:eval_rows] / step
+        band_rows = max(1, self.MASK_CHUNK_ELEMENTS // eval_cols)
+        for band_start in range(0, eval_rows, band_rows):
+            band_stop = min(band_start + band_rows, eval_rows)
+            # Положение s в таблице: целая часть - узел, дробная - вес интерполяции
+            position = np.add(scaled_dy_sq[band_start:band_stop, np.newaxis], scaled_dx_sq[np.newaxis, :])
+            node = position.astype(np.intp)
+            position -= node
+            position *= table_slopes.take(node)
+            position += table_values.take(node)
+            block[band_start:band_stop] = position
+
+        circle_block = illumination_map[row_start:row_stop, col_start:col_stop]
+        if eval_cols < num_cols:
+            circle_block[:eval_rows, eval_cols:] = circle_block[:eval_rows, :num_cols - eval_cols][:, ::-1]
+        if eval_rows < num_rows:
+            circle_block[eval_rows:] = circle_block[:num_rows - eval_rows][::-1]
+
+        self._apply_circle_mask(circle_block, x_coords_m[col_start:col_stop], y_coords_m[row_start:row_stop],
+                                circle_center_x_m, circle_center_y_m, circle_radius_m)
+        return illumination_map
 
-        # Расчет освещенности E = I0 * zL / r^3 (все в метрах, результат Вт/м^2)
-        # Избегаем деления на ноль, так как r > 0 (так как zL > 0)
-        illumination_map = (light_intensity_I0 * light_pos_z_m) / (r_m ** 3)
+    @staticmethod
+    def _check_output_buffer(out, shape, dtype):
+        """
+        Проверяет тип результата (np.float32 или np.float64) и, если задан, массив out
+        нужной формы и типа. Возвращает тип результата как np.dtype.
+        """
+        dtype = np.dtype(dtype)
+        if dtype not in (np.float32, np.float64):
+            raise ValueError("Тип результата (dtype) должен быть np.float32 или np.float64.")
+        if out is not None and (out.shape != shape or out.dtype != dtype):
+            raise ValueError(f"Массив out должен иметь форму {shape} и тип {dtype}.")
+        return dtype
+
+    @staticmethod
+    def _is_mirror_symmetric(squared_offsets):
+        """Квадраты смещений симметричны (с точностью округления координат linspace)."""
+        return bool(len(squared_offsets) > 1 and np.allclose(
+            squared_offsets, squared_offsets[::-1], rtol=1e-9, atol=1e-12 * squared_offsets.max()))
+
+    @staticmethod
+    def _circle_bounds(x_coords_m, y_coords_m, circle_center_x_m, circle_center_y_m, radius_sq_m):
+        """
+        Строки и столбцы, пересекающие круг (row_start, row_stop, col_start, col_stop),
+        или None. Координаты упорядочены, поэтому это отрезки.
+        """
+        inside_cols = np.flatnonzero(np.square(x_coords_m - circle_center_x_m) <= radius_sq_m)
+        inside_rows = np.flatnonzero(np.square(y_coords_m - circle_center_y_m) <= radius_sq_m)
+        if len(inside_cols) == 0 or len(inside_rows) == 0:
+            return None
+        return inside_rows[0], inside_rows[-1] + 1, inside_cols[0], inside_cols[-1] + 1
+
+    def _apply_circle_mask(self, illumination_map, x_coords_m, y_coords_m,
+                           circle_center_x_m, circle_center_y_m, circle_radius_m):
+        """
+        Обнуляет точки вне круга. Расстояния считаются в float64 (как у расчета по сеткам)
+        полосами строк; строки, целиком лежащие вне круга, обнуляются без сравнения.
+        """
+        dist_x_sq_m = np.square(x_coords_m - circle_center_x_m)
+        dist_y_sq_m = np.square(y_coords_m - circle_center_y_m)
+        radius_sq_m = circle_radius_m ** 2
+        chunk_rows = max(1, self.MASK_CHUNK_ELEMENTS // max(1, len(x_coords_m)))
+
+        for row_start in range(0, len(y_coords_m), chunk_rows):
+            row_stop = min(row_start + chunk_rows, len(y_coords_m))
+            band = illumination_map[row_start:row_stop]
+            band_dist_y_sq_m = dist_y_sq_m[row_start:row_stop]
+            # dx^2 >= 0, поэтому при dy^2 > R^2 вся строка вне круга
+            if np.all(band_dist_y_sq_m > radius_sq_m):
+                band[...] = 0
+                continue
+            outside = (band_dist_y_sq_m[:, np.newaxis] + dist_x_sq_m[np.newaxis, :]) > radius_sq_m
+            band[outside] = 0
+
+    def calculate_illumination_multi(self,
+                                     x_min, y_min, x_max, y_max,
+                                     width_res, height_res,
+                                     light_sources,
+                                     circle_center_x, circle_center_y, circle_radius,
+                                     dtype=np.float64, out=None,
+                                     memory_budget_bytes=None, max_workers=None):
+        """
+        Освещенность от многих точечных источников: сумма E_i = I0_i * zL_i / r_i^3.
 
-        # Применение круговой маски (координаты круга тоже в метрах)
-        dist_to_center_squared_m = (X_grid_m - circle_center_x_m) ** 2 + \
-                                   (Y_grid_m - circle_center_y_m) ** 2
+        Параметры:
+        ----------
+        light_sources : array_like
+            Таблица (N, 4) [xL, yL, zL, I0]: координаты в миллиметрах, сила излучения в Вт/ср.
+        memory_budget_bytes : int, optional
+            Бюджет памяти на временные массивы всех потоков
+            (по умолчанию MULTI_SOURCE_MEMORY_BUDGET_BYTES).
+        max_workers : int, optional
+            Число потоков (по умолчанию os.cpu_count()); NumPy отпускает GIL на время
+            операций с массивами, поэтому полосы считаются параллельно.
+        Остальные параметры - как у calculate_illumination.
+
+        Кадр делится на полосы строк, каждая полоса обрабатывается одним потоком порциями
+        источников (массив порция x строки полосы x столбцы укладывается в бюджет).
+        Считаются только строки и столбцы, пересекающие круг. При одном источнике
+        результат совпадает с calculate_illumination.
+        """
+        dtype = self._check_output_buffer(out, (height_res, width_res), dtype)
 
-        illumination_map[dist_to_center_squared_m > circle_radius_m ** 2] = 0
+        # Таблица источников в метрах: x, y, z и I0
+        sources_m = np.array(light_sources, dtype=np.float64).reshape(-1, 4)
+        sources_m[:, :3] /= 1000
+        if np.any(sources_m[:, 2] <= 0):
+            raise ValueError("Координата Z каждого источника света (zL) должна быть строго больше нуля.")
+
+        if out is None:
+            illumination_map = np.zeros((height_res, width_res), dtype=dtype)
+        else:
+            illumination_map = out
+            illumination_map[...] = 0
+
+        x_coords_m = np.linspace(x_min / 1000, x_max / 1000, width_res)
+        y_coords_m = np.linspace(y_min / 1000, y_max / 1000, height_res)
+        circle_center_x_m, circle_center_y_m = circle_center_x / 1000, circle_center_y / 1000
+        radius_sq_m = (circle_radius / 1000) ** 2
+
+        bounds = self._circle_bounds(x_coords_m, y_coords_m, circle_center_x_m, circle_center_y_m, radius_sq_m)
+        if len(sources_m) == 0 or bounds is None:
+            return illumination_map
+        row_start, row_stop, col_start, col_stop = bounds
+
+        if memory_budget_bytes is None:
+            memory_budget_bytes = self.MULTI_SOURCE_MEMORY_BUDGET_BYTES
+        if max_workers is None:
+            max_workers = os.cpu_count() or 1
+        num_cols, num_rows, num_sources = col_stop - col_start, row_stop - row_start, len(sources_m)
+        # Элементов временного массива на поток; полосы не выше доли кадра на поток
+        worker_elements = max(1, memory_budget_bytes // (dtype.itemsize * max_workers))
+        band_rows = int(np.clip(worker_elements // (num_sources * num_cols),
+                                1, -(-num_rows // (max_workers * self.BANDS_PER_WORKER))))
+        source_chunk = int(np.clip(worker_elements // (band_rows * num_cols), 1, num_sources))
+
+        x_band_m = x_coords_m[col_start:col_stop]
+
+        def render_band(band_start):
+            band_stop = min(band_start + band_rows, row_stop)
+            band = illumination_map[band_start:band_stop, col_start:col_stop]
+            y_band_m = y_coords_m[band_start:band_stop]
+            for source_start in range(0, num_sources, source_chunk):
+                chunk = sources_m[source_start:source_start + source_chunk]
+                dx_sq_m = np.square(x_band_m[np.newaxis, :] - chunk[:, 0:1]).astype(dtype)
+                dy_sq_m = np.square(y_band_m[np.newaxis, :] - chunk[:, 1:2]).astype(dtype)
+                # (порция, строки, столбцы): r^2 -> r -> r^3 -> E на месте
+                values = np.add(dy_sq_m[:, :, np.newaxis], dx_sq_m[:, np.newaxis, :])
+                values += (chunk[:, 2] ** 2).astype(dtype)[:, np.newaxis, np.newaxis]
+                np.sqrt(values, out=values)
+                np.power(values, 3, out=values)
+                np.divide((chunk[:, 3] * chunk[:, 2]).astype(dtype)[:, np.newaxis, np.newaxis], values, out=values)
+                band += values.sum(axis=0)
+
+        band_starts = range(row_start, row_stop, band_rows)
+        if max_workers == 1:
+            for band_start in band_starts:
+                render_band(band_start)
+        else:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                # list() передает исключения потоков вызывающему
+                list(executor.map(render_band, band_starts))
 
+        self._apply_circle_mask(illumination_map, x_coords_m, y_coords_m,
+                                circle_center_x_m, circle_center_y_m, circle_radius / 1000)
         return illumination_map
 
     def normalize_illumination(self, illumination_map):
@@ -98,6 +520,23 @@ class IlluminationCalculator:
         normalized_map = (illumination_map / max_val) * 255
         return normalized_map.astype(np.uint8)
 
+    def tone_map_illumination(self, illumination_map, curve="linear", white_percentile=100.0, gamma=2.2,
+                              log_scale=100.0):
+        """
+        Тональная компрессия освещенности к диапазону 0-255 (см. tone_mapping.ToneMapper).
+
+        Параметры:
+        ----------
+        curve : str
+            Кривая: 'linear', 'gamma' или 'log'.
+        white_percentile : float
+            Процентиль освещенности внутри круга, принимаемый за 255.
+
+        При значениях по умолчанию совпадает с normalize_illumination.
+        """
+        tone_mapper = ToneMapper(curve, white_percentile, gamma=gamma, log_scale=log_scale)
+        return tone_mapper.tone_map(illumination_map)
+
     def get_cross_section(self, image_array, Wres, Hres, axis='horizontal'):
         """
         Извлекает горизонтальное или вертикальное сечение через центр изображения.
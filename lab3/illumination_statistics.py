@@ -0,0 +1,134 @@
+"""
+Точная статистика освещенности круга на плоскости Z=0 от точечного источника,
+не зависящая от сетки расчета.
+
+Освещенность E = I0 * zL / (rho^2 + zL^2)^(3/2) убывает с расстоянием rho от проекции
+источника (xL, yL), поэтому на круге радиуса R с расстоянием d от проекции до центра:
+    максимум - при rho = max(0, d - R) (проекция источника или ближайшая точка круга),
+    минимум - при rho = d + R (самая дальняя точка окружности).
+Поток на круг Ф = I0 * Omega, где Omega - телесный угол, под которым круг виден из
+источника (E dA = I0 dOmega). Omega считается одномерной квадратурой по углу вокруг
+проекции: внутренний интеграл по rho берется аналитически,
+    int E rho drho = I0 * zL * (1 / sqrt(rho1^2 + zL^2) - 1 / sqrt(rho2^2 + zL^2)),
+а по углу подынтегральная функция гладкая и периодическая, поэтому формула трапеций
+сходится экспоненциально (шаг уменьшается вдвое до достижения rel_tol).
+Средняя освещенность - Ф / (pi R^2).
+"""
+import numpy as np
+
+# Начальное и наибольшее число узлов квадратуры
+INITIAL_NODES = 64
+MAX_NODES = 1 << 16
+
+
+def _trapezoid_periodic(integrand, rel_tol):
+    """
+    Среднее периодической функции integrand(theta) на [0, 2pi) формулой трапеций
+    с удвоением числа узлов, пока два последних значения не совпадут с точностью rel_tol.
+    """
+    num_nodes = INITIAL_NODES
+    previous = np.mean(integrand(np.arange(num_nodes) * (2 * np.pi / num_nodes)))
+    while num_nodes < MAX_NODES:
+        # Новые узлы - середины старых интервалов, старые значения используются повторно
+        midpoints = (np.arange(num_nodes) + 0.5) * (2 * np.pi / num_nodes)
+        current = 0.5 * (previous + np.mean(integrand(midpoints)))
+        num_nodes *= 2
+        if abs(current - previous) <= rel_tol * abs(current):
+            return current
+        previous = current
+    return previous
+
+
+def disk_solid_angle(distance_m, radius_m, height_m, rel_tol=1e-12):
+    """
+    Телесный угол круга радиуса radius_m, видимого из точки на высоте height_m над
+    плоскостью круга; distance_m - расстояние от проекции точки до центра круга.
+    """
+    d, R, z = float(distance_m), float(radius_m), float(height_m)
+    if R <= 0:
+        return 0.0
+    if d < R:
+        # Проекция внутри круга: по каждому направлению phi от rho = 0 до границы
+        # rho2(phi) = d cos(phi) + sqrt(R^2 - d^2 sin^2(phi))
+        def integrand(phi):
+            rho2 = d * np.cos(phi) + np.sqrt(R * R - (d * np.sin(phi)) ** 2)
+            return 1.0 - z / np.sqrt(rho2 * rho2 + z * z)
+
+        return 2 * np.pi * _trapezoid_periodic(integrand, rel_tol)
+
+    # Проекция вне круга (или на окружности): направления |phi| <= phi_max = arcsin(R/d),
+    # хорда от rho1 до rho2. Замена sin(phi) = (R/d) sin(theta) убирает корневую
+    # особенность на краях: sqrt(R^2 - d^2 sin^2(phi)) = R cos(theta). Подынтегральная
+    # функция не меняется при theta -> pi - theta, поэтому интеграл по [-pi/2, pi/2]
+    # равен половине интеграла по периоду.
+    k = R / d
+
+    def integrand(theta):
+        sin_theta, cos_theta = np.sin(theta), np.cos(theta)
+        cos_phi = np.sqrt(1.0 - (k * sin_theta) ** 2)
+        rho1 = d * cos_phi - R * cos_theta
+        rho2 = d * cos_phi + R * cos_theta
+        radial = z / np.sqrt(rho1 * rho1 + z * z) - z / np.sqrt(rho2 * rho2 + z * z)
+        # dphi = k cos(theta) / cos(phi) dtheta; при d = R отношение cos(theta) / cos(phi) = 1
+        jacobian = np.divide(k * cos_theta, cos_phi, out=np.full_like(theta, k), where=cos_phi > 0)
+        return radial * jacobian
+
+    return np.pi * _trapezoid_periodic(integrand, rel_tol)
+
+
+def disk_illumination_statistics(light_pos_x, light_pos_y, light_pos_z,
+                                 light_intensity_I0,
+                                 circle_center_x, circle_center_y, circle_radius,
+                                 rel_tol=1e-12):
+    """
+    Точные максимум, минимум, среднее освещенности в круге и поток на круг.
+
+    Координаты - в миллиметрах, I0 - в Вт/ср (как у IlluminationCalculator).
+    Возвращает словарь с ключами 'max', 'min', 'mean' (Вт/м^2), 'flux_W' (Вт),
+    'solid_angle_sr', 'max_point_mm' и 'min_point_mm' (точки экстремумов на плоскости).
+    """
+    light_pos_z_m = light_pos_z / 1000
+    if light_pos_z_m <= 0:
+        raise ValueError("Координата Z источника света (zL) должна быть строго больше нуля.")
+    if circle_radius <= 0:
+        raise ValueError("Радиус круга должен быть положительным.")
+    radius_m = circle_radius / 1000
+
+    # Направление от проекции источника к центру круга (любое, если они совпадают)
+    offset_mm = np.array([circle_center_x - light_pos_x, circle_center_y - light_pos_y], dtype=np.float64)
+    distance_mm = float(np.hypot(*offset_mm))
+    direction = offset_mm / distance_mm if distance_mm > 0 else np.array([1.0, 0.0])
+    distance_m = distance_mm / 1000
+
+    def illumination(rho_m):
+        return light_intensity_I0 * light_pos_z_m / (rho_m ** 2 + light_pos_z_m ** 2) ** 1.5
+
+    light_foot_mm = np.array([light_pos_x, light_pos_y], dtype=np.float64)
+    nearest_rho_mm = max(0.0, distance_mm - circle_radius)
+    farthest_rho_mm = distance_mm + circle_radius
+
+    solid_angle = disk_solid_angle(distance_m, radius_m, light_pos_z_m, rel_tol)
+    flux = light_intensity_I0 * solid_angle
+    return {
+        "max": illumination(nearest_rho_mm / 1000),
+        "min": illumination(farthest_rho_mm / 1000),
+        "mean": float(flux / (np.pi * radius_m ** 2)),
+        "flux_W": float(flux),
+        "solid_angle_sr": float(solid_angle),
+        "max_point_mm": light_foot_mm + nearest_rho_mm * direction,
+        "min_point_mm": light_foot_mm + farthest_rho_mm * direction,
+    }
+
+
+def compare_with_grid(exact_stats, grid_stats):
+    """
+    Сравнение статистики по сетке (IlluminationCalculator.summarize_illumination и т.п.)
+    с точной: {величина: (по сетке, точно, относительное отклонение)} для max, min, mean, flux_W.
+    Если круг выходит за область расчета, значения сетки относятся только к его видимой части.
+    """
+    comparison = {}
+    for name in ("max", "min", "mean", "flux_W"):
+        grid_value, exact_value = float(grid_stats[name]), float(exact_stats[name])
+        deviation = (grid_value - exact_value) / exact_value if exact_value != 0 else 0.0
+        comparison[name] = (grid_value, exact_value, deviation)
+    return comparison
@@ -0,0 +1,179 @@
+"""
+Потоковая тональная компрессия: перевод массивов яркости/освещенности в 8-битное
+изображение с отсечением по процентилям и гамма- или логарифмической кривой.
+
+Гистограмма строится за один проход по плиткам (полосам строк), поэтому массив может
+быть отображенным в память файлом больше оперативной памяти. Кривая применяется через
+заранее рассчитанную таблицу uint8, так что само отображение - это масштабирование,
+приведение к целым индексам и выборка из таблицы.
+
+Копия lab4/tone_mapping.py: изменения вносятся там и переносятся сюда
+(каждая лабораторная запускается отдельно; копии отличаются только этим абзацем).
+"""
+import numpy as np
+
+DEFAULT_BAND_ROWS = 256
+
+
+def iter_row_bands(values, band_rows=DEFAULT_BAND_ROWS):
+    """Полосы по band_rows строк двумерного массива (или np.memmap) - представления, без копий."""
+    for row_start in range(0, values.shape[0], band_rows):
+        yield values[row_start:row_start + band_rows]
+
+
+class StreamingHistogram:
+    """
+    Гистограмма положительных значений с логарифмическими интервалами, накапливаемая по
+    частям. Номер интервала - старшие биты представления float32 (порядок и MANTISSA_BITS
+    старших битов мантиссы), то есть 2^MANTISSA_BITS интервалов на октаву по всему
+    диапазону float32. Логарифмы не вычисляются, диапазон данных знать не нужно;
+    относительная погрешность процентиля - не больше 2^-MANTISSA_BITS (около 1.6%).
+    Нули (и отрицательные значения) в процентили не входят.
+    """
+
+    MANTISSA_BITS = 6
+    # Сдвиг, оставляющий от 32 бит знак, 8 бит порядка и MANTISSA_BITS бит мантиссы
+    _SHIFT = 23 - MANTISSA_BITS
+    # Интервалы положительных значений; старшие номера - числа со знаковым битом
+    _POSITIVE_BINS = 1 << (8 + MANTISSA_BITS)
+
+    def __init__(self):
+        self.counts = np.zeros(self._POSITIVE_BINS, dtype=np.int64)
+        self.nonpositive_count = 0
+        self.max_value = None
+
+    @property
+    def positive_count(self):
+        return int(self.counts[1:].sum())
+
+    def update(self, values):
+        """Добавляет в гистограмму значения очередной плитки."""
+        values = np.asarray(values)
+        if values.size == 0:
+            return
+        tile_max = values.max()
+        self.max_value = tile_max if self.max_value is None else max(self.max_value, tile_max)
+
+        bins = np.asarray(values, dtype=np.float32).view(np.uint32) >> self._SHIFT
+        counts = np.bincount(bins.ravel(), minlength=2 * self._POSITIVE_BINS)
+        # Интервал 0 - ноль (и денормализованные числа меньше 2^-126)
+        self.counts[1:] += counts[1:self._POSITIVE_BINS]
+        self.nonpositive_count += int(counts[0] + counts[self._POSITIVE_BINS:].sum())
+
+    def percentile(self, q):
+        """
+        Значение, не меньше которого q процентов положительных значений (верхняя граница
+        интервала гистограммы). q = 100 дает точный максимум. Без данных возвращает 0.
+        """
+        if not 0 <= q <= 100:
+            raise ValueError("Процентиль должен быть в диапазоне [0, 100].")
+        total = self.positive_count
+        if total == 0:
+            return 0.0
+        if q == 100:
+            return self.max_value
+        cumulative = np.cumsum(self.counts)
+        bin_index = int(np.searchsorted(cumulative, q / 100.0 * total, side="left"))
+        upper_edge = np.array([(bin_index + 1) << self._SHIFT], dtype=np.uint32).view(np.float32)[0]
+        return min(float(upper_edge), float(self.max_value))
+
+
+class ToneMapper:
+    """
+    Отображение значений в uint8 по кривой curve на отрезке [черная точка, белая точка].
+
+    curve : 'linear' - линейная; 'gamma' - t^(1/gamma); 'log' - log(1 + log_scale*t) / log(1 + log_scale).
+    white_percentile : процентиль положительных значений, принимаемый за белую точку
+        (100 - максимум; например, 99.5 не дает одиночному блику затемнить остальное).
+    black_percentile : процентиль черной точки; 0 - черная точка равна нулю.
+
+    Таблица содержит 255 * LUT_SUBDIVISION + 1 значений, поэтому при черной точке 0,
+    линейной кривой и white_percentile=100 результат совпадает с делением на максимум
+    с отбрасыванием дробной части (normalize_brightness_to_image / normalize_illumination).
+    """
+
+    CURVES = ("linear", "gamma", "log")
+    LUT_SUBDIVISION = 256
+
+    def __init__(self, curve="linear", white_percentile=100.0, black_percentile=0.0, gamma=2.2, log_scale=100.0):
+        if curve not in self.CURVES:
+            raise ValueError(f"Кривая тональной компрессии должна быть одной из: {', '.join(self.CURVES)}.")
+        if not 0 <= black_percentile < white_percentile <= 100:
+            raise ValueError("Процентили должны удовлетворять 0 <= черная точка < белая точка <= 100.")
+        if gamma <= 0:
+            raise ValueError("Показатель гаммы должен быть положительным.")
+        if log_scale <= 0:
+            raise ValueError("Масштаб логарифмической кривой должен быть положительным.")
+
+        self.curve = curve
+        self.white_percentile = white_percentile
+        self.black_percentile = black_percentile
+        self.gamma = gamma
+        self.log_scale = log_scale
+        self.black_point = None
+        self.white_point = None
+        self.histogram = None
+        self.lut = self._build_lut()
+
+    def _build_lut(self):
+        """Таблица uint8: индекс q соответствует доле t = q / (255 * LUT_SUBDIVISION) диапазона."""
+        levels = 255 * self.LUT_SUBDIVISION
+        if self.curve == "linear":
+            # Точное целочисленное деление: floor(q / LUT_SUBDIVISION) = floor(t * 255)
+            return (np.arange(levels + 1) // self.LUT_SUBDIVISION).astype(np.uint8)
+        t = np.arange(levels + 1, dtype=np.float64) / levels
+        if self.curve == "gamma":
+            mapped = t ** (1.0 / self.gamma)
+        else:
+            mapped = np.log1p(self.log_scale * t) / np.log1p(self.log_scale)
+        return np.floor(mapped * 255.0 + 1e-9).clip(0, 255).astype(np.uint8)
+
+    def fit(self, tiles):
+        """Строит гистограмму за один проход по плиткам и выбирает черную и белую точки."""
+        self.histogram = StreamingHistogram()
+        for tile in tiles:
+            self.histogram.update(tile)
+        black_point = self.histogram.percentile(self.black_percentile) if self.black_percentile > 0 else 0.0
+        self.set_range(black_point, self.histogram.percentile(self.white_percentile))
+        return self
+
+    def set_range(self, black_point, white_point):
+        """Задает черную и белую точки явно (например, общие для последовательности кадров)."""
+        if white_point < black_point:
+            raise ValueError("Белая точка не может быть меньше черной.")
+        self.black_point = black_point
+        self.white_point = white_point
+        return self
+
+    def apply(self, values):
+        """Переводит плитку значений в uint8 той же формы."""
+        if self.white_point is None:
+            raise ValueError("Сначала нужно вызвать fit или set_range.")
+        values = np.asarray(values)
+        if self.white_point == self.black_point:
+            return np.zeros(values.shape, dtype=np.uint8)
+        # Точки приводятся к типу массива, чтобы арифметика шла в его точности (float32 или float64)
+        scalar = values.dtype.type if values.dtype.kind == "f" else np.float64
+        black_point, white_point = scalar(self.black_point), scalar(self.white_point)
+        scaled = values - black_point if black_point != 0 else values.astype(scalar, copy=True)
+        scaled /= white_point - black_point
+        scaled *= 255
+        scaled *= self.LUT_SUBDIVISION
+        np.clip(scaled, 0, len(self.lut) - 1, out=scaled)
+        return self.lut.take(scaled.astype(np.uint16))
+
+    def iter_apply(self, tiles):
+        for tile in tiles:
+            yield self.apply(tile)
+
+    def tone_map(self, values, band_rows=DEFAULT_BAND_ROWS, out=None):
+        """
+        Полная обработка двумерного массива полосами строк: проход гистограммы и отображение.
+        out - необязательный массив uint8 той же формы (например, np.memmap) для результата.
+        """
+        self.fit(iter_row_bands(values, band_rows))
+        if out is None:
+            out = np.empty(values.shape, dtype=np.uint8)
+        for row_start in range(0, values.shape[0], band_rows):
+            out[row_start:row_start + band_rows] = self.apply(values[row_start:row_start + band_rows])
+        return out
@@ -0,0 +1,240 @@
+"""
+Замеры производительности SphereBrightnessCalculator.
+
+Режим run рассчитывает матрицу случаев (разрешение x число источников x доля экрана,
+занятая сферой) и для этапов calculate_brightness, normalize_brightness_to_image и
+get_sample_points_info записывает время (лучшее из repeat запусков), пикселей в секунду
+и пиковую память (tracemalloc, отдельным запуском) в файл истории JSON.
+Режим compare сравнивает последний запуск истории с эталоном и отмечает регрессии.
+
+Примеры:
+    python benchmark.py run --history bench.json --label "после правки"
+    python benchmark.py run --resolutions 64 4096 --lights 1 1000 --coverage 0.1 0.7
+    python benchmark.py compare bench_baseline.json bench.json --threshold 0.15
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from sphere_brightness_calculator import SphereBrightnessCalculator
+
+DEFAULT_RESOLUTIONS = (64, 256, 1024, 4096)
+DEFAULT_LIGHT_COUNTS = (1, 10, 100, 1000)
+DEFAULT_COVERAGES = (0.05, 0.3, 0.7)
+# Случаи, в которых (пиксели сферы x источники) больше этого числа, пропускаются
+DEFAULT_MAX_PAIR_EVALUATIONS = 2e9
+
+# Неизменная часть сцены: квадратный экран, наблюдатель на оси Z
+SCREEN_SIDE_MM = 1000.0
+OBSERVER_POS_MM = np.array([0.0, 0.0, -1500.0])
+SPHERE_CENTER_MM = np.array([0.0, 0.0, 300.0])
+SHADING_PARAMS = (0.35, 1.0, 0.9, 180.0)
+
+def sphere_radius_for_coverage(coverage):
+    """
+    Радиус сферы, проекция которой на плоскость экрана (через центр сферы) занимает
+    долю coverage площади экрана. Проекция - круг радиуса r = R * D / sqrt(D^2 - R^2),
+    где D - расстояние от наблюдателя до центра, отсюда R = r * D / sqrt(D^2 + r^2).
+    """
+    projected_radius = SCREEN_SIDE_MM * np.sqrt(coverage / np.pi)
+    distance = np.linalg.norm(SPHERE_CENTER_MM - OBSERVER_POS_MM)
+    return float(projected_radius * distance / np.hypot(distance, projected_radius))
+
+
+def make_lights(num_lights, seed=0):
+    """Воспроизводимый набор источников [xL, yL, zL, I0] перед сферой."""
+    rng = np.random.default_rng(seed)
+    positions = rng.uniform([-2000.0, -2000.0, -1500.0], [2000.0, 2000.0, 0.0], size=(num_lights, 3))
+    intensities = rng.uniform(1000.0, 6000.0, size=(num_lights, 1)) / num_lights
+    return list(np.hstack([positions, intensities]))
+
+
+def case_key(case):
+    return f"{case['resolution']}px_{case['lights']}l_{case['coverage']:g}cov"
+
+
+def _scene_args(case):
+    return (
+        SCREEN_SIDE_MM, SCREEN_SIDE_MM,
+        case["resolution"], case["resolution"],
+        OBSERVER_POS_MM,
+        SPHERE_CENTER_MM, sphere_radius_for_coverage(case["coverage"]),
+        make_lights(case["lights"]),
+        *SHADING_PARAMS,
+    )
+
+
+def _stage_calls(case):
+    """Функции этапов случая; calculate_brightness выполняется новым калькулятором (без G-буфера)."""
+    scene_args = _scene_args(case)
+    calculator = SphereBrightnessCalculator()
+    brightness_buffer = calculator.calculate_brightness(*scene_args)
+    return {
+        "calculate_brightness": lambda: SphereBrightnessCalculator().calculate_brightness(*scene_args),
+        "normalize_brightness_to_image": lambda: calculator.normalize_brightness_to_image(brightness_buffer),
+        "get_sample_points_info": lambda: calculator.get_sample_points_info(
+            brightness_buffer, *scene_args, num_points=5, seed=0),
+    }
+
+
+def _peak_memory(function):
+    tracemalloc.start()
+    try:
+        function()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return peak
+
+
+def run_case(case, repeat=3):
+    """Замеряет все этапы одного случая и возвращает запись результатов."""
+    pixels = case["resolution"] * case["resolution"]
+    result = {"case": dict(case), "key": case_key(case), "stages": {}}
+    for stage, function in _stage_calls(case).items():
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            function()
+            timings.append(time.perf_counter() - start)
+        seconds = min(timings)
+        result["stages"][stage] = {
+            "seconds": seconds,
+            "pixels_per_second": pixels / seconds if seconds > 0 else None,
+            "peak_bytes": _peak_memory(function),
+        }
+    return result
+
+
+def build_cases(resolutions, light_counts, coverages, max_pair_evaluations):
+    """Матрица случаев; слишком тяжелые (по оценке пиксели сферы x источники) пропускаются."""
+    cases, skipped = [], []
+    for resolution in resolutions:
+        for num_lights in light_counts:
+            for coverage in coverages:
+                case = {"resolution": int(resolution), "lights": int(num_lights), "coverage": float(coverage)}
+                pair_evaluations = resolution * resolution * min(coverage, 1.0) * num_lights
+                (skipped if pair_evaluations > max_pair_evaluations else cases).append(case)
+    return cases, skipped
+
+
+def load_history(file_path):
+    if not os.path.exists(file_path):
+        return {"runs": []}
+    with open(file_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def run_benchmarks(args):
+    cases, skipped = build_cases(args.resolutions, args.lights, args.coverage, args.max_pair_evaluations)
+    results = []
+    for case in cases:
+        result = run_case(case, args.repeat)
+        results.append(result)
+        timing = result["stages"]["calculate_brightness"]
+        print(f"{result['key']:>24}: {timing['seconds']:.4f} с, "
+              f"{timing['pixels_per_second'] / 1e6:.2f} Мпикс/с, "
+              f"пик {timing['peak_bytes'] / 2 ** 20:.1f} МиБ")
+    for case in skipped:
+        print(f"{case_key(case):>24}: пропущен (больше {args.max_pair_evaluations:g} пар точка-источник)")
+
+    history = load_history(args.history)
+    history["runs"].append({
+        "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        "label": args.label,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "repeat": args.repeat,
+        "results": results,
+        "skipped": [case_key(case) for case in skipped],
+    })
+    with open(args.history, "w", encoding="utf-8") as f:
+        json.dump(history, f, ensure_ascii=False, indent=2)
+    print(f"Результаты добавлены в {args.history}")
+    return 0
+
+
+def compare_runs(baseline_run, current_run, time_threshold, memory_threshold, min_time_delta=0.0):
+    """
+    Сравнивает два запуска по общим случаям и этапам. Возвращает список строк
+    (ключ случая, этап, отношение времени, отношение памяти, регрессия).
+    Рост времени меньше min_time_delta секунд регрессией не считается (шум коротких замеров).
+    """
+    baseline = {result["key"]: result for result in baseline_run["results"]}
+    rows = []
+    for result in current_run["results"]:
+        if result["key"] not in baseline:
+            continue
+        for stage, current in result["stages"].items():
+            reference = baseline[result["key"]]["stages"].get(stage)
+            if reference is None:
+                continue
+            time_ratio = current["seconds"] / reference["seconds"] if reference["seconds"] > 0 else 1.0
+            memory_ratio = current["peak_bytes"] / reference["peak_bytes"] if reference["peak_bytes"] > 0 else 1.0
+            slower = (time_ratio > 1.0 + time_threshold
+                      and current["seconds"] - reference["seconds"] > min_time_delta)
+            regression = slower or memory_ratio > 1.0 + memory_threshold
+            rows.append((result["key"], stage, time_ratio, memory_ratio, regression))
+    return rows
+
+
+def compare_benchmarks(args):
+    baseline_runs = load_history(args.baseline)["runs"]
+    current_runs = load_history(args.current)["runs"]
+    if not baseline_runs or not current_runs:
+        print("Ошибка: в файлах истории нет запусков для сравнения.", file=sys.stderr)
+        return 2
+
+    rows = compare_runs(baseline_runs[-1], current_runs[-1], args.threshold, args.memory_threshold,
+                        args.min_time_delta)
+    if not rows:
+        print("Ошибка: у запусков нет общих случаев.", file=sys.stderr)
+        return 2
+    for key, stage, time_ratio, memory_ratio, regression in rows:
+        mark = "РЕГРЕССИЯ" if regression else ""
+        print(f"{key:>24} {stage:>30}: время x{time_ratio:.2f}, память x{memory_ratio:.2f} {mark}")
+    regressions = sum(row[4] for row in rows)
+    print(f"Регрессий: {regressions} из {len(rows)}")
+    return 1 if regressions else 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Замеры производительности расчета яркости сферы.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Выполнить замеры и добавить их в историю")
+    run_parser.add_argument("--resolutions", type=int, nargs="+", default=list(DEFAULT_RESOLUTIONS))
+    run_parser.add_argument("--lights", type=int, nargs="+", default=list(DEFAULT_LIGHT_COUNTS))
+    run_parser.add_argument("--coverage", type=float, nargs="+", default=list(DEFAULT_COVERAGES),
+                            help="Доли площади экрана, занятые проекцией сферы")
+    run_parser.add_argument("--repeat", type=int, default=3, help="Число запусков (берется лучшее время)")
+    run_parser.add_argument("--max-pair-evaluations", type=float, default=DEFAULT_MAX_PAIR_EVALUATIONS)
+    run_parser.add_argument("--history", default="benchmark_history.json", help="Файл истории JSON")
+    run_parser.add_argument("--label", default="", help="Метка запуска")
+
+    compare_parser = subparsers.add_parser("compare", help="Сравнить последний запуск с эталоном")
+    compare_parser.add_argument("baseline", help="Файл истории с эталонным запуском (берется последний)")
+    compare_parser.add_argument("current", help="Файл истории с проверяемым запуском (берется последний)")
+    compare_parser.add_argument("--threshold", type=float, default=0.1,
+                                help="Допустимый относительный рост времени")
+    compare_parser.add_argument("--memory-threshold", type=float, default=0.1,
+                                help="Допустимый относительный рост пиковой памяти")
+    compare_parser.add_argument("--min-time-delta", type=float, default=0.002,
+                                help="Минимальный рост времени (с), считающийся регрессией")
+
+    args = parser.parse_args(argv)
+    if args.command == "run":
+        return run_benchmarks(args)
+    return compare_benchmarks(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
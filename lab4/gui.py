@@ -1,16 +1,20 @@
 import sys
+import threading
 from PyQt6.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
-    QTabWidget, QGroupBox, QFormLayout, QLabel, QLineEdit,
-    QPushButton, QMessageBox, QTextEdit, QFileDialog, QSizePolicy, QScrollArea
+    QTabWidget, QGroupBox, QFormLayout, QLineEdit,
+    QPushButton, QMessageBox, QTextEdit, QFileDialog, QScrollArea, QCheckBox,
+    QProgressBar, QComboBox
 )
-from PyQt6.QtGui import QPixmap, QImage
-from PyQt6.QtCore import Qt, QSize
 import numpy as np
 from PIL import Image
 
 # !!! Убедитесь, что sphere_brightness_calculator.py находится в том же каталоге
 from sphere_brightness_calculator import SphereBrightnessCalculator
+from image_viewer import PyramidImageView
+from profiling import StageTimer, timed_stage
+from render_cache import RenderCache
+from render_worker import RenderJob
 
 
 class SphereBrightnessApp(QMainWindow):
@@ -19,9 +23,27 @@ class SphereBrightnessApp(QMainWindow):
         self.setWindowTitle("Расчет Яркости на Сфере (Блинн-Фонг)")
         self.setGeometry(100, 100, 900, 800)
 
-        self.calculator = SphereBrightnessCalculator()
+        # Готовые кадры сохраняются в кэше расчетов на диске и находятся и после перезапуска
+        try:
+            render_cache = RenderCache(cache_dir=RenderCache.default_cache_dir())
+        except OSError:
+            render_cache = RenderCache()
+        # Общий таймер этапов расчета и отображения (включается на вкладке результатов)
+        self.timer = StageTimer()
+        self.calculator = SphereBrightnessCalculator(render_cache=render_cache, timer=self.timer)
         self.raw_brightness_data = None
+        # Маска пикселей, в которых луч попал в сферу (для статистики по сфере)
+        self.raw_hit_mask = None
         self.normalized_brightness_image = None
+        self.last_render_stats = {}
+
+        # Расчет выполняется в отдельном потоке (RenderJob); текущее задание - render_job,
+        # отмененные, но еще не завершившиеся задания хранятся до окончания их потоков
+        self.render_lock = threading.Lock()
+        self.render_job = None
+        self.render_params = None
+        self.tone_params = None
+        self._render_jobs = set()
 
         self._create_widgets()
 
@@ -132,6 +154,30 @@ class SphereBrightnessApp(QMainWindow):
         bp_form_layout.addRow("Блеск (n):", self.entry_shininess)
         layout.addWidget(blinn_phong_group)
 
+        # Секция "Сглаживание" - адаптивное, только по краям и резким перепадам яркости
+        aa_group = QGroupBox("Адаптивное Сглаживание (AA)")
+        aa_form_layout = QFormLayout(aa_group)
+        self.check_aa = QCheckBox("Уточнять силуэт и резкие перепады яркости")
+        self.check_aa.setChecked(True)
+        self.entry_aa_samples = QLineEdit("4")  # Сетка подвыборок 4x4 на уточняемый пиксель
+        aa_form_layout.addRow(self.check_aa)
+        aa_form_layout.addRow("Подвыборок по стороне:", self.entry_aa_samples)
+        layout.addWidget(aa_group)
+
+        # Секция "Тональная Компрессия" - перевод яркости в 0-255 для изображения
+        tone_group = QGroupBox("Тональная Компрессия Изображения")
+        tone_form_layout = QFormLayout(tone_group)
+        self.combo_tone_curve = QComboBox()
+        self.combo_tone_curve.addItem("Линейная", "linear")
+        self.combo_tone_curve.addItem("Гамма", "gamma")
+        self.combo_tone_curve.addItem("Логарифмическая", "log")
+        self.entry_white_percentile = QLineEdit("100")  # 100 - деление на максимум
+        self.entry_tone_gamma = QLineEdit("2.2")
+        tone_form_layout.addRow("Кривая:", self.combo_tone_curve)
+        tone_form_layout.addRow("Белая точка (процентиль):", self.entry_white_percentile)
+        tone_form_layout.addRow("Гамма:", self.entry_tone_gamma)
+        layout.addWidget(tone_group)
+
         calc_button = QPushButton("Рассчитать и Визуализировать")
         calc_button.clicked.connect(self._calculate_and_visualize)
         layout.addWidget(calc_button)
@@ -151,21 +197,25 @@ class SphereBrightnessApp(QMainWindow):
         image_group = QGroupBox("Визуализация Яркости Сферы (2D)")
         image_layout = QVBoxLayout(image_group)
 
-        # Создаем контейнер для изображения, который будет управлять его пропорциями
-        self.image_container_widget = QWidget()
-        self.image_container_layout = QHBoxLayout(self.image_container_widget)
-        self.image_container_layout.addStretch(1) # Растяжка слева
-        self.image_label = QLabel("Изображение сферы будет здесь")
-        self.image_label.setAlignment(Qt.AlignmentFlag.AlignCenter)
-        self.image_label.setScaledContents(True)
-        # Установим политику размера, чтобы QLabel мог растягиваться, но только до определенного
-        # максимального размера и с учетом его встроенной логики масштабирования.
-        # Фактическое масштабирование будет происходить через QPixmap.scaled()
-        self.image_label.setSizePolicy(QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Expanding)
-        self.image_label.setMinimumSize(100, 100) # Минимальный размер для отображения
-        self.image_container_layout.addWidget(self.image_label)
-        self.image_container_layout.addStretch(1) # Растяжка справа
-        image_layout.addWidget(self.image_container_widget)
+        # Просмотр с пирамидой уменьшенных копий: колесо мыши - масштаб, перетаскивание -
+        # перемещение, двойной щелчок - вписать в окно
+        self.image_view = PyramidImageView("Изображение сферы будет здесь")
+        self.image_view.setMinimumHeight(500)
+        self.image_view.timer = self.timer
+        image_layout.addWidget(self.image_view)
+
+        # Ход расчета и отмена
+        progress_layout = QHBoxLayout()
+        self.render_progress = QProgressBar()
+        self.render_progress.setRange(0, 100)
+        self.render_progress.setValue(0)
+        self.render_progress.setFormat("Нет расчета")
+        self.cancel_button = QPushButton("Отменить Расчет")
+        self.cancel_button.setEnabled(False)
+        self.cancel_button.clicked.connect(self._cancel_render)
+        progress_layout.addWidget(self.render_progress)
+        progress_layout.addWidget(self.cancel_button)
+        image_layout.addLayout(progress_layout)
 
         main_layout.addWidget(image_group)
 
@@ -177,6 +227,16 @@ class SphereBrightnessApp(QMainWindow):
         stats_layout.addWidget(self.stats_text)
         main_layout.addWidget(stats_group)
 
+        # Замеры времени этапов: показываются в статистике и выгружаются в JSON
+        profiling_layout = QHBoxLayout()
+        self.check_profiling = QCheckBox("Замерять время этапов")
+        self.check_profiling.toggled.connect(self._toggle_profiling)
+        export_profile_button = QPushButton("Экспорт Профиля (JSON)")
+        export_profile_button.clicked.connect(self._export_profile)
+        profiling_layout.addWidget(self.check_profiling)
+        profiling_layout.addWidget(export_profile_button)
+        main_layout.addLayout(profiling_layout)
+
         save_image_button = QPushButton("Сохранить Изображение Сферы")
         save_image_button.clicked.connect(self._save_image)
         main_layout.addWidget(save_image_button)
@@ -216,8 +276,8 @@ class SphereBrightnessApp(QMainWindow):
             #    виртуальному экрану по пропорциям.
             # 2. При отображении, масштабировать это изображение таким образом,
             #    чтобы *визуализируемый объект* (сфера) сохранял правильные пропорции.
-            #    Это означает, что сам QLabel будет иметь динамические размеры,
-            #    ограниченные max(width, height) и сохраняющие aspect ratio.
+            #    Это делает PyramidImageView: изображение вписывается в окно просмотра
+            #    с сохранением aspect ratio (или масштабируется колесом мыши).
 
             # Пусть MAX_IMAGE_SIDE_PIXELS - максимальный размер по одной из сторон для генерации
             MAX_IMAGE_SIDE_PIXELS = 800
@@ -273,6 +333,9 @@ class SphereBrightnessApp(QMainWindow):
             specular_coeff = float(self.entry_specular.text())
             shininess = float(self.entry_shininess.text())
 
+            # Сглаживание: 0 - выключено
+            aa_samples = int(self.entry_aa_samples.text()) if self.check_aa.isChecked() else 0
+
             # --- Валидация диапазонов ---
             if not (100 <= screen_W <= 10000 and 100 <= screen_H <= 10000):
                 raise ValueError("Ширина и высота экрана должны быть от 100 до 10000 мм.")
@@ -317,127 +380,202 @@ class SphereBrightnessApp(QMainWindow):
                 raise ValueError("Коэффициенты Ka, Kd, Ks должны быть в диапазоне [0, 1].")
             if not (shininess > 0):
                 raise ValueError("Степень блеска (n) должна быть положительной.")
+            if self.check_aa.isChecked() and not (2 <= aa_samples <= 8):
+                raise ValueError("Количество подвыборок по стороне должно быть от 2 до 8.")
 
             return (screen_W, screen_H, img_Wres, img_Hres,
                     observer_pos, sphere_center, sphere_r,
                     light_sources,
-                    ambient_coeff, diffuse_coeff, specular_coeff, shininess)
+                    ambient_coeff, diffuse_coeff, specular_coeff, shininess,
+                    aa_samples)
 
         except ValueError as e:
             QMessageBox.critical(self, "Ошибка Ввода", f"Произошла ошибка при расчете: {e}")
             return None
 
+    def _get_tone_mapping_params(self):
+        try:
+            white_percentile = float(self.entry_white_percentile.text())
+            gamma = float(self.entry_tone_gamma.text())
+            if not (0 < white_percentile <= 100):
+                raise ValueError("Процентиль белой точки должен быть в диапазоне (0, 100].")
+            if not (gamma > 0):
+                raise ValueError("Показатель гаммы должен быть положительным.")
+            return {
+                "curve": self.combo_tone_curve.currentData(),
+                "white_percentile": white_percentile,
+                "gamma": gamma,
+            }
+        except ValueError as e:
+            QMessageBox.critical(self, "Ошибка Ввода", f"Произошла ошибка при расчете: {e}")
+            return None
+
     def _calculate_and_visualize(self):
         params = self._get_params()
         if params is None:
             return
+        tone_params = self._get_tone_mapping_params()
+        if tone_params is None:
+            return
 
         (screen_W, screen_H, img_Wres, img_Hres,
          observer_pos, sphere_center, sphere_r,
          light_sources,
-         ambient_coeff, diffuse_coeff, specular_coeff, shininess) = params
+         ambient_coeff, diffuse_coeff, specular_coeff, shininess,
+         aa_samples) = params
+
+        # Новый запрос отменяет незавершенный расчет
+        self._cancel_render()
+        # Профиль относится к последнему расчету и его отображению
+        self.timer.reset()
+
+        job = RenderJob(self.calculator, self.render_lock, {
+            "screen_width_mm": screen_W, "screen_height_mm": screen_H,
+            "img_width_res": img_Wres, "img_height_res": img_Hres,
+            "observer_pos_mm": observer_pos,
+            "sphere_center_mm": sphere_center, "sphere_radius_mm": sphere_r,
+            "light_sources_data_mm": light_sources,
+            "ambient_coeff": ambient_coeff, "diffuse_coeff": diffuse_coeff,
+            "specular_coeff": specular_coeff, "shininess": shininess,
+            "aa_samples": aa_samples,
+        })
+        job.preview_ready.connect(self._on_render_preview)
+        job.progress.connect(self._on_render_progress)
+        job.completed.connect(self._on_render_completed)
+        job.failed.connect(self._on_render_failed)
+        job.finished.connect(lambda: self._render_jobs.discard(job))
+
+        self.render_job = job
+        self.render_params = params
+        self.tone_params = tone_params
+        self._render_jobs.add(job)
+        self.render_progress.setValue(0)
+        self.render_progress.setFormat("Черновой расчет...")
+        self.cancel_button.setEnabled(True)
+        self.notebook.setCurrentWidget(self.results_tab) # Переключаемся на вкладку результатов
+        job.start()
+
+    def _cancel_render(self):
+        if self.render_job is not None:
+            self.render_job.cancel()
+            self.render_job = None
+            self.cancel_button.setEnabled(False)
+            self.render_progress.setFormat("Расчет отменен")
+
+    def _is_current_job(self):
+        # Сигналы отмененных заданий приходят из очереди событий и игнорируются
+        return self.sender() is self.render_job and self.render_job is not None
+
+    def _on_render_preview(self, preview_buffer):
+        if not self._is_current_job():
+            return
+        self._display_brightness_image(self.calculator.tone_map_image(preview_buffer, **self.tone_params))
 
-        try:
-            self.raw_brightness_data = self.calculator.calculate_brightness(
-                screen_W, screen_H,
-                img_Wres, img_Hres,
-                observer_pos, sphere_center, sphere_r,
-                light_sources,
-                ambient_coeff, diffuse_coeff, specular_coeff, shininess
-            )
+    def _on_render_progress(self, rows_done, rows_total):
+        if not self._is_current_job():
+            return
+        self.render_progress.setValue(int(100 * rows_done / rows_total))
+        self.render_progress.setFormat(f"Строки: {rows_done} из {rows_total} (%p%)")
 
-            # Нормализуем для 2D изображения (0-255)
-            self.normalized_brightness_image = self.calculator.normalize_brightness_to_image(self.raw_brightness_data)
+    def _on_render_completed(self, brightness_buffer, render_stats, hit_mask):
+        if not self._is_current_job():
+            return
+        self.render_job = None
+        self.cancel_button.setEnabled(False)
+        self.render_progress.setValue(100)
+        self.render_progress.setFormat("Готово")
 
-            self._display_brightness_image(self.normalized_brightness_image)
+        self.raw_brightness_data = brightness_buffer
+        self.last_render_stats = render_stats
+        self.raw_hit_mask = hit_mask
 
-            self._update_stats_display(params)
+        # Нормализуем для 2D изображения (0-255) с выбранной тональной кривой
+        self.normalized_brightness_image = self.calculator.tone_map_image(self.raw_brightness_data, **self.tone_params)
 
-            self.notebook.setCurrentWidget(self.results_tab) # Переключаемся на вкладку результатов
+        self._display_brightness_image(self.normalized_brightness_image)
 
-        except ValueError as e:
-            QMessageBox.critical(self, "Ошибка Расчета", f"Произошла ошибка при расчете: {e}")
+        try:
+            self._update_stats_display(self.render_params)
         except Exception as e:
             QMessageBox.critical(self, "Неизвестная Ошибка", f"Произошла непредвиденная ошибка: {e}")
 
+    def _on_render_failed(self, message):
+        if not self._is_current_job():
+            return
+        self.render_job = None
+        self.cancel_button.setEnabled(False)
+        self.render_progress.setFormat("Ошибка расчета")
+        QMessageBox.critical(self, "Ошибка Расчета", message)
+
+    def closeEvent(self, event):
+        self._cancel_render()
+        for job in list(self._render_jobs):
+            job.wait()
+        super().closeEvent(event)
+
+    @timed_stage("display_image")
     def _display_brightness_image(self, image_array):
-        height, width = image_array.shape
-        q_image = QImage(image_array.data, width, height, width, QImage.Format.Format_Grayscale8)
-        pixmap = QPixmap.fromImage(q_image)
-
-        # Определяем максимальный размер для отображения внутри контейнера image_group
-        # Мы хотим, чтобы изображение заполняло пространство, но сохраняло пропорции
-        # и не превышало определенного размера, чтобы избежать излишнего масштабирования.
-
-        # Получаем доступный размер родительского виджета или группы, чтобы оценить
-        # куда масштабировать
-        available_size = self.image_container_widget.size()
-        if available_size.isEmpty() or available_size.width() == 0 or available_size.height() == 0:
-            # Если размер еще не известен (например, при первом запуске),
-            # используем разумные значения по умолчанию.
-            # Можно использовать sizeHint() или max (800, 800)
-            target_width = 800
-            target_height = 800
-        else:
-            target_width = available_size.width()
-            target_height = available_size.height()
-
-        # Масштабируем QPixmap с сохранением пропорций, чтобы он помещался в целевой размер
-        # Qt.KeepAspectRatio - сохраняет пропорции
-        # Qt.SmoothTransformation - для лучшего качества при масштабировании
-        scaled_pixmap = pixmap.scaled(
-            target_width, target_height,
-            Qt.AspectRatioMode.KeepAspectRatio,
-            Qt.TransformationMode.SmoothTransformation
-        )
-
-        self.image_label.setPixmap(scaled_pixmap)
-        # setScaledContents(True) здесь все еще полезно, но *после* того, как мы уже
-        # масштабировали Pixmap. Это может помочь с небольшими доводками, но основное
-        # масштабирование должно быть сделано на QPixmap.
-        # Однако, если QLabel имеет FixedSize, setScaledContents(True) будет масштабировать Pixmap
-        # до этого FixedSize, даже если он был уже масштабирован.
-        #
-        # Лучше: если вы масштабируете Pixmap до размера, который вы хотите,
-        # тогда setScaledContents(True) может быть не нужен, если вы просто
-        # хотите показать Pixmap без дополнительных искажений.
-        # НО, если QLabel сам меньше или большеscaled_pixmap, то setScaledContents(True)
-        # будет масштабировать, potentially causing distortion.
-        #
-        # Самый надежный способ - это установить размер QLabel равным размеру масштабированного Pixmap
-        self.image_label.setFixedSize(scaled_pixmap.size())
-
-        # Установка политики Expanding и AlignmentCenter с растягивателями в QHBoxLayout
-        # вокруг image_label заставит QLabel центрироваться и принимать его оптимальный
-        # или фиксированный размер, что сохранит пропорции.
-        self.image_label.setSizePolicy(QSizePolicy.Policy.Fixed, QSizePolicy.Policy.Fixed) # Теперь QLabel имеет фиксированный размер масштабированного Pixmap
-        self.image_label.setAlignment(Qt.AlignmentFlag.AlignCenter) # Центрируем его в макете
-
-        # self.image_container_widget.updateGeometry()
-        # self.image_container_widget.parentWidget().adjustSize()
-        self.image_container_widget.update() # Обновляем контейнер, чтобы перерисовка произошла
-
+        # Пирамида строится один раз на результат; при изменении размера окна или масштаба
+        # рисуются только видимые плитки подходящего уровня
+        self.image_view.set_image(image_array)
 
+    @timed_stage("stats_display")
     def _update_stats_display(self, params):
         (screen_W, screen_H, img_Wres, img_Hres,
          observer_pos, sphere_center, sphere_r,
          light_sources,
-         ambient_coeff, diffuse_coeff, specular_coeff, shininess) = params
+         ambient_coeff, diffuse_coeff, specular_coeff, shininess,
+         aa_samples) = params
 
         stats_output = []
         stats_output.append("--- Расчетные значения яркости (абсолютные величины) ---\n")
 
         # Добавим информацию о разрешении изображения в статистику
-        stats_output.append(f"Генерируемое разрешение изображения: {img_Wres}x{img_Hres} пикселей\n\n")
-
-        sample_points_info = self.calculator.get_sample_points_info(
-            self.raw_brightness_data,
-            screen_W, screen_H, img_Wres, img_Hres,
-            observer_pos, sphere_center, sphere_r,
-            light_sources,
-            ambient_coeff, diffuse_coeff, specular_coeff, shininess,
-            num_points=5
-        )
+        stats_output.append(f"Генерируемое разрешение изображения: {img_Wres}x{img_Hres} пикселей\n")
+
+        # Статистика отсечения по проекции сферы
+        render_stats = self.last_render_stats
+        if render_stats:
+            stats_output.append(
+                f"Трассировано пикселей: {render_stats['pixels_traced']} из {render_stats['pixels_total']} "
+                f"(отсечено {render_stats['culled_fraction'] * 100:.2f}%)\n")
+            if render_stats.get("render_cache_hit"):
+                stats_output.append("Кадр взят из кэша расчетов: расчет не выполнялся\n")
+            if "render_cache_hit_rate" in render_stats:
+                stats_output.append(
+                    f"Кэш расчетов: попаданий {render_stats['render_cache_memory_hits']} (память) + "
+                    f"{render_stats['render_cache_disk_hits']} (диск), "
+                    f"промахов {render_stats['render_cache_misses']}, "
+                    f"доля попаданий {render_stats['render_cache_hit_rate'] * 100:.1f}%, "
+                    f"сэкономлено {render_stats['render_cache_bytes_saved'] / 2 ** 20:.1f} МиБ "
+                    f"и {render_stats['render_cache_seconds_saved']:.2f} с\n")
+            if render_stats.get("gbuffer_reused"):
+                stats_output.append("Геометрия взята из G-буфера: выполнено только затенение\n")
+            if "gbuffer_cache_entries" in render_stats:
+                stats_output.append(
+                    f"Кэш геометрии: {render_stats['gbuffer_cache_entries']} записей "
+                    f"({render_stats['gbuffer_cache_bytes'] / 2 ** 20:.1f} МиБ), "
+                    f"попаданий {render_stats['gbuffer_cache_hits']}, "
+                    f"промахов {render_stats['gbuffer_cache_misses']}\n")
+            if render_stats["aa_refined_pixels"] > 0:
+                stats_output.append(
+                    f"Уточнено сглаживанием: {render_stats['aa_refined_pixels']} пикселей "
+                    f"({render_stats['aa_refined_fraction'] * 100:.2f}%, "
+                    f"{render_stats['aa_samples']} подвыборок на пиксель)\n")
+        stats_output.append("\n")
+
+        # Опрос точек читает G-буфер калькулятора, поэтому выполняется под той же блокировкой
+        with self.render_lock:
+            sample_points_info = self.calculator.get_sample_points_info(
+                self.raw_brightness_data,
+                screen_W, screen_H, img_Wres, img_Hres,
+                observer_pos, sphere_center, sphere_r,
+                light_sources,
+                ambient_coeff, diffuse_coeff, specular_coeff, shininess,
+                num_points=5,
+                seed=0,
+                hit_mask=self.raw_hit_mask
+            )
 
         for i, point_data in enumerate(sample_points_info):
             stats_output.append(f"Точка {i + 1}:\n")
@@ -450,22 +588,58 @@ class SphereBrightnessApp(QMainWindow):
             stats_output.append(f"  Яркость (абс.): {point_data['brightness']:.7f}\n")
             stats_output.append("---\n")
 
-        # При расчете статистики игнорируем "черные" пиксели, которые не являются частью сферы
-        # (т.е., где brightness_data == 0, если фон не имеет яркости).
-        # Но если в calculator.py фон имеет фоновую яркость Ka * I0, то нужно
-        # скорректировать эту логику. Предполагаем, что 0 - это "ничего не видно".
-        brightness_values_on_sphere = self.raw_brightness_data[self.raw_brightness_data > 0]
+        # Пиксели сферы берутся по маске попаданий G-буфера, а не по яркости > 0:
+        # со сглаживанием пиксели силуэта вне маски тоже получают ненулевую яркость
+        # (доля подвыборок, попавших в сферу) и занижали бы минимум и среднее
+        brightness_values_on_sphere = self.raw_brightness_data[self._sphere_stats_mask()]
 
         max_brightness = np.max(brightness_values_on_sphere) if brightness_values_on_sphere.size > 0 else 0.0
         min_brightness = np.min(brightness_values_on_sphere) if brightness_values_on_sphere.size > 0 else 0.0
         avg_brightness = np.mean(brightness_values_on_sphere) if brightness_values_on_sphere.size > 0 else 0.0
 
         stats_output.append(f"\nМаксимальная яркость на сфере: {max_brightness:.7f}\n")
-        stats_output.append(f"Минимальная яркость на сфере (ненулевая): {min_brightness:.7f}\n")
-        stats_output.append(f"Средняя яркость на сфере (ненулевая): {avg_brightness:.7f}\n")
+        stats_output.append(f"Минимальная яркость на сфере: {min_brightness:.7f}\n")
+        stats_output.append(f"Средняя яркость на сфере: {avg_brightness:.7f}\n")
+
+        if self.timer.enabled:
+            # Время самого вывода статистики попадает в профиль после этого вызова
+            stats_output.append("\n--- Время этапов ---\n")
+            stats_output.append(self.timer.format_text() + "\n")
 
         self.stats_text.setText("".join(stats_output))
 
+    def _sphere_stats_mask(self):
+        """
+        Пиксели для статистики яркости на сфере: маска попаданий, а после сглаживания -
+        без пикселей силуэта (попаданий с соседом-промахом), яркость которых смешана с фоном.
+        """
+        sphere_mask = self.raw_hit_mask
+        if self.last_render_stats.get("aa_refined_pixels", 0) > 0:
+            padded = np.pad(sphere_mask, 1, mode="edge")
+            sphere_mask = (sphere_mask & padded[:-2, 1:-1] & padded[2:, 1:-1]
+                           & padded[1:-1, :-2] & padded[1:-1, 2:])
+        return sphere_mask
+
+    def _toggle_profiling(self, enabled):
+        self.timer.enabled = enabled
+        if enabled:
+            self.timer.reset()
+
+    def _export_profile(self):
+        if not self.timer.enabled:
+            QMessageBox.warning(self, "Нет данных", "Сначала включите замер времени этапов и выполните расчет.")
+            return
+
+        file_path, _ = QFileDialog.getSaveFileName(
+            self, "Сохранить профиль этапов", "", "JSON files (*.json);;All files (*.*)"
+        )
+        if file_path:
+            try:
+                self.timer.save_json(file_path)
+                QMessageBox.information(self, "Сохранение", f"Профиль успешно сохранен в {file_path}")
+            except Exception as e:
+                QMessageBox.critical(self, "Ошибка Сохранения", f"Не удалось сохранить профиль: {e}")
+
     def _save_image(self):
         if self.normalized_brightness_image is None:
             QMessageBox.warning(self, "Нет данных", "Сначала выполните расчет для создания изображения.")
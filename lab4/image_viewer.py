@@ -0,0 +1,221 @@
+from collections import OrderedDict
+
+import numpy as np
+from PyQt6.QtCore import Qt, QPointF, QRectF
+from PyQt6.QtGui import QImage, QPainter, QPixmap
+from PyQt6.QtWidgets import QSizePolicy, QWidget
+
+from profiling import StageTimer, timed_stage
+
+
+class ImagePyramid:
+    """
+    Пирамида уменьшенных копий (mipmap) 8-битного изображения.
+
+    Уровень 0 - исходное изображение, каждый следующий уровень вдвое меньше предыдущего
+    (усреднение блоков 2x2, нечетная сторона дополняется повтором края), пока большая
+    сторона не станет не больше MIN_LEVEL_SIDE. Уровни делятся на плитки TILE_SIZE x TILE_SIZE.
+    """
+
+    TILE_SIZE = 256
+    MIN_LEVEL_SIDE = 64
+
+    def __init__(self, image):
+        image = np.ascontiguousarray(image, dtype=np.uint8)
+        self.levels = [image]
+        while max(self.levels[-1].shape) > self.MIN_LEVEL_SIDE:
+            self.levels.append(self._downsample(self.levels[-1]))
+
+    @staticmethod
+    def _downsample(image):
+        height, width = image.shape
+        padded = np.pad(image, ((0, height % 2), (0, width % 2)), mode="edge").astype(np.uint16)
+        summed = padded[0::2, 0::2] + padded[1::2, 0::2] + padded[0::2, 1::2] + padded[1::2, 1::2]
+        return ((summed + 2) // 4).astype(np.uint8)
+
+    @property
+    def width(self):
+        return self.levels[0].shape[1]
+
+    @property
+    def height(self):
+        return self.levels[0].shape[0]
+
+    def level_for_scale(self, scale):
+        """
+        Уровень для отображения с масштабом scale (экранных пикселей на пиксель исходника):
+        самый грубый уровень, разрешение которого еще не меньше требуемого.
+        """
+        if scale >= 1.0:
+            return 0
+        level = int(np.floor(np.log2(1.0 / scale)))
+        return min(level, len(self.levels) - 1)
+
+    def tile_grid(self, level):
+        """Число плиток (по строкам, по столбцам) на уровне level."""
+        height, width = self.levels[level].shape
+        return -(-height // self.TILE_SIZE), -(-width // self.TILE_SIZE)
+
+    def tile(self, level, tile_row, tile_col):
+        row_start, col_start = tile_row * self.TILE_SIZE, tile_col * self.TILE_SIZE
+        return self.levels[level][row_start:row_start + self.TILE_SIZE, col_start:col_start + self.TILE_SIZE]
+
+
+class PyramidImageView(QWidget):
+    """
+    Просмотр изображения с масштабированием (колесо мыши) и перемещением (перетаскивание).
+
+    Рисуются только видимые плитки подходящего уровня пирамиды, поэтому ни изменение
+    размера окна, ни масштабирование не пересчитывают исходник целиком. Плитки хранятся
+    как QPixmap в кэше LRU на MAX_CACHED_TILES плиток. Двойной щелчок - вписать в окно.
+    """
+
+    MAX_CACHED_TILES = 512
+    ZOOM_STEP = 1.25
+    MAX_SCALE = 32.0
+
+    def __init__(self, placeholder_text="", parent=None):
+        super().__init__(parent)
+        self.placeholder_text = placeholder_text
+        self.pyramid = None
+        self._tile_cache = OrderedDict()
+        # Масштаб (экранных пикселей на пиксель исходника) и точка исходника в центре виджета
+        self._scale = 1.0
+        self._center = QPointF(0.0, 0.0)
+        self._fit_mode = True
+        self._drag_origin = None
+        # Замеры отрисовки (profiling.StageTimer); окно может передать общий таймер
+        self.timer = StageTimer()
+        self.setSizePolicy(QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Expanding)
+        self.setMinimumSize(100, 100)
+
+    @timed_stage("build_pyramid")
+    def set_image(self, image):
+        """
+        Показывает новое изображение (uint8, H x W). Если вид не менялся пользователем,
+        изображение вписывается в окно; иначе сохраняется видимая область (в долях кадра),
+        так что черновой кадр и полный кадр другого разрешения показываются одинаково.
+        """
+        previous = self.pyramid
+        self.pyramid = ImagePyramid(image)
+        self._tile_cache.clear()
+        if self._fit_mode or previous is None:
+            self.fit_to_window()
+        else:
+            ratio = self.pyramid.width / previous.width
+            self._scale /= ratio
+            self._center = QPointF(self._center.x() * ratio, self._center.y() * self.pyramid.height / previous.height)
+            self.update()
+
+    def clear(self):
+        self.pyramid = None
+        self._tile_cache.clear()
+        self.update()
+
+    def fit_to_window(self):
+        self._fit_mode = True
+        if self.pyramid is not None:
+            self._scale = min(self.width() / self.pyramid.width, self.height() / self.pyramid.height)
+            self._center = QPointF(self.pyramid.width / 2.0, self.pyramid.height / 2.0)
+        self.update()
+
+    def _min_scale(self):
+        return 0.5 * min(self.width() / self.pyramid.width, self.height() / self.pyramid.height)
+
+    def _tile_pixmap(self, level, tile_row, tile_col):
+        key = (level, tile_row, tile_col)
+        pixmap = self._tile_cache.get(key)
+        if pixmap is not None:
+            self._tile_cache.move_to_end(key)
+            return pixmap
+        with self.timer.stage("tile_conversion"):
+            tile = np.ascontiguousarray(self.pyramid.tile(level, tile_row, tile_col))
+            height, width = tile.shape
+            pixmap = QPixmap.fromImage(QImage(tile.data, width, height, width, QImage.Format.Format_Grayscale8))
+        self.timer.count("tiles_converted")
+        self._tile_cache[key] = pixmap
+        if len(self._tile_cache) > self.MAX_CACHED_TILES:
+            self._tile_cache.popitem(last=False)
+        return pixmap
+
+    def _to_image(self, point):
+        """Переводит точку виджета в координаты исходника."""
+        return QPointF(self._center.x() + (point.x() - self.width() / 2.0) / self._scale,
+                       self._center.y() + (point.y() - self.height() / 2.0) / self._scale)
+
+    @timed_stage("paint_tiles")
+    def paintEvent(self, event):
+        painter = QPainter(self)
+        painter.fillRect(self.rect(), Qt.GlobalColor.black)
+        if self.pyramid is None:
+            painter.setPen(Qt.GlobalColor.gray)
+            painter.drawText(self.rect(), Qt.AlignmentFlag.AlignCenter, self.placeholder_text)
+            return
+
+        level = self.pyramid.level_for_scale(self._scale)
+        level_factor = 2 ** level  # пикселей исходника на пиксель уровня
+        # Сглаживание нужно только при уменьшении; при увеличении видны отдельные пиксели
+        painter.setRenderHint(QPainter.RenderHint.SmoothPixmapTransform, self._scale * level_factor < 1.0)
+
+        # Видимая область в пикселях уровня
+        top_left = self._to_image(QPointF(0, 0))
+        bottom_right = self._to_image(QPointF(self.width(), self.height()))
+        tile_span = self.pyramid.TILE_SIZE * level_factor
+        tile_rows, tile_cols = self.pyramid.tile_grid(level)
+        first_row = max(0, int(top_left.y() // tile_span))
+        last_row = min(tile_rows - 1, int(bottom_right.y() // tile_span))
+        first_col = max(0, int(top_left.x() // tile_span))
+        last_col = min(tile_cols - 1, int(bottom_right.x() // tile_span))
+
+        for tile_row in range(first_row, last_row + 1):
+            for tile_col in range(first_col, last_col + 1):
+                pixmap = self._tile_pixmap(level, tile_row, tile_col)
+                # Пиксели уровня покрывают level_factor пикселей исходника; последняя плитка
+                # нечетной стороны выходит за край исходника не больше чем на level_factor - 1
+                origin_x = (tile_col * tile_span - self._center.x()) * self._scale + self.width() / 2.0
+                origin_y = (tile_row * tile_span - self._center.y()) * self._scale + self.height() / 2.0
+                target = QRectF(origin_x, origin_y,
+                                pixmap.width() * level_factor * self._scale,
+                                pixmap.height() * level_factor * self._scale)
+                painter.drawPixmap(target, pixmap, QRectF(pixmap.rect()))
+
+    def resizeEvent(self, event):
+        if self._fit_mode:
+            self.fit_to_window()
+        super().resizeEvent(event)
+
+    def wheelEvent(self, event):
+        if self.pyramid is None:
+            return
+        steps = event.angleDelta().y() / 120.0
+        new_scale = float(np.clip(self._scale * self.ZOOM_STEP ** steps, self._min_scale(), self.MAX_SCALE))
+        # Точка под курсором остается на месте
+        cursor = event.position()
+        anchor = self._to_image(cursor)
+        self._scale = new_scale
+        self._center = QPointF(anchor.x() - (cursor.x() - self.width() / 2.0) / self._scale,
+                               anchor.y() - (cursor.y() - self.height() / 2.0) / self._scale)
+        self._fit_mode = False
+        self.update()
+
+    def mousePressEvent(self, event):
+        if event.button() == Qt.MouseButton.LeftButton:
+            self._drag_origin = event.position()
+            self.setCursor(Qt.CursorShape.ClosedHandCursor)
+
+    def mouseMoveEvent(self, event):
+        if self._drag_origin is None or self.pyramid is None:
+            return
+        delta = event.position() - self._drag_origin
+        self._drag_origin = event.position()
+        self._center = QPointF(self._center.x() - delta.x() / self._scale, self._center.y() - delta.y() / self._scale)
+        self._fit_mode = False
+        self.update()
+
+    def mouseReleaseEvent(self, event):
+        if event.button() == Qt.MouseButton.LeftButton:
+            self._drag_origin = None
+            self.unsetCursor()
+
+    def mouseDoubleClickEvent(self, event):
+        self.fit_to_window()
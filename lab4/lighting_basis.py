@@ -0,0 +1,97 @@
+import numpy as np
+
+
+class LightingBasis:
+    """
+    Базисные карты освещения сферы для единичной силы света и единичных коэффициентов.
+
+    Яркость по модели Блинна-Фонга линейна по силе света I0 каждого источника и по
+    коэффициентам Ka, Kd, Ks:
+        B = Ka * BASE_AMBIENT_LIGHTING + sum_i I0_i * (Kd * D_i + Ks * S_i),
+    где D_i = max(0, N·L_i) / d_i^2 и S_i = max(0, N·H_i)^n / d_i^2 зависят только от
+    геометрии, положения источника i и блеска n. Карты D и S хранятся только для
+    пикселей, попавших в сферу (массивы (M, N_источников)), поэтому любое изменение
+    I0 или Ka/Kd/Ks сводится к взвешенной сумме, без повторной трассировки и затенения.
+
+    Создается методом SphereBrightnessCalculator.build_lighting_basis.
+    """
+
+    def __init__(self, image_shape, pixel_rows, pixel_cols, diffuse_basis, specular_basis,
+                 shininess, base_ambient_lighting):
+        self.image_shape = image_shape
+        self.pixel_rows = pixel_rows
+        self.pixel_cols = pixel_cols
+        self.diffuse_basis = diffuse_basis
+        self.specular_basis = specular_basis
+        self.shininess = shininess
+        self.base_ambient_lighting = base_ambient_lighting
+
+        # Средние по пикселям сферы: среднее яркости тоже линейно по параметрам
+        if len(pixel_rows) > 0:
+            self._diffuse_mean = diffuse_basis.mean(axis=0, dtype=np.float64)
+            self._specular_mean = specular_basis.mean(axis=0, dtype=np.float64)
+        else:
+            self._diffuse_mean = np.zeros(diffuse_basis.shape[1])
+            self._specular_mean = np.zeros(specular_basis.shape[1])
+
+    @property
+    def num_lights(self):
+        return self.diffuse_basis.shape[1]
+
+    @property
+    def num_pixels(self):
+        return len(self.pixel_rows)
+
+    @property
+    def nbytes(self):
+        return self.diffuse_basis.nbytes + self.specular_basis.nbytes
+
+    def _check_intensities(self, light_intensities):
+        light_intensities = np.asarray(light_intensities, dtype=np.float64)
+        if light_intensities.shape[-1] != self.num_lights:
+            raise ValueError(
+                f"Ожидается {self.num_lights} значений силы света I0, получено {light_intensities.shape[-1]}.")
+        return light_intensities
+
+    def hit_values(self, light_intensities, ambient_coeff, diffuse_coeff, specular_coeff):
+        """Яркость пикселей сферы (M,) для заданных I0 (N,) и коэффициентов Ka, Kd, Ks."""
+        light_intensities = self._check_intensities(light_intensities).astype(self.diffuse_basis.dtype)
+        values = diffuse_coeff * (self.diffuse_basis @ light_intensities)
+        values += specular_coeff * (self.specular_basis @ light_intensities)
+        values += ambient_coeff * self.base_ambient_lighting
+        return values
+
+    def brightness(self, light_intensities, ambient_coeff, diffuse_coeff, specular_coeff):
+        """Буфер яркости (H, W) - то же, что calculate_brightness с этими I0 и коэффициентами."""
+        return self.to_image(self.hit_values(light_intensities, ambient_coeff, diffuse_coeff, specular_coeff))
+
+    def hit_values_many(self, light_intensities, ambient_coeffs, diffuse_coeffs, specular_coeffs):
+        """
+        Яркость пикселей сферы для K конфигураций сразу: I0 - массив (K, N),
+        коэффициенты - числа или массивы (K,). Возвращает массив (K, M).
+        """
+        light_intensities = self._check_intensities(light_intensities).reshape(-1, self.num_lights)
+        light_intensities = light_intensities.astype(self.diffuse_basis.dtype)
+        diffuse_weights = np.reshape(diffuse_coeffs, (-1, 1)) * light_intensities
+        specular_weights = np.reshape(specular_coeffs, (-1, 1)) * light_intensities
+
+        values = diffuse_weights @ self.diffuse_basis.T
+        values += specular_weights @ self.specular_basis.T
+        values += np.reshape(ambient_coeffs, (-1, 1)) * self.base_ambient_lighting
+        return values
+
+    def mean_brightness_many(self, light_intensities, ambient_coeffs, diffuse_coeffs, specular_coeffs):
+        """
+        Средняя яркость по пикселям сферы для K конфигураций (K,) - без обращения к картам,
+        за O(K * N) операций.
+        """
+        light_intensities = self._check_intensities(light_intensities).reshape(-1, self.num_lights)
+        return (np.asarray(ambient_coeffs, dtype=np.float64) * self.base_ambient_lighting
+                + np.asarray(diffuse_coeffs, dtype=np.float64) * (light_intensities @ self._diffuse_mean)
+                + np.asarray(specular_coeffs, dtype=np.float64) * (light_intensities @ self._specular_mean))
+
+    def to_image(self, values):
+        """Раскладывает значения пикселей сферы (M,) в буфер яркости (H, W); фон равен нулю."""
+        image = np.zeros(self.image_shape, dtype=np.float32)
+        image[self.pixel_rows, self.pixel_cols] = values
+        return image
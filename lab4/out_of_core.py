@@ -0,0 +1,219 @@
+import os
+import struct
+import zlib
+
+import numpy as np
+
+from sphere_brightness_calculator import SphereBrightnessCalculator
+from tone_mapping import iter_row_bands
+
+
+class StreamingPNGWriter:
+    """
+    Потоковая запись 8-битного полутонового PNG построчно: строки сжимаются zlib по мере
+    поступления и записываются блоками IDAT, поэтому изображение целиком в памяти не хранится.
+    """
+
+    IDAT_CHUNK_BYTES = 1 << 20
+
+    def __init__(self, file_path, width, height, compression_level=6):
+        self.width = width
+        self.height = height
+        self.rows_written = 0
+        self._file = open(file_path, "wb")
+        self._compressor = zlib.compressobj(compression_level)
+        self._pending = []
+        self._pending_bytes = 0
+
+        self._file.write(b"\x89PNG\r\n\x1a\n")
+        # Ширина, высота, 8 бит, тип цвета 0 (оттенки серого), сжатие, фильтр, без чересстрочности
+        self._write_chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 0, 0, 0, 0))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _write_chunk(self, chunk_type, data):
+        self._file.write(struct.pack(">I", len(data)))
+        self._file.write(chunk_type)
+        self._file.write(data)
+        self._file.write(struct.pack(">I", zlib.crc32(data, zlib.crc32(chunk_type)) & 0xFFFFFFFF))
+
+    def _flush_idat(self):
+        if self._pending:
+            self._write_chunk(b"IDAT", b"".join(self._pending))
+            self._pending = []
+            self._pending_bytes = 0
+
+    def write_rows(self, rows):
+        """Записывает очередные строки изображения - массив uint8 формы (k, width)."""
+        rows = np.asarray(rows, dtype=np.uint8)
+        if rows.ndim != 2 or rows.shape[1] != self.width:
+            raise ValueError(f"Ожидаются строки шириной {self.width} пикселей.")
+        if self.rows_written + len(rows) > self.height:
+            raise ValueError("Записано больше строк, чем высота изображения.")
+        # Каждая строка PNG начинается с байта типа фильтра (0 - без фильтра)
+        scanlines = np.zeros((len(rows), self.width + 1), dtype=np.uint8)
+        scanlines[:, 1:] = rows
+        compressed = self._compressor.compress(scanlines.tobytes())
+        if compressed:
+            self._pending.append(compressed)
+            self._pending_bytes += len(compressed)
+            if self._pending_bytes >= self.IDAT_CHUNK_BYTES:
+                self._flush_idat()
+        self.rows_written += len(rows)
+
+    def close(self):
+        if self._file.closed:
+            return
+        try:
+            if self.rows_written != self.height:
+                raise ValueError(f"Записано {self.rows_written} строк из {self.height}.")
+            self._pending.append(self._compressor.flush())
+            self._flush_idat()
+            self._write_chunk(b"IEND", b"")
+        finally:
+            self._file.close()
+
+
+class OutOfCoreRenderer:
+    """
+    Расчет кадров сверхвысокого разрешения (16k x 16k и больше) вне оперативной памяти.
+
+    Кадр рассчитывается плитками tile_size x tile_size, каждая плитка сразу записывается
+    в отображаемый в память файл (.npy или сырой float32), а 8-битное изображение строится
+    потоковой нормализацией по полосам из tile_size строк. Пиковая память - несколько
+    плиток (или одна полоса при нормализации) независимо от размера кадра.
+    """
+
+    DEFAULT_TILE_SIZE = 512
+
+    def __init__(self, calculator=None, tile_size=DEFAULT_TILE_SIZE):
+        if tile_size < 1:
+            raise ValueError("Размер плитки (tile_size) должен быть положительным.")
+        self.calculator = calculator if calculator is not None else SphereBrightnessCalculator()
+        self.tile_size = tile_size
+        self.last_render_stats = {}
+
+    @staticmethod
+    def _open_output(file_path, shape, mode):
+        """Файл .npy открывается с заголовком формата NumPy, любой другой - как сырой float32."""
+        if file_path.lower().endswith(".npy"):
+            return np.lib.format.open_memmap(file_path, mode=mode, dtype=np.float32, shape=shape)
+        return np.memmap(file_path, mode=mode, dtype=np.float32, shape=shape)
+
+    def render_to_file(
+            self,
+            file_path,
+            screen_width_mm, screen_height_mm,
+            img_width_res, img_height_res,
+            observer_pos_mm,
+            sphere_center_mm, sphere_radius_mm,
+            light_sources_data_mm,
+            ambient_coeff, diffuse_coeff, specular_coeff, shininess,
+            memory_budget_bytes=None,
+            culling=True
+    ):
+        """
+        Рассчитывает буфер яркости в файл file_path (.npy или сырой float32, строки подряд).
+        Возвращает максимальную яркость кадра (для последующей нормализации).
+        """
+        scene = self.calculator._prepare_scene(
+            screen_width_mm, screen_height_mm,
+            img_width_res, img_height_res,
+            observer_pos_mm,
+            sphere_center_mm, sphere_radius_mm,
+            light_sources_data_mm
+        )
+        stats = self.calculator._new_render_stats(img_width_res * img_height_res)
+        max_brightness = 0.0
+
+        output = self._open_output(file_path, (img_height_res, img_width_res), "w+")
+        try:
+            for row_start in range(0, img_height_res, self.tile_size):
+                row_stop = min(row_start + self.tile_size, img_height_res)
+                for col_start in range(0, img_width_res, self.tile_size):
+                    col_stop = min(col_start + self.tile_size, img_width_res)
+                    block = self.calculator._render_region(
+                        scene, row_start, row_stop, col_start, col_stop,
+                        ambient_coeff, diffuse_coeff, specular_coeff, shininess,
+                        memory_budget_bytes=memory_budget_bytes,
+                        culling=culling,
+                        stats=stats
+                    )
+                    output[row_start:row_stop, col_start:col_stop] = block
+                    max_brightness = max(max_brightness, float(block.max()))
+                # Сбрасываем полосу на диск, чтобы грязные страницы не копились в памяти
+                output.flush()
+        finally:
+            del output
+
+        stats["max_brightness"] = max_brightness
+        self.last_render_stats = self.calculator._finalize_render_stats(stats)
+        return max_brightness
+
+    def normalize_to_image(self, source_path, output_path, img_width_res=None, img_height_res=None,
+                           max_brightness=None, tone_mapper=None):
+        """
+        Потоковая нормализация буфера яркости из файла в 8-битное изображение, так же как
+        normalize_brightness_to_image: (яркость / максимум) * 255 с отбрасыванием дробной части.
+
+        output_path - .png (потоковый PNG), .pgm (двоичный PGM) или .npy (uint8 в памяти-файле).
+        Для сырого файла float32 нужно указать img_width_res и img_height_res.
+        max_brightness - максимум кадра; если не задан, находится отдельным проходом по файлу.
+        tone_mapper - tone_mapping.ToneMapper вместо деления на максимум; если его черная и белая
+        точки не заданы, они находятся отдельным проходом гистограммы по файлу.
+        """
+        if source_path.lower().endswith(".npy"):
+            source = np.load(source_path, mmap_mode="r")
+        else:
+            if img_width_res is None or img_height_res is None:
+                raise ValueError("Для сырого файла float32 нужно указать разрешение изображения.")
+            source = np.memmap(source_path, mode="r", dtype=np.float32, shape=(img_height_res, img_width_res))
+        height, width = source.shape
+
+        if tone_mapper is not None:
+            if tone_mapper.white_point is None:
+                tone_mapper.fit(iter_row_bands(source, self.tile_size))
+        elif max_brightness is None:
+            max_brightness = 0.0
+            for row_start in range(0, height, self.tile_size):
+                max_brightness = max(max_brightness, float(source[row_start:row_start + self.tile_size].max()))
+
+        extension = os.path.splitext(output_path)[1].lower()
+        if extension == ".png":
+            writer = StreamingPNGWriter(output_path, width, height)
+            write_rows, finish = writer.write_rows, writer.close
+        elif extension == ".pgm":
+            pgm_file = open(output_path, "wb")
+            pgm_file.write(f"P5\n{width} {height}\n255\n".encode("ascii"))
+            write_rows, finish = (lambda rows: pgm_file.write(rows.tobytes())), pgm_file.close
+        elif extension == ".npy":
+            image = np.lib.format.open_memmap(output_path, mode="w+", dtype=np.uint8, shape=(height, width))
+            row_cursor = [0]
+
+            def write_rows(rows):
+                image[row_cursor[0]:row_cursor[0] + len(rows)] = rows
+                row_cursor[0] += len(rows)
+
+            finish = image.flush
+        else:
+            del source
+            raise ValueError(f"Неподдерживаемый формат изображения: {output_path} (ожидается .png, .pgm или .npy).")
+
+        try:
+            for row_start in range(0, height, self.tile_size):
+                band = np.asarray(source[row_start:row_start + self.tile_size])
+                if tone_mapper is not None:
+                    rows = tone_mapper.apply(band)
+                elif max_brightness == 0:
+                    rows = np.zeros(band.shape, dtype=np.uint8)
+                else:
+                    rows = ((band / max_brightness) * 255).astype(np.uint8)
+                write_rows(rows)
+        finally:
+            finish()
+            del source
+        return output_path
@@ -0,0 +1,302 @@
+"""
+Перебор параметров материала и освещения сферы за один проход по геометрии.
+
+Сетка параметров задается словарем {имя: список значений}; перебираются все сочетания
+(декартово произведение) в порядке ключей словаря. Можно перебирать коэффициенты
+ambient_coeff, diffuse_coeff, specular_coeff, блеск shininess и наборы источников
+light_sources_data_mm (каждое значение - таблица [xL, yL, zL, I0]).
+
+Трассировка выполняется один раз (G-буфер калькулятора), множители источников для
+порции точек - один раз на набор источников, возведение в степень блеска - один раз
+на значение блеска, а яркость всех конфигураций порции считается массивом с ведущей
+осью конфигураций. Размер порции подбирается под бюджет памяти.
+
+Пример запуска:
+    python parameter_sweep.py scene.json --diffuse 0.5 1.0 --shininess 10 50 200 --csv sweep.csv
+    python parameter_sweep.py scene.json --light-sets lights.json --stack sweep.npy
+"""
+import argparse
+import csv
+import itertools
+import json
+import sys
+
+import numpy as np
+
+from sphere_brightness_calculator import SphereBrightnessCalculator
+
+# Параметры calculate_brightness, которые можно перебирать
+SWEEP_PARAMS = ("ambient_coeff", "diffuse_coeff", "specular_coeff", "shininess", "light_sources_data_mm")
+# Столбцы сводной таблицы помимо параметров конфигурации
+SUMMARY_COLUMNS = ("max_brightness", "min_brightness", "mean_brightness", "pixels_hit")
+
+
+class ParameterSweep:
+    """
+    Расчет яркости сферы для сетки параметров с общей трассировкой.
+
+    run(..., output='stack') - стопка изображений (K, H, W) float32 с подписями конфигураций;
+    run(..., output='summary') - только сводная таблица (максимум, минимум и среднее яркости
+    по пикселям сферы) без хранения изображений, память не зависит от разрешения кадра.
+    Яркость каждой конфигурации совпадает с calculate_brightness (без сглаживания)
+    с точностью до порядка сложения слагаемых.
+    """
+
+    # Оценка байт на пару (точка, конфигурация): значение float64 и его копия float32
+    BYTES_PER_CONFIGURATION = 16
+
+    def __init__(self, calculator=None, memory_budget_bytes=None):
+        self.calculator = calculator if calculator is not None else SphereBrightnessCalculator()
+        if memory_budget_bytes is None:
+            memory_budget_bytes = self.calculator.SHADING_MEMORY_BUDGET_BYTES
+        self.memory_budget_bytes = memory_budget_bytes
+        self.last_sweep_stats = {}
+
+    @staticmethod
+    def expand_grid(grid):
+        """
+        Список конфигураций - словарей {имя: значение} для всех сочетаний значений сетки.
+        Для наборов источников в конфигурацию записывается номер набора в списке сетки
+        (ключ 'light_sources_index'), чтобы подписи оставались короткими.
+        """
+        unknown = set(grid) - set(SWEEP_PARAMS)
+        if unknown:
+            raise ValueError(f"Неизвестные параметры перебора: {', '.join(sorted(unknown))}.")
+        names = list(grid)
+        value_lists = []
+        for name in names:
+            values = list(grid[name])
+            if not values:
+                raise ValueError(f"Для параметра '{name}' не задано ни одного значения.")
+            value_lists.append(range(len(values)) if name == "light_sources_data_mm" else values)
+
+        configurations = []
+        for combination in itertools.product(*value_lists):
+            configuration = {}
+            for name, value in zip(names, combination):
+                if name == "light_sources_data_mm":
+                    configuration["light_sources_index"] = value
+                else:
+                    configuration[name] = float(value)
+            configurations.append(configuration)
+        return configurations
+
+    def run(
+            self,
+            scene_params,
+            grid,
+            output="stack",
+            culling=True,
+            out=None
+    ):
+        """
+        scene_params - аргументы calculate_brightness (словарь); параметры, не входящие
+        в сетку, берутся из него. grid - {имя из SWEEP_PARAMS: список значений}.
+        out - необязательный массив float32 (K, H, W) для стопки (например, np.memmap).
+
+        Возвращает словарь:
+            'configurations' - список конфигураций (см. expand_grid);
+            'summary' - список строк сводной таблицы (конфигурация и SUMMARY_COLUMNS);
+            'images' - стопка (K, H, W), только при output='stack'.
+        """
+        if output not in ("stack", "summary"):
+            raise ValueError("Параметр 'output' должен быть 'stack' или 'summary'.")
+        configurations = self.expand_grid(grid)
+        light_sets = [
+            np.array(lights, dtype=np.float64).reshape(-1, 4)
+            for lights in grid.get("light_sources_data_mm", [scene_params["light_sources_data_mm"]])
+        ]
+
+        calculator = self.calculator
+        geometry_args = (
+            scene_params["screen_width_mm"], scene_params["screen_height_mm"],
+            scene_params["img_width_res"], scene_params["img_height_res"],
+            scene_params["observer_pos_mm"],
+            scene_params["sphere_center_mm"], scene_params["sphere_radius_mm"],
+        )
+        scene = calculator._prepare_scene(*geometry_args, light_sets[0])
+        gbuffer, gbuffer_reused = calculator._get_gbuffer(
+            scene, calculator._geometry_key(*geometry_args, culling), culling
+        )
+        image_shape = (scene_params["img_height_res"], scene_params["img_width_res"])
+
+        # Значения параметров конфигураций (K,) - недостающие берутся из сцены
+        def column(name):
+            return np.array([configuration.get(name, scene_params[name]) for configuration in configurations],
+                            dtype=np.float64)
+
+        ambient, diffuse, specular, shininess = (
+            column("ambient_coeff"), column("diffuse_coeff"), column("specular_coeff"), column("shininess"))
+        light_indices = np.array([configuration.get("light_sources_index", 0) for configuration in configurations])
+
+        num_configurations = len(configurations)
+        num_points = len(gbuffer["pixel_rows"])
+        images = None
+        if output == "stack":
+            stack_shape = (num_configurations,) + image_shape
+            if out is None:
+                images = np.zeros(stack_shape, dtype=np.float32)
+            else:
+                if out.shape != stack_shape:
+                    raise ValueError(f"Массив для стопки должен иметь форму {stack_shape}.")
+                images = out
+                images[...] = 0.0
+
+        max_values = np.full(num_configurations, -np.inf)
+        min_values = np.full(num_configurations, np.inf)
+        sums = np.zeros(num_configurations)
+
+        for light_index, light_set in enumerate(light_sets):
+            selected = np.flatnonzero(light_indices == light_index)
+            if len(selected) == 0:
+                continue
+            light_pos_m = light_set[:, :3] / 1000.0
+            light_intensity_I0 = light_set[:, 3]
+            # Различные значения блеска этой группы и номер значения для каждой конфигурации
+            shininess_values, shininess_index = np.unique(shininess[selected], return_inverse=True)
+
+            for start, stop in self._point_chunks(num_points, len(light_set), len(selected), len(shininess_values)):
+                values = self._shade_chunk(
+                    gbuffer, start, stop, light_pos_m, light_intensity_I0, shininess_values, shininess_index,
+                    ambient[selected], diffuse[selected], specular[selected]
+                ).astype(np.float32)
+
+                max_values[selected] = np.maximum(max_values[selected], values.max(axis=1))
+                min_values[selected] = np.minimum(min_values[selected], values.min(axis=1))
+                sums[selected] += values.sum(axis=1, dtype=np.float64)
+                if images is not None:
+                    rows = gbuffer["pixel_rows"][start:stop]
+                    cols = gbuffer["pixel_cols"][start:stop]
+                    images[selected[:, np.newaxis], rows[np.newaxis, :], cols[np.newaxis, :]] = values
+
+        summary = []
+        for index, configuration in enumerate(configurations):
+            row = dict(configuration)
+            if num_points > 0:
+                row.update(max_brightness=float(max_values[index]), min_brightness=float(min_values[index]),
+                           mean_brightness=float(sums[index] / num_points))
+            else:
+                row.update(max_brightness=0.0, min_brightness=0.0, mean_brightness=0.0)
+            row["pixels_hit"] = num_points
+            summary.append(row)
+
+        self.last_sweep_stats = {
+            "configurations": num_configurations,
+            "light_sets": len(light_sets),
+            "pixels_hit": num_points,
+            "gbuffer_reused": gbuffer_reused,
+        }
+        result = {"configurations": configurations, "summary": summary}
+        if images is not None:
+            result["images"] = images
+        return result
+
+    def _point_chunks(self, num_points, num_lights, num_configurations, num_shininess):
+        """
+        Границы порций точек: на точку приходятся множители источников
+        (SHADING_BYTES_PER_PAIR на источник), зеркальные суммы по каждому значению
+        блеска и значения всех конфигураций.
+        """
+        bytes_per_point = (num_lights * self.calculator.SHADING_BYTES_PER_PAIR
+                           + (num_shininess + num_configurations) * self.BYTES_PER_CONFIGURATION)
+        chunk_size = max(1, int(self.memory_budget_bytes // bytes_per_point))
+        for start in range(0, num_points, chunk_size):
+            yield start, min(start + chunk_size, num_points)
+
+    def _shade_chunk(
+            self,
+            gbuffer, start, stop,
+            light_pos_m, light_intensity_I0,
+            shininess_values, shininess_index,
+            ambient, diffuse, specular
+    ):
+        """
+        Яркость точек порции для группы конфигураций с общим набором источников: (K, порция).
+        Диффузная сумма D = sum_i I0_i * max(0, N·L_i) / d_i^2 общая для всех конфигураций,
+        зеркальная S_n = sum_i I0_i * max(0, N·H_i)^n / d_i^2 - по одной на значение блеска.
+        """
+        diffuse_factor, specular_factor, attenuation = self.calculator._light_factors(
+            gbuffer["points_m"][start:stop],
+            gbuffer["normals"][start:stop],
+            gbuffer["view_vectors"][start:stop],
+            light_pos_m
+        )
+        diffuse_sum = (diffuse_factor * attenuation) @ light_intensity_I0
+        # (B, порция, N) не создается: степени считаются по одному значению блеска
+        specular_sums = np.empty((len(shininess_values), stop - start))
+        for index, value in enumerate(shininess_values):
+            specular_sums[index] = ((specular_factor ** value) * attenuation) @ light_intensity_I0
+
+        values = specular[:, np.newaxis] * specular_sums[shininess_index]
+        values += diffuse[:, np.newaxis] * diffuse_sum[np.newaxis, :]
+        values += ambient[:, np.newaxis] * self.calculator.BASE_AMBIENT_LIGHTING
+        return values
+
+
+def format_summary(summary):
+    """Сводная таблица в виде текста с выровненными столбцами."""
+    if not summary:
+        return ""
+    columns = list(summary[0])
+    cells = [[f"{row[name]:.6g}" if isinstance(row[name], float) else str(row[name]) for name in columns]
+             for row in summary]
+    widths = [max(len(name), *(len(line[i]) for line in cells)) for i, name in enumerate(columns)]
+    lines = ["  ".join(name.rjust(width) for name, width in zip(columns, widths))]
+    lines.extend("  ".join(cell.rjust(width) for cell, width in zip(line, widths)) for line in cells)
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    from render_cli import load_scene_file, parse_scene
+
+    parser = argparse.ArgumentParser(description="Перебор параметров материала и освещения сферы.")
+    parser.add_argument("scene_file", help="Файл сцены (.json или .toml); берется первая сцена")
+    parser.add_argument("--ambient", type=float, nargs="+", help="Значения Ka")
+    parser.add_argument("--diffuse", type=float, nargs="+", help="Значения Kd")
+    parser.add_argument("--specular", type=float, nargs="+", help="Значения Ks")
+    parser.add_argument("--shininess", type=float, nargs="+", help="Значения блеска n")
+    parser.add_argument("--light-sets", help="Файл JSON со списком наборов источников [[xL, yL, zL, I0], ...]")
+    parser.add_argument("--csv", help="Записать сводную таблицу в файл CSV")
+    parser.add_argument("--stack", help="Записать стопку изображений (K, H, W) в файл .npy")
+    parser.add_argument("--no-culling", action="store_true", help="Трассировать все пиксели кадра")
+    args = parser.parse_args(argv)
+
+    try:
+        _, scene_params = parse_scene(load_scene_file(args.scene_file)[0], "scene")
+        grid = {}
+        for name, values in (("ambient_coeff", args.ambient), ("diffuse_coeff", args.diffuse),
+                             ("specular_coeff", args.specular), ("shininess", args.shininess)):
+            if values:
+                grid[name] = values
+        if args.light_sets:
+            with open(args.light_sets, "r", encoding="utf-8") as f:
+                grid["light_sources_data_mm"] = json.load(f)
+        if not grid:
+            raise ValueError("Не задано ни одного перебираемого параметра.")
+
+        sweep = ParameterSweep()
+        out = None
+        if args.stack:
+            num_configurations = len(sweep.expand_grid(grid))
+            out = np.lib.format.open_memmap(
+                args.stack, mode="w+", dtype=np.float32,
+                shape=(num_configurations, scene_params["img_height_res"], scene_params["img_width_res"]))
+        result = sweep.run(scene_params, grid, output="stack" if out is not None else "summary",
+                           culling=not args.no_culling, out=out)
+        if out is not None:
+            out.flush()
+    except (OSError, ValueError) as e:
+        print(f"Ошибка: {e}", file=sys.stderr)
+        return 2
+
+    print(format_summary(result["summary"]))
+    if args.csv:
+        with open(args.csv, "w", encoding="utf-8", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(result["summary"][0]))
+            writer.writeheader()
+            writer.writerows(result["summary"])
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,109 @@
+import functools
+import json
+import threading
+import time
+from contextlib import nullcontext
+
+# Общий пустой контекст для выключенного профилирования: без выделения памяти и замеров
+_NULL_STAGE = nullcontext()
+
+
+class StageTimer:
+    """
+    Счетчики времени по этапам расчета и отображения и произвольные счетчики событий.
+
+    Для каждого этапа накапливаются число вызовов, суммарное и наибольшее время.
+    Этапы могут быть вложены (например, трассировка лучей подвыборок входит и в
+    'antialiasing', и в 'ray_generation'), поэтому их времена не обязаны складываться
+    в общее. Выключенный таймер (enabled=False) ничего не замеряет: stage возвращает
+    общий пустой контекст, а count и add сразу возвращаются.
+    Запись счетчиков защищена блокировкой - расчет идет в отдельном потоке.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._stages = {}
+        self._counters = {}
+
+    def stage(self, name):
+        """Контекст замера этапа: with timer.stage('shading'): ..."""
+        if not self.enabled:
+            return _NULL_STAGE
+        return _Stage(self, name)
+
+    def add(self, name, seconds):
+        if not self.enabled:
+            return
+        with self._lock:
+            stage = self._stages.setdefault(name, {"calls": 0, "total_seconds": 0.0, "max_seconds": 0.0})
+            stage["calls"] += 1
+            stage["total_seconds"] += seconds
+            stage["max_seconds"] = max(stage["max_seconds"], seconds)
+
+    def count(self, name, amount=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def reset(self):
+        with self._lock:
+            self._stages.clear()
+            self._counters.clear()
+
+    def report(self):
+        """Снимок счетчиков: {'stages': {этап: {...}}, 'counters': {имя: значение}}."""
+        with self._lock:
+            stages = {}
+            for name, stage in self._stages.items():
+                stages[name] = dict(stage, mean_seconds=stage["total_seconds"] / stage["calls"])
+            return {"stages": stages, "counters": dict(self._counters)}
+
+    def format_text(self):
+        """Отчет в виде строк для панели статистики (этапы в порядке первого вызова)."""
+        report = self.report()
+        lines = []
+        for name, stage in report["stages"].items():
+            lines.append(f"  {name}: {stage['total_seconds'] * 1000:.2f} мс "
+                         f"({stage['calls']} вызовов, макс. {stage['max_seconds'] * 1000:.2f} мс)")
+        for name, value in report["counters"].items():
+            lines.append(f"  {name}: {value}")
+        return "\n".join(lines)
+
+    def save_json(self, file_path):
+        with open(file_path, "w", encoding="utf-8") as f:
+            json.dump(self.report(), f, ensure_ascii=False, indent=2)
+
+
+class _Stage:
+    __slots__ = ("timer", "name", "start")
+
+    def __init__(self, timer, name):
+        self.timer = timer
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.timer.add(self.name, time.perf_counter() - self.start)
+        return False
+
+
+def timed_stage(name):
+    """
+    Декоратор метода: время вызова записывается в этап name таймера self.timer.
+    При выключенном таймере метод вызывается напрямую.
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            timer = self.timer
+            if not timer.enabled:
+                return method(self, *args, **kwargs)
+            with timer.stage(name):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,222 @@
+import hashlib
+import json
+import os
+import zipfile
+from collections import OrderedDict
+
+import numpy as np
+
+
+class RenderCache:
+    """
+    Кэш готовых буферов яркости по содержимому запроса.
+
+    Ключ - SHA-256 от всех входных параметров расчета (make_key), поэтому одинаковые
+    запросы (значения по умолчанию GUI, общие пресеты) находят результат независимо от
+    того, каким способом заданы числа (список, кортеж, массив). Вместе с буфером может
+    храниться маска попаданий в сферу (упакованная по битам), чтобы при попадании
+    не трассировать кадр заново. Два уровня:
+      - в памяти: LRU не больше memory_max_bytes (самая новая запись хранится всегда);
+      - на диске: файлы <ключ>.npz в cache_dir общим объемом не больше disk_max_bytes,
+        при превышении удаляются давно не использованные (по времени изменения файла,
+        которое обновляется при каждом попадании). Диск переживает перезапуск программы.
+    cache_dir=None - только уровень в памяти.
+    """
+
+    # Меняется при изменении формата записей или расчета, чтобы старые записи не находились
+    FORMAT_VERSION = 2
+    MEMORY_MAX_BYTES = 256 * 1024 * 1024
+    DISK_MAX_BYTES = 1024 * 1024 * 1024
+
+    def __init__(self, cache_dir=None, memory_max_bytes=MEMORY_MAX_BYTES, disk_max_bytes=DISK_MAX_BYTES):
+        self.cache_dir = cache_dir
+        self.memory_max_bytes = memory_max_bytes
+        self.disk_max_bytes = disk_max_bytes
+        self._memory = OrderedDict()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.bytes_saved = 0
+        self.seconds_saved = 0.0
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+
+    @staticmethod
+    def default_cache_dir():
+        """Каталог кэша пользователя: $XDG_CACHE_HOME/sphere_brightness или ~/.cache/sphere_brightness."""
+        base_dir = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+        return os.path.join(base_dir, "sphere_brightness")
+
+    @classmethod
+    def make_key(cls, inputs):
+        """
+        Ключ для словаря входных параметров {имя: значение}. Числа, списки и массивы
+        хешируются как массивы float64 вместе с формой, строки и None - как текст.
+        """
+        digest = hashlib.sha256(f"render_cache_v{cls.FORMAT_VERSION}".encode("ascii"))
+        for name in sorted(inputs):
+            value = inputs[name]
+            digest.update(b"\0" + name.encode("utf-8") + b"\0")
+            if value is None or isinstance(value, str):
+                digest.update(repr(value).encode("utf-8"))
+            else:
+                array = np.ascontiguousarray(np.asarray(value, dtype=np.float64))
+                digest.update(repr(array.shape).encode("ascii"))
+                digest.update(array.tobytes())
+        return digest.hexdigest()
+
+    def _disk_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.npz")
+
+    def get(self, key):
+        """
+        Возвращает (копия буфера, метаданные, маска попаданий или None) или None,
+        если записи нет ни на одном уровне.
+        """
+        entry = self._memory.get(key)
+        if entry is not None:
+            self._memory.move_to_end(key)
+            self.memory_hits += 1
+        else:
+            entry = self._load_from_disk(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._store_in_memory(key, entry)
+        buffer, metadata, hit_mask_bits = entry
+        self.bytes_saved += buffer.nbytes
+        self.seconds_saved += metadata.get("render_seconds", 0.0)
+        hit_mask = None
+        if hit_mask_bits is not None:
+            hit_mask = np.unpackbits(hit_mask_bits, count=buffer.size).reshape(buffer.shape).view(bool)
+        return buffer.copy(), dict(metadata), hit_mask
+
+    def put(self, key, buffer, metadata=None, hit_mask=None):
+        """
+        Сохраняет буфер, его метаданные (словарь, сериализуемый в JSON) и, если задана,
+        маску попаданий той же формы на оба уровня.
+        """
+        buffer = np.array(buffer, copy=True)
+        buffer.flags.writeable = False
+        hit_mask_bits = None
+        if hit_mask is not None:
+            if np.shape(hit_mask) != buffer.shape:
+                raise ValueError("Маска попаданий должна иметь ту же форму, что и буфер яркости.")
+            hit_mask_bits = np.packbits(np.asarray(hit_mask, dtype=bool), axis=None)
+            hit_mask_bits.flags.writeable = False
+        entry = (buffer, dict(metadata or {}), hit_mask_bits)
+        self._store_in_memory(key, entry)
+        if self.cache_dir is not None:
+            self._save_to_disk(key, entry)
+
+    def _store_in_memory(self, key, entry):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > 1 and self.memory_bytes() > self.memory_max_bytes:
+            self._memory.popitem(last=False)
+
+    def _load_from_disk(self, key):
+        if self.cache_dir is None:
+            return None
+        path = self._disk_path(key)
+        try:
+            with np.load(path, allow_pickle=False) as data:
+                buffer = data["brightness"]
+                metadata = json.loads(str(data["metadata"]))
+                hit_mask_bits = data["hit_mask_bits"] if "hit_mask_bits" in data.files else None
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile):
+            # Поврежденная (например, недописанная) запись удаляется и считается промахом
+            self._remove_file(path)
+            return None
+        # Время изменения - время последнего использования для вытеснения
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        buffer.flags.writeable = False
+        return buffer, metadata, hit_mask_bits
+
+    def _save_to_disk(self, key, entry):
+        buffer, metadata, hit_mask_bits = entry
+        path = self._disk_path(key)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        arrays = {"brightness": buffer, "metadata": np.array(json.dumps(metadata, default=_json_default))}
+        if hit_mask_bits is not None:
+            arrays["hit_mask_bits"] = hit_mask_bits
+        with open(temp_path, "wb") as f:
+            np.savez(f, **arrays)
+        # Запись появляется целиком: читатель никогда не увидит недописанный файл
+        os.replace(temp_path, path)
+        self._evict_disk(keep=path)
+
+    def _disk_entries(self):
+        """Файлы записей на диске: список (время изменения, размер, путь)."""
+        entries = []
+        for item in os.scandir(self.cache_dir):
+            if item.name.endswith(".npz") and item.is_file():
+                try:
+                    info = item.stat()
+                except OSError:
+                    continue
+                entries.append((info.st_mtime, info.st_size, item.path))
+        return entries
+
+    def _evict_disk(self, keep=None):
+        entries = sorted(self._disk_entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.disk_max_bytes:
+                break
+            if path == keep:
+                continue
+            self._remove_file(path)
+            total -= size
+
+    @staticmethod
+    def _remove_file(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def memory_bytes(self):
+        return sum(buffer.nbytes + (0 if bits is None else bits.nbytes)
+                   for buffer, _, bits in self._memory.values())
+
+    def disk_bytes(self):
+        if self.cache_dir is None:
+            return 0
+        return sum(size for _, size, _ in self._disk_entries())
+
+    def stats(self):
+        """Счетчики кэша: попадания по уровням, промахи, доля попаданий, сэкономленные байты и время."""
+        hits = self.memory_hits + self.disk_hits
+        requests = hits + self.misses
+        return {
+            "render_cache_memory_hits": self.memory_hits,
+            "render_cache_disk_hits": self.disk_hits,
+            "render_cache_misses": self.misses,
+            "render_cache_hit_rate": hits / requests if requests else 0.0,
+            "render_cache_bytes_saved": self.bytes_saved,
+            "render_cache_seconds_saved": self.seconds_saved,
+            "render_cache_memory_entries": len(self._memory),
+            "render_cache_memory_bytes": self.memory_bytes(),
+            "render_cache_disk_bytes": self.disk_bytes(),
+        }
+
+    def clear(self, disk=True):
+        """Очищает уровень в памяти и (если disk) файлы записей на диске."""
+        self._memory.clear()
+        if disk and self.cache_dir is not None:
+            for _, _, path in self._disk_entries():
+                self._remove_file(path)
+
+
+def _json_default(value):
+    # Числа NumPy в метаданных (счетчики статистики) сохраняются как обычные числа
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError(f"Значение типа {type(value).__name__} не сериализуется в JSON.")
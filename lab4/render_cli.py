@@ -0,0 +1,268 @@
+"""
+Пакетный расчет яркости сферы без графического интерфейса.
+
+Сцены описываются в файлах JSON или TOML. Файл содержит либо одну сцену, либо список
+сцен 'scenes' и необязательный раздел 'defaults' с общими для всех сцен значениями:
+
+    [defaults]
+    screen_width_mm = 1000
+    screen_height_mm = 1000
+    img_width_res = 800
+    img_height_res = 800
+
+    [[scenes]]
+    name = "two_lights"
+    observer_pos_mm = [0, 0, -1500]
+    sphere_center_mm = [0, 0, 300]
+    sphere_radius_mm = 250
+    lights = [[800, 100, 0, 6000], [-1000, 0, -400, 4000]]   # [xL, yL, zL, I0], любое число
+    ambient_coeff = 0.35
+    diffuse_coeff = 1.0
+    specular_coeff = 0.9
+    shininess = 180
+
+Для каждой сцены записываются <name>.npy (буфер яркости float32) и <name>.png,
+а в выходной каталог - manifest.json со временем расчета и статистикой каждой сцены.
+Все сцены рассчитываются одним калькулятором, поэтому сцены с одинаковой (с точностью
+до переноса всей сцены) геометрией берут ее из кэша G-буферов.
+
+С ключом --cache-dir готовые буферы сохраняются в кэше расчетов (render_cache.RenderCache)
+и при повторном запуске с теми же сценами читаются с диска вместо расчета.
+
+С ключом --out-of-core кадр рассчитывается плитками прямо в файл <name>.npy,
+отображаемый в память, а PNG записывается потоково (для кадров 16k x 16k и больше).
+
+Пример запуска:
+    python render_cli.py scenes.toml other.json -o renders
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tomllib
+
+import numpy as np
+from PIL import Image
+
+from out_of_core import OutOfCoreRenderer
+from render_cache import RenderCache
+from sphere_brightness_calculator import SphereBrightnessCalculator
+
+# Обязательные параметры сцены (аргументы calculate_brightness)
+REQUIRED_SCENE_KEYS = (
+    "screen_width_mm", "screen_height_mm",
+    "img_width_res", "img_height_res",
+    "observer_pos_mm",
+    "sphere_center_mm", "sphere_radius_mm",
+    "lights",
+    "ambient_coeff", "diffuse_coeff", "specular_coeff", "shininess",
+)
+# Необязательные параметры расчета
+OPTIONAL_SCENE_KEYS = ("name", "culling", "aa_samples", "aa_contrast_threshold", "aa_seed")
+
+
+def load_scene_file(file_path):
+    """Читает файл сцен (.json или .toml) и возвращает список словарей сцен."""
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension == ".json":
+        with open(file_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    elif extension == ".toml":
+        with open(file_path, "rb") as f:
+            data = tomllib.load(f)
+    else:
+        raise ValueError(f"Неподдерживаемый формат файла сцен: {file_path} (ожидается .json или .toml).")
+
+    if "scenes" not in data:
+        return [data]
+    defaults = data.get("defaults", {})
+    scenes = []
+    for scene in data["scenes"]:
+        merged = dict(defaults)
+        merged.update(scene)
+        scenes.append(merged)
+    return scenes
+
+
+def parse_scene(scene, default_name):
+    """Проверяет словарь сцены и приводит его к аргументам calculate_brightness."""
+    missing = [key for key in REQUIRED_SCENE_KEYS if key not in scene]
+    if missing:
+        raise ValueError(f"Сцена '{scene.get('name', default_name)}': не заданы параметры {', '.join(missing)}.")
+    unknown = set(scene) - set(REQUIRED_SCENE_KEYS) - set(OPTIONAL_SCENE_KEYS)
+    if unknown:
+        raise ValueError(
+            f"Сцена '{scene.get('name', default_name)}': неизвестные параметры {', '.join(sorted(unknown))}.")
+
+    name = str(scene.get("name", default_name))
+    lights = np.asarray(scene["lights"], dtype=np.float64)
+    if lights.ndim != 2 or lights.shape[1] != 4:
+        raise ValueError(f"Сцена '{name}': источники света задаются списком [xL, yL, zL, I0].")
+    if len(lights) == 0:
+        raise ValueError(f"Сцена '{name}': должен быть задан хотя бы один источник света.")
+    if np.any(lights[:, 3] < 0):
+        raise ValueError(f"Сцена '{name}': сила света I0 не может быть отрицательной.")
+    if scene["sphere_radius_mm"] <= 0:
+        raise ValueError(f"Сцена '{name}': радиус сферы должен быть положительным.")
+    if scene["img_width_res"] <= 0 or scene["img_height_res"] <= 0:
+        raise ValueError(f"Сцена '{name}': разрешение изображения должно быть положительным.")
+
+    params = {
+        "screen_width_mm": float(scene["screen_width_mm"]),
+        "screen_height_mm": float(scene["screen_height_mm"]),
+        "img_width_res": int(scene["img_width_res"]),
+        "img_height_res": int(scene["img_height_res"]),
+        "observer_pos_mm": np.asarray(scene["observer_pos_mm"], dtype=np.float64),
+        "sphere_center_mm": np.asarray(scene["sphere_center_mm"], dtype=np.float64),
+        "sphere_radius_mm": float(scene["sphere_radius_mm"]),
+        "light_sources_data_mm": list(lights),
+        "ambient_coeff": float(scene["ambient_coeff"]),
+        "diffuse_coeff": float(scene["diffuse_coeff"]),
+        "specular_coeff": float(scene["specular_coeff"]),
+        "shininess": float(scene["shininess"]),
+    }
+    for key in ("culling", "aa_samples", "aa_contrast_threshold", "aa_seed"):
+        if key in scene:
+            params[key] = scene[key]
+    return name, params
+
+
+class BatchRenderer:
+    """
+    Пакетный расчет сцен одним (прогретым) калькулятором с записью результатов на диск.
+    out_of_core_tile_size - если задан, кадры рассчитываются вне памяти (OutOfCoreRenderer)
+    плитками такого размера; буфер .npy при этом записывается всегда.
+    """
+
+    def __init__(self, output_dir, calculator=None, write_npy=True, write_png=True, out_of_core_tile_size=None):
+        self.output_dir = output_dir
+        self.calculator = calculator if calculator is not None else SphereBrightnessCalculator()
+        self.write_npy = write_npy
+        self.write_png = write_png
+        self.out_of_core = None
+        if out_of_core_tile_size is not None:
+            self.out_of_core = OutOfCoreRenderer(self.calculator, out_of_core_tile_size)
+        self.manifest = []
+
+    def _manifest_entry(self, name, params, source, render_seconds, write_seconds, max_brightness, outputs,
+                        render_stats):
+        entry = {
+            "name": name,
+            "source": source,
+            "resolution": [params["img_width_res"], params["img_height_res"]],
+            "lights": len(params["light_sources_data_mm"]),
+            "render_seconds": render_seconds,
+            "write_seconds": write_seconds,
+            "max_brightness": max_brightness,
+            "outputs": outputs,
+            "stats": {key: (value.item() if isinstance(value, np.generic) else value)
+                      for key, value in render_stats.items()},
+        }
+        self.manifest.append(entry)
+        return entry
+
+    def _render_scene_out_of_core(self, name, params, source):
+        render_params = {key: value for key, value in params.items()
+                         if key not in ("aa_samples", "aa_contrast_threshold", "aa_seed")}
+        outputs = {"npy": os.path.join(self.output_dir, f"{name}.npy")}
+
+        start = time.perf_counter()
+        max_brightness = self.out_of_core.render_to_file(outputs["npy"], **render_params)
+        render_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        if self.write_png:
+            outputs["png"] = os.path.join(self.output_dir, f"{name}.png")
+            self.out_of_core.normalize_to_image(outputs["npy"], outputs["png"], max_brightness=max_brightness)
+        write_seconds = time.perf_counter() - start
+
+        return self._manifest_entry(name, params, source, render_seconds, write_seconds, max_brightness,
+                                    outputs, self.out_of_core.last_render_stats)
+
+    def render_scene(self, name, params, source=None):
+        """Рассчитывает одну сцену, записывает результаты и возвращает запись манифеста."""
+        if self.out_of_core is not None:
+            return self._render_scene_out_of_core(name, params, source)
+
+        start = time.perf_counter()
+        brightness_buffer = self.calculator.calculate_brightness(**params)
+        render_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        outputs = {}
+        if self.write_npy:
+            outputs["npy"] = os.path.join(self.output_dir, f"{name}.npy")
+            np.save(outputs["npy"], brightness_buffer)
+        if self.write_png:
+            outputs["png"] = os.path.join(self.output_dir, f"{name}.png")
+            image = self.calculator.normalize_brightness_to_image(brightness_buffer)
+            Image.fromarray(image, mode="L").save(outputs["png"])
+        write_seconds = time.perf_counter() - start
+
+        return self._manifest_entry(name, params, source, render_seconds, write_seconds,
+                                    float(np.max(brightness_buffer)), outputs, self.calculator.last_render_stats)
+
+    def render_files(self, scene_files):
+        """Рассчитывает все сцены из списка файлов; имена сцен должны быть уникальны."""
+        os.makedirs(self.output_dir, exist_ok=True)
+        jobs = []
+        names = set()
+        # Сначала читаем и проверяем все файлы, чтобы ошибка в описании не прерывала
+        # пакет на середине
+        for file_path in scene_files:
+            base_name = os.path.splitext(os.path.basename(file_path))[0]
+            scenes = load_scene_file(file_path)
+            for index, scene in enumerate(scenes):
+                default_name = base_name if len(scenes) == 1 else f"{base_name}_{index:03d}"
+                name, params = parse_scene(scene, default_name)
+                if self.out_of_core is not None and params.get("aa_samples", 0) > 1:
+                    raise ValueError(f"Сцена '{name}': сглаживание не поддерживается при расчете вне памяти.")
+                if name in names:
+                    raise ValueError(f"Имя сцены '{name}' встречается несколько раз.")
+                names.add(name)
+                jobs.append((name, params, file_path))
+
+        for name, params, file_path in jobs:
+            yield self.render_scene(name, params, source=file_path)
+
+    def write_manifest(self, total_seconds=None):
+        manifest_path = os.path.join(self.output_dir, "manifest.json")
+        with open(manifest_path, "w", encoding="utf-8") as f:
+            json.dump({"total_seconds": total_seconds, "scenes": self.manifest}, f, ensure_ascii=False, indent=2)
+        return manifest_path
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Пакетный расчет яркости сферы по файлам сцен JSON/TOML.")
+    parser.add_argument("scene_files", nargs="+", help="Файлы сцен (.json или .toml)")
+    parser.add_argument("-o", "--output-dir", default="renders", help="Каталог для результатов")
+    parser.add_argument("--no-npy", action="store_true", help="Не сохранять буферы яркости .npy")
+    parser.add_argument("--no-png", action="store_true", help="Не сохранять изображения .png")
+    parser.add_argument("--out-of-core", action="store_true",
+                        help="Рассчитывать плитками в файл .npy, отображаемый в память")
+    parser.add_argument("--tile-size", type=int, default=OutOfCoreRenderer.DEFAULT_TILE_SIZE,
+                        help="Размер плитки для --out-of-core")
+    parser.add_argument("--cache-dir", help="Каталог кэша расчетов (повторные сцены берутся с диска)")
+    args = parser.parse_args(argv)
+
+    calculator = SphereBrightnessCalculator(
+        render_cache=RenderCache(cache_dir=args.cache_dir) if args.cache_dir else None)
+    renderer = BatchRenderer(args.output_dir, calculator=calculator,
+                             write_npy=not args.no_npy, write_png=not args.no_png,
+                             out_of_core_tile_size=args.tile_size if args.out_of_core else None)
+    start = time.perf_counter()
+    try:
+        for entry in renderer.render_files(args.scene_files):
+            print(f"{entry['name']}: {entry['render_seconds']:.3f} с расчет, "
+                  f"{entry['write_seconds']:.3f} с запись")
+    except (ValueError, OSError, tomllib.TOMLDecodeError, json.JSONDecodeError) as e:
+        print(f"Ошибка: {e}", file=sys.stderr)
+        return 1
+    manifest_path = renderer.write_manifest(time.perf_counter() - start)
+    print(f"Манифест: {manifest_path}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
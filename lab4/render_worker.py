@@ -0,0 +1,81 @@
+import threading
+
+from PyQt6.QtCore import QThread, pyqtSignal
+
+from sphere_brightness_calculator import SphereBrightnessCalculator, RenderCancelled
+
+
+class RenderJob(QThread):
+    """
+    Расчет яркости сферы в отдельном потоке, чтобы окно не замирало на время трассировки.
+
+    Сначала рассчитывается черновой кадр уменьшенного разрешения (не больше
+    PREVIEW_MAX_SIDE пикселей по большей стороне, без сглаживания) и отправляется
+    сигналом preview_ready, затем полный кадр рассчитывается полосами строк с сигналом
+    progress(rows_done, rows_total) после каждой полосы. Готовый кадр, статистика и
+    маска попаданий в сферу отправляются сигналом completed, ошибка - failed, отмена - cancelled.
+
+    params - аргументы calculate_brightness в виде словаря.
+    render_lock - общая для всех заданий блокировка калькулятора: новое задание ждет,
+    пока отмененное предыдущее не дойдет до проверки флага отмены и не освободит его.
+    """
+
+    PREVIEW_MAX_SIDE = 160
+
+    preview_ready = pyqtSignal(object)
+    progress = pyqtSignal(int, int)
+    completed = pyqtSignal(object, object, object)
+    failed = pyqtSignal(str)
+    cancelled = pyqtSignal()
+
+    def __init__(self, calculator, render_lock, params, parent=None):
+        super().__init__(parent)
+        self.calculator = calculator
+        self.render_lock = render_lock
+        self.params = params
+        self._cancel_event = threading.Event()
+
+    def cancel(self):
+        """Запрашивает отмену; расчет прервется на ближайшей границе полосы строк."""
+        self._cancel_event.set()
+
+    def is_cancelled(self):
+        return self._cancel_event.is_set()
+
+    def preview_params(self):
+        """Параметры чернового кадра: тот же экран с уменьшенным разрешением, без сглаживания."""
+        img_width_res, img_height_res = self.params["img_width_res"], self.params["img_height_res"]
+        scale = -(-max(img_width_res, img_height_res) // self.PREVIEW_MAX_SIDE)
+        if scale <= 1:
+            return None
+        preview = dict(self.params)
+        preview["img_width_res"] = max(1, img_width_res // scale)
+        preview["img_height_res"] = max(1, img_height_res // scale)
+        preview["aa_samples"] = 0
+        return preview
+
+    def run(self):
+        try:
+            preview_params = self.preview_params()
+            if preview_params is not None:
+                # Отдельный калькулятор, чтобы черновой кадр не вытеснил G-буфер полного
+                preview_buffer = SphereBrightnessCalculator().calculate_brightness(
+                    **preview_params, cancel_event=self._cancel_event
+                )
+                self.preview_ready.emit(preview_buffer)
+
+            with self.render_lock:
+                brightness_buffer = self.calculator.calculate_brightness(
+                    **self.params,
+                    progress_callback=self.progress.emit,
+                    cancel_event=self._cancel_event
+                )
+                render_stats = dict(self.calculator.last_render_stats)
+                hit_mask = self.calculator.last_hit_mask
+            self.completed.emit(brightness_buffer, render_stats, hit_mask)
+        except RenderCancelled:
+            self.cancelled.emit()
+        except ValueError as e:
+            self.failed.emit(f"Произошла ошибка при расчете: {e}")
+        except Exception as e:
+            self.failed.emit(f"Произошла непредвиденная ошибка: {e}")
@@ -0,0 +1,187 @@
+import os
+import queue
+import threading
+
+import numpy as np
+from PIL import Image
+
+from sphere_brightness_calculator import SphereBrightnessCalculator
+
+# Параметры calculate_brightness, которые могут меняться от кадра к кадру
+ANIMATED_PARAMS = (
+    "observer_pos_mm",
+    "sphere_center_mm", "sphere_radius_mm",
+    "light_sources_data_mm",
+    "ambient_coeff", "diffuse_coeff", "specular_coeff", "shininess",
+)
+
+
+class KeyframePath:
+    """
+    Траектория параметров сцены, заданная ключевыми кадрами.
+
+    keyframes - список словарей с обязательным ключом 'frame' (номер кадра) и любыми
+    параметрами из ANIMATED_PARAMS. Между ключевыми кадрами значения интерполируются
+    линейно, до первого и после последнего ключа - остаются постоянными. Параметр,
+    не заданный в каком-либо ключе, берется из соседних ключей, где он задан.
+    Для источников света количество источников должно совпадать во всех ключах.
+    """
+
+    def __init__(self, keyframes):
+        if not keyframes:
+            raise ValueError("Траектория должна содержать хотя бы один ключевой кадр.")
+        self.keyframes = sorted(keyframes, key=lambda keyframe: keyframe["frame"])
+
+        for keyframe in self.keyframes:
+            unknown = set(keyframe) - set(ANIMATED_PARAMS) - {"frame"}
+            if unknown:
+                raise ValueError(f"Неизвестные параметры ключевого кадра: {', '.join(sorted(unknown))}.")
+
+        # Для каждого параметра - номера кадров и значения ключей, где он задан
+        self._tracks = {}
+        for name in ANIMATED_PARAMS:
+            frames = [keyframe["frame"] for keyframe in self.keyframes if name in keyframe]
+            values = [np.asarray(keyframe[name], dtype=np.float64)
+                      for keyframe in self.keyframes if name in keyframe]
+            if not frames:
+                continue
+            if any(value.shape != values[0].shape for value in values):
+                raise ValueError(f"Параметр '{name}' должен иметь одинаковую форму во всех ключевых кадрах.")
+            self._tracks[name] = (np.array(frames, dtype=np.float64), np.stack(values))
+
+    @property
+    def last_frame(self):
+        return self.keyframes[-1]["frame"]
+
+    def frame_params(self, frame_index):
+        """Значения анимируемых параметров для кадра frame_index."""
+        params = {}
+        for name, (frames, values) in self._tracks.items():
+            position = np.searchsorted(frames, frame_index, side="right")
+            if position == 0:
+                value = values[0]
+            elif position == len(frames):
+                value = values[-1]
+            else:
+                frame_before, frame_after = frames[position - 1], frames[position]
+                weight = (frame_index - frame_before) / (frame_after - frame_before)
+                value = (1.0 - weight) * values[position - 1] + weight * values[position]
+            params[name] = value if value.ndim > 0 else float(value)
+        return params
+
+
+class SequenceRenderer:
+    """
+    Потоковый расчет последовательностей кадров (анимация наблюдателя, источников, сферы).
+
+    Кадры рассчитываются лениво генератором iter_frames и сразу записываются на диск
+    (PNG-последовательность или стопка .npy), поэтому память не растет с числом кадров.
+    prefetch_depth > 0 - кадры рассчитываются в фоновом потоке с опережением не более
+    чем на prefetch_depth кадров, пока вызывающий поток кодирует и записывает предыдущие.
+    Один калькулятор используется для всех кадров, поэтому при неизменной геометрии
+    (или при переносе всей сцены) кадры берут ее из кэша G-буферов.
+    """
+
+    def __init__(self, calculator=None, prefetch_depth=2):
+        if prefetch_depth < 0:
+            raise ValueError("Глубина опережения (prefetch_depth) не может быть отрицательной.")
+        self.calculator = calculator if calculator is not None else SphereBrightnessCalculator()
+        self.prefetch_depth = prefetch_depth
+
+    def _render_frame(self, static_params, path, frame_index):
+        params = dict(static_params)
+        params.update(path.frame_params(frame_index))
+        return self.calculator.calculate_brightness(**params)
+
+    def iter_frames(self, static_params, path, num_frames=None):
+        """
+        Генератор кадров: возвращает пары (номер кадра, буфер яркости).
+
+        static_params - неизменные аргументы calculate_brightness (размеры экрана,
+        разрешение и т.п.) в виде словаря; анимируемые параметры берутся из path.
+        num_frames по умолчанию - до последнего ключевого кадра включительно.
+        """
+        if num_frames is None:
+            num_frames = int(path.last_frame) + 1
+
+        if self.prefetch_depth == 0:
+            for frame_index in range(num_frames):
+                yield frame_index, self._render_frame(static_params, path, frame_index)
+            return
+
+        frames = queue.Queue(maxsize=self.prefetch_depth)
+        stop_event = threading.Event()
+        finished = object()
+
+        def produce():
+            try:
+                for frame_index in range(num_frames):
+                    item = (frame_index, self._render_frame(static_params, path, frame_index))
+                    while not stop_event.is_set():
+                        try:
+                            frames.put(item, timeout=0.1)
+                            break
+                        except queue.Full:
+                            continue
+                    if stop_event.is_set():
+                        return
+                frames.put(finished)
+            except Exception as e:  # Передаем ошибку расчета в поток-потребитель
+                frames.put(e)
+
+        producer = threading.Thread(target=produce, name="sequence-renderer", daemon=True)
+        producer.start()
+        try:
+            while True:
+                item = frames.get()
+                if item is finished:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            # Генератор закрыт досрочно: останавливаем фоновый расчет
+            stop_event.set()
+            while producer.is_alive():
+                try:
+                    frames.get(timeout=0.1)
+                except queue.Empty:
+                    pass
+            producer.join()
+
+    def render_to_png_sequence(self, output_dir, static_params, path, num_frames=None,
+                               normalization_max=None, filename_pattern="frame_{:05d}.png"):
+        """
+        Записывает кадры в PNG-файлы output_dir/frame_00000.png, ...
+        normalization_max - общая яркость, соответствующая 255, для всех кадров
+        (без мерцания); None - каждый кадр нормируется по своему максимуму.
+        Возвращает список путей к файлам.
+        """
+        os.makedirs(output_dir, exist_ok=True)
+        paths = []
+        for frame_index, brightness_buffer in self.iter_frames(static_params, path, num_frames):
+            if normalization_max is None:
+                image = self.calculator.normalize_brightness_to_image(brightness_buffer)
+            else:
+                image = (np.clip(brightness_buffer / normalization_max, 0.0, 1.0) * 255).astype(np.uint8)
+            file_path = os.path.join(output_dir, filename_pattern.format(frame_index))
+            Image.fromarray(image, mode="L").save(file_path)
+            paths.append(file_path)
+        return paths
+
+    def render_to_npy_stack(self, file_path, static_params, path, num_frames=None):
+        """
+        Записывает кадры в один файл .npy формы (кадры, высота, ширина) типа float32.
+        Файл отображается в память, каждый кадр записывается и сбрасывается на диск сразу.
+        """
+        if num_frames is None:
+            num_frames = int(path.last_frame) + 1
+        shape = (num_frames, static_params["img_height_res"], static_params["img_width_res"])
+        stack = np.lib.format.open_memmap(file_path, mode="w+", dtype=np.float32, shape=shape)
+        try:
+            for frame_index, brightness_buffer in self.iter_frames(static_params, path, num_frames):
+                stack[frame_index] = brightness_buffer
+                stack.flush()
+        finally:
+            del stack
+        return file_path
@@ -1,10 +1,61 @@
+import time
+from collections import OrderedDict
+
 import numpy as np
 
+from lighting_basis import LightingBasis
+from profiling import StageTimer, timed_stage
+from render_cache import RenderCache
+from tone_mapping import ToneMapper
+
+
+class RenderCancelled(Exception):
+    """Расчет прерван: установлен флаг отмены cancel_event."""
+
 
 class SphereBrightnessCalculator:
-    def __init__(self):
-        pass
+    # Рассеянный свет (Ambient light) - базовая константа
+    BASE_AMBIENT_LIGHTING = 15.0
+    # Маленькое положительное число, чтобы избежать пересечений "позади" наблюдателя
+    INTERSECTION_EPSILON = 0.0001
+    # Минимальное расстояние до источника (1 мм), чтобы избежать деления на ноль
+    MIN_LIGHT_DISTANCE_M = 0.001
+    # Бюджет памяти на временные массивы затенения (точки x источники)
+    SHADING_MEMORY_BUDGET_BYTES = 64 * 1024 * 1024
+    # Оценка байт на пару (точка, источник): векторы (3 x float64) и ~8 скаляров float64
+    SHADING_BYTES_PER_PAIR = 128
+    # Порог перепада яркости между соседними пикселями (доля от максимума кадра),
+    # начиная с которого пиксель уточняется адаптивным сглаживанием
+    AA_CONTRAST_THRESHOLD = 0.1
+    # Высота полосы строк при расчете с отчетом о ходе выполнения или возможностью отмены
+    PROGRESS_BAND_ROWS = 32
+    # Кэш геометрии (G-буферов): число записей и общий объем; самая новая запись
+    # хранится всегда, даже если одна превышает объем
+    GBUFFER_CACHE_SIZE = 4
+    GBUFFER_CACHE_MAX_BYTES = 512 * 1024 * 1024
 
+    def __init__(self, gbuffer_cache_size=GBUFFER_CACHE_SIZE, render_cache=None, timer=None):
+        if gbuffer_cache_size < 1:
+            raise ValueError("Размер кэша геометрии (gbuffer_cache_size) должен быть положительным.")
+        # Статистика последнего расчета (количество трассированных пикселей и т.п.)
+        self.last_render_stats = {}
+        # Маска попаданий лучей в сферу (H, W) последнего расчета. Со сглаживанием
+        # ненулевую яркость получают и пиксели силуэта вне маски, поэтому пиксели сферы
+        # определяются по ней, а не по яркости > 0
+        self.last_hit_mask = None
+        # Кэш геометрических буферов (G-буферов) по относительной конфигурации сцены (LRU):
+        # при изменении только материала, источников или при переносе всей сцены
+        # трассировка не повторяется
+        self.gbuffer_cache_size = gbuffer_cache_size
+        self._gbuffer_cache = OrderedDict()
+        self.gbuffer_cache_hits = 0
+        self.gbuffer_cache_misses = 0
+        # Кэш готовых буферов яркости (RenderCache) по содержимому запроса, если задан
+        self.render_cache = render_cache
+        # Замеры времени этапов (profiling.StageTimer); по умолчанию выключены
+        self.timer = timer if timer is not None else StageTimer()
+
+    @timed_stage("calculate_brightness")
     def calculate_brightness(
             self,
             screen_width_mm, screen_height_mm,
@@ -12,8 +63,169 @@ class SphereBrightnessCalculator:
             observer_pos_mm,
             sphere_center_mm, sphere_radius_mm,
             light_sources_data_mm,  # Список массивов [xL, yL, zL, I0]
+            ambient_coeff, diffuse_coeff, specular_coeff, shininess,
+            engine="vectorized",
+            memory_budget_bytes=None,
+            culling=True,
+            aa_samples=0,
+            aa_contrast_threshold=None,
+            aa_seed=0,
+            progress_callback=None,
+            cancel_event=None
+    ):
+        """
+        Рассчитывает буфер яркости сферы размером (img_height_res, img_width_res).
+
+        engine : str
+            'vectorized' - весь кадр обрабатывается массивами NumPy (по умолчанию);
+            'scalar' - исходный попиксельный цикл, оставлен как эталон.
+        memory_budget_bytes : int, optional
+            Бюджет памяти на временные массивы затенения
+            (по умолчанию SHADING_MEMORY_BUDGET_BYTES).
+        culling : bool
+            Трассировать только пиксели, в которые может попасть проекция сферы
+            (аналитический расчет пролетов по строкам); остальные пиксели равны нулю.
+        aa_samples : int
+            Адаптивное сглаживание: если больше 1, пиксели на силуэте сферы и с резким
+            перепадом яркости пересчитываются по сетке aa_samples x aa_samples
+            стратифицированных подвыборок. 0 или 1 - сглаживание выключено.
+        aa_contrast_threshold : float, optional
+            Порог перепада яркости для сглаживания (по умолчанию AA_CONTRAST_THRESHOLD).
+        aa_seed : int
+            Зерно генератора смещений подвыборок (результат воспроизводим).
+        progress_callback : callable, optional
+            Вызывается как progress_callback(rows_done, rows_total) после каждой полосы
+            из PROGRESS_BAND_ROWS строк.
+        cancel_event : threading.Event, optional
+            Флаг отмены, проверяемый между полосами строк; если он установлен, расчет
+            прерывается исключением RenderCancelled, а кэш геометрии не меняется.
+
+        Геометрия кадра (маска попаданий, точки, нормали, векторы к наблюдателю)
+        сохраняется в кэше G-буферов. Если размеры экрана, разрешение, радиус сферы и
+        смещение наблюдателя относительно центра сферы уже встречались (в том числе при
+        перенесенной целиком сцене), вызов выполняет только затенение.
+
+        Если задан render_cache, буфер ищется в нем по всем параметрам расчета; при
+        попадании возвращается копия сохраненного буфера, а статистика содержит
+        render_cache_hit=True. Маска попаданий (last_hit_mask) хранится в той же записи,
+        поэтому кадр при этом не трассируется.
+        """
+        if engine == "scalar":
+            return self._calculate_brightness_scalar(
+                screen_width_mm, screen_height_mm,
+                img_width_res, img_height_res,
+                observer_pos_mm,
+                sphere_center_mm, sphere_radius_mm,
+                light_sources_data_mm,
+                ambient_coeff, diffuse_coeff, specular_coeff, shininess
+            )
+        if engine != "vectorized":
+            raise ValueError("Параметр 'engine' должен быть 'vectorized' или 'scalar'.")
+        if aa_contrast_threshold is None:
+            aa_contrast_threshold = self.AA_CONTRAST_THRESHOLD
+
+        if self.render_cache is not None:
+            self._check_cancelled(cancel_event)
+            render_cache_key = self._render_cache_key(
+                screen_width_mm=screen_width_mm, screen_height_mm=screen_height_mm,
+                img_width_res=img_width_res, img_height_res=img_height_res,
+                observer_pos_mm=observer_pos_mm,
+                sphere_center_mm=sphere_center_mm, sphere_radius_mm=sphere_radius_mm,
+                light_sources_data_mm=light_sources_data_mm,
+                ambient_coeff=ambient_coeff, diffuse_coeff=diffuse_coeff,
+                specular_coeff=specular_coeff, shininess=shininess,
+                culling=culling, aa_samples=aa_samples,
+                aa_contrast_threshold=aa_contrast_threshold, aa_seed=aa_seed
+            )
+            cached = self.render_cache.get(render_cache_key)
+            if cached is not None:
+                brightness_buffer, stats, self.last_hit_mask = cached
+                if progress_callback is not None:
+                    progress_callback(img_height_res, img_height_res)
+                stats["render_cache_hit"] = True
+                self.timer.count("render_cache_hits")
+                stats.update(self.gbuffer_cache_stats())
+                stats.update(self.render_cache.stats())
+                self.last_render_stats = stats
+                return brightness_buffer
+            render_start = time.perf_counter()
+
+        scene = self._prepare_scene(
+            screen_width_mm, screen_height_mm,
+            img_width_res, img_height_res,
+            observer_pos_mm,
+            sphere_center_mm, sphere_radius_mm,
+            light_sources_data_mm
+        )
+
+        geometry_key = self._geometry_key(
+            screen_width_mm, screen_height_mm,
+            img_width_res, img_height_res,
+            observer_pos_mm,
+            sphere_center_mm, sphere_radius_mm,
+            culling
+        )
+        if progress_callback is None and cancel_event is None:
+            gbuffer, gbuffer_reused = self._get_gbuffer(scene, geometry_key, culling)
+            brightness_buffer = self._shade_gbuffer(
+                scene, gbuffer,
+                ambient_coeff, diffuse_coeff, specular_coeff, shininess,
+                memory_budget_bytes
+            )
+        else:
+            gbuffer, gbuffer_reused, brightness_buffer = self._render_bands(
+                scene, geometry_key, culling,
+                ambient_coeff, diffuse_coeff, specular_coeff, shininess,
+                memory_budget_bytes, progress_callback, cancel_event
+            )
+
+        stats = self._new_render_stats(img_width_res * img_height_res)
+        stats["pixels_traced"] = gbuffer["pixels_traced"]
+        stats["pixels_hit"] = len(gbuffer["pixel_rows"])
+        stats["gbuffer_reused"] = gbuffer_reused
+        stats.update(self.gbuffer_cache_stats())
+        hit_mask = gbuffer["hit_mask"]
+        self.last_hit_mask = hit_mask
+
+        if aa_samples > 1:
+            self._check_cancelled(cancel_event)
+            refine_mask = self._find_edge_pixels(brightness_buffer, hit_mask, aa_contrast_threshold)
+            self._refine_pixels(
+                scene, brightness_buffer, refine_mask,
+                ambient_coeff, diffuse_coeff, specular_coeff, shininess,
+                aa_samples, aa_seed, memory_budget_bytes
+            )
+            stats["aa_samples"] = aa_samples * aa_samples
+            stats["aa_refined_pixels"] = int(np.count_nonzero(refine_mask))
+        else:
+            stats["aa_samples"] = 1
+            stats["aa_refined_pixels"] = 0
+
+        self.last_render_stats = self._finalize_render_stats(stats)
+        if self.render_cache is not None:
+            stats["render_cache_hit"] = False
+            stats["render_seconds"] = time.perf_counter() - render_start
+            self.render_cache.put(render_cache_key, brightness_buffer, stats, hit_mask=hit_mask)
+            stats.update(self.render_cache.stats())
+        return brightness_buffer
+
+    def _render_cache_key(self, **inputs):
+        """Ключ RenderCache: параметры расчета и константы модели освещения."""
+        inputs["model_constants"] = (
+            self.BASE_AMBIENT_LIGHTING, self.INTERSECTION_EPSILON, self.MIN_LIGHT_DISTANCE_M
+        )
+        return RenderCache.make_key(inputs)
+
+    def _calculate_brightness_scalar(
+            self,
+            screen_width_mm, screen_height_mm,
+            img_width_res, img_height_res,
+            observer_pos_mm,
+            sphere_center_mm, sphere_radius_mm,
+            light_sources_data_mm,
             ambient_coeff, diffuse_coeff, specular_coeff, shininess
     ):
+        """Эталонный попиксельный расчет (медленный, используется для проверки)."""
         brightness_buffer = np.zeros((img_height_res, img_width_res), dtype=np.float32)
 
         # 1. Переводим все входные параметры геометрии в метры для расчетов
@@ -72,6 +284,654 @@ class SphereBrightnessCalculator:
 
         return brightness_buffer
 
+    def _prepare_scene(
+            self,
+            screen_width_mm, screen_height_mm,
+            img_width_res, img_height_res,
+            observer_pos_mm,
+            sphere_center_mm, sphere_radius_mm,
+            light_sources_data_mm
+    ):
+        """
+        Переводит параметры сцены в метры и рассчитывает геометрию виртуального экрана.
+        Возвращает словарь, используемый векторизованными этапами расчета.
+        """
+        observer_pos_m = np.asarray(observer_pos_mm, dtype=np.float64) / 1000.0
+        sphere_center_m = np.asarray(sphere_center_mm, dtype=np.float64) / 1000.0
+        sphere_radius_m = sphere_radius_mm / 1000.0
+
+        # Таблица источников (N, 4): x, y, z в метрах и I0 в Вт/ср
+        light_sources_m = np.array(light_sources_data_mm, dtype=np.float64).reshape(-1, 4)
+        light_sources_m[:, :3] /= 1000.0
+
+        screen_width_m = screen_width_mm / 1000.0
+        screen_height_m = screen_height_mm / 1000.0
+
+        return {
+            "img_width_res": img_width_res,
+            "img_height_res": img_height_res,
+            "observer_pos_m": observer_pos_m,
+            "sphere_center_m": sphere_center_m,
+            "sphere_radius_m": sphere_radius_m,
+            "light_sources_m": light_sources_m,
+            # Экран в Z-плоскости центра сферы, центрирован по X и Y центра сферы
+            "screen_z_m": sphere_center_m[2],
+            "screen_left_x_m": sphere_center_m[0] - screen_width_m / 2.0,
+            "screen_top_y_m": sphere_center_m[1] + screen_height_m / 2.0,
+            "pixel_width_m": screen_width_m / img_width_res,
+            "pixel_height_m": screen_height_m / img_height_res,
+        }
+
+    def build_lighting_basis(
+            self,
+            screen_width_mm, screen_height_mm,
+            img_width_res, img_height_res,
+            observer_pos_mm,
+            sphere_center_mm, sphere_radius_mm,
+            light_sources_data_mm,
+            shininess,
+            culling=True,
+            memory_budget_bytes=None,
+            dtype=np.float32
+    ):
+        """
+        Рассчитывает базисные карты освещения (LightingBasis) для каждого источника
+        при единичной силе света и единичных коэффициентах Kd, Ks.
+        Столбец I0 в light_sources_data_mm игнорируется - сила света задается позже
+        в LightingBasis.brightness. Карты зависят от геометрии, положений источников
+        и блеска shininess. Геометрия берется из G-буфера, если он совпадает.
+        Память карт: 2 * M * N_источников * dtype.itemsize байт (M - пиксели сферы).
+        """
+        scene = self._prepare_scene(
+            screen_width_mm, screen_height_mm,
+            img_width_res, img_height_res,
+            observer_pos_mm,
+            sphere_center_mm, sphere_radius_mm,
+            light_sources_data_mm
+        )
+        geometry_key = self._geometry_key(
+            screen_width_mm, screen_height_mm,
+            img_width_res, img_height_res,
+            observer_pos_mm,
+            sphere_center_mm, sphere_radius_mm,
+            culling
+        )
+        gbuffer, _ = self._get_gbuffer(scene, geometry_key, culling)
+
+        light_pos_m = scene["light_sources_m"][:, :3]
+        num_points = len(gbuffer["pixel_rows"])
+        diffuse_basis = np.empty((num_points, len(light_pos_m)), dtype=dtype)
+        specular_basis = np.empty((num_points, len(light_pos_m)), dtype=dtype)
+
+        chunk_size = self._shading_chunk_size(len(light_pos_m), memory_budget_bytes)
+        for start in range(0, num_points, chunk_size):
+            stop = min(start + chunk_size, num_points)
+            diffuse_factor, specular_factor, attenuation = self._light_factors(
+                gbuffer["points_m"][start:stop],
+                gbuffer["normals"][start:stop],
+                gbuffer["view_vectors"][start:stop],
+                light_pos_m
+            )
+            diffuse_basis[start:stop] = diffuse_factor * attenuation
+            specular_basis[start:stop] = (specular_factor ** shininess) * attenuation
+
+        return LightingBasis(
+            (img_height_res, img_width_res),
+            gbuffer["pixel_rows"], gbuffer["pixel_cols"],
+            diffuse_basis, specular_basis,
+            shininess, self.BASE_AMBIENT_LIGHTING
+        )
+
+    def _get_gbuffer(self, scene, geometry_key, culling):
+        """Возвращает (G-буфер всего кадра, взят ли он из кэша), трассируя кадр при промахе."""
+        gbuffer = self._lookup_gbuffer(scene, geometry_key)
+        if gbuffer is not None:
+            return gbuffer, True
+        gbuffer = self._trace_region(scene, 0, scene["img_height_res"], 0, scene["img_width_res"], culling)
+        self._store_gbuffer(scene, geometry_key, gbuffer)
+        return gbuffer, False
+
+    def _lookup_gbuffer(self, scene, geometry_key, count=True):
+        """
+        G-буфер кэша для ключа geometry_key, перенесенный к центру сферы сцены, или None.
+        Относительно центра сферы точки, нормали и векторы к наблюдателю не меняются при
+        переносе всей сцены, поэтому к точкам достаточно прибавить смещение центра.
+        count=False - обращение не учитывается в счетчиках попаданий и промахов.
+        """
+        entry = self._gbuffer_cache.get(geometry_key)
+        if entry is None:
+            if count:
+                self.gbuffer_cache_misses += 1
+            return None
+        self._gbuffer_cache.move_to_end(geometry_key)
+        if count:
+            self.gbuffer_cache_hits += 1
+
+        gbuffer = entry["gbuffer"]
+        center_shift = scene["sphere_center_m"] - entry["sphere_center_m"]
+        if not np.any(center_shift):
+            return gbuffer
+        translated = dict(gbuffer)
+        translated["points_m"] = gbuffer["points_m"] + center_shift
+        return translated
+
+    def _store_gbuffer(self, scene, geometry_key, gbuffer):
+        """Добавляет G-буфер в кэш, вытесняя давно не использованные записи."""
+        self._gbuffer_cache[geometry_key] = {
+            "gbuffer": gbuffer,
+            "sphere_center_m": scene["sphere_center_m"].copy(),
+            "nbytes": sum(value.nbytes for value in gbuffer.values() if isinstance(value, np.ndarray)),
+        }
+        self._gbuffer_cache.move_to_end(geometry_key)
+        while len(self._gbuffer_cache) > 1 and (
+                len(self._gbuffer_cache) > self.gbuffer_cache_size
+                or self._gbuffer_cache_bytes() > self.GBUFFER_CACHE_MAX_BYTES):
+            self._gbuffer_cache.popitem(last=False)
+
+    def _gbuffer_cache_bytes(self):
+        return sum(entry["nbytes"] for entry in self._gbuffer_cache.values())
+
+    def gbuffer_cache_stats(self):
+        """Состояние кэша геометрии: число записей, объем и накопленные попадания/промахи."""
+        return {
+            "gbuffer_cache_entries": len(self._gbuffer_cache),
+            "gbuffer_cache_bytes": self._gbuffer_cache_bytes(),
+            "gbuffer_cache_hits": self.gbuffer_cache_hits,
+            "gbuffer_cache_misses": self.gbuffer_cache_misses,
+        }
+
+    def clear_gbuffer_cache(self):
+        self._gbuffer_cache.clear()
+
+    def _render_bands(
+            self,
+            scene, geometry_key, culling,
+            ambient_coeff, diffuse_coeff, specular_coeff, shininess,
+            memory_budget_bytes, progress_callback, cancel_event
+    ):
+        """
+        Трассировка (при промахе G-буфера) и затенение кадра полосами по PROGRESS_BAND_ROWS
+        строк с отчетом о ходе выполнения и проверкой флага отмены между полосами.
+        G-буфер кадра сохраняется только после расчета всех полос.
+        Возвращает (G-буфер, взят ли он из кэша, буфер яркости).
+        """
+        img_width_res, img_height_res = scene["img_width_res"], scene["img_height_res"]
+        cached_gbuffer = self._lookup_gbuffer(scene, geometry_key)
+        gbuffer_reused = cached_gbuffer is not None
+        brightness_buffer = np.zeros((img_height_res, img_width_res), dtype=np.float32)
+        band_gbuffers = []
+
+        for row_start in range(0, img_height_res, self.PROGRESS_BAND_ROWS):
+            self._check_cancelled(cancel_event)
+            row_stop = min(row_start + self.PROGRESS_BAND_ROWS, img_height_res)
+            if gbuffer_reused:
+                band_gbuffer = self._slice_gbuffer_rows(cached_gbuffer, row_start, row_stop)
+            else:
+                band_gbuffer = self._trace_region(scene, row_start, row_stop, 0, img_width_res, culling)
+                band_gbuffers.append(band_gbuffer)
+            brightness_buffer[row_start:row_stop] = self._shade_gbuffer(
+                scene, band_gbuffer,
+                ambient_coeff, diffuse_coeff, specular_coeff, shininess,
+                memory_budget_bytes
+            )
+            if progress_callback is not None:
+                progress_callback(row_stop, img_height_res)
+
+        if gbuffer_reused:
+            return cached_gbuffer, True, brightness_buffer
+        gbuffer = self._concatenate_gbuffer_rows(band_gbuffers, img_width_res)
+        self._store_gbuffer(scene, geometry_key, gbuffer)
+        return gbuffer, False, brightness_buffer
+
+    def _check_cancelled(self, cancel_event):
+        if cancel_event is not None and cancel_event.is_set():
+            raise RenderCancelled("Расчет отменен.")
+
+    def _slice_gbuffer_rows(self, gbuffer, row_start, row_stop):
+        """G-буфер полосы строк [row_start:row_stop] из G-буфера всего кадра."""
+        # Пиксели-попадания упорядочены по строкам, поэтому полосе соответствует срез
+        first, last = np.searchsorted(gbuffer["pixel_rows"], [row_start, row_stop])
+        return {
+            "row_start": row_start,
+            "col_start": gbuffer["col_start"],
+            "pixels_traced": None,
+            "hit_mask": gbuffer["hit_mask"][row_start - gbuffer["row_start"]:row_stop - gbuffer["row_start"]],
+            "pixel_rows": gbuffer["pixel_rows"][first:last],
+            "pixel_cols": gbuffer["pixel_cols"][first:last],
+            "points_m": gbuffer["points_m"][first:last],
+            "normals": gbuffer["normals"][first:last],
+            "view_vectors": gbuffer["view_vectors"][first:last],
+        }
+
+    def _concatenate_gbuffer_rows(self, band_gbuffers, img_width_res):
+        """Объединяет G-буферы последовательных полос строк во всю ширину кадра."""
+        gbuffer = {
+            "row_start": band_gbuffers[0]["row_start"],
+            "col_start": band_gbuffers[0]["col_start"],
+            "pixels_traced": sum(band["pixels_traced"] for band in band_gbuffers),
+            "hit_mask": np.concatenate([band["hit_mask"] for band in band_gbuffers]),
+        }
+        for key in ("pixel_rows", "pixel_cols", "points_m", "normals", "view_vectors"):
+            gbuffer[key] = np.concatenate([band[key] for band in band_gbuffers])
+        return gbuffer
+
+    def _geometry_key(
+            self,
+            screen_width_mm, screen_height_mm,
+            img_width_res, img_height_res,
+            observer_pos_mm,
+            sphere_center_mm, sphere_radius_mm,
+            culling
+    ):
+        """
+        Ключ G-буфера: параметры, от которых зависит трассировка первичных лучей.
+        Экран центрирован по центру сферы, поэтому от положения сцены зависит только
+        смещение наблюдателя относительно центра (округляется до 1e-9 мм, чтобы ошибки
+        округления при переносе сцены не давали разные ключи).
+        """
+        observer_offset_mm = np.asarray(observer_pos_mm, dtype=np.float64) - np.asarray(sphere_center_mm,
+                                                                                         dtype=np.float64)
+        return (
+            float(screen_width_mm), float(screen_height_mm),
+            int(img_width_res), int(img_height_res),
+            tuple(np.round(observer_offset_mm, 9).tolist()),
+            float(sphere_radius_mm),
+            bool(culling),
+        )
+
+    def _render_region(
+            self,
+            scene,
+            row_start, row_stop, col_start, col_stop,
+            ambient_coeff, diffuse_coeff, specular_coeff, shininess,
+            memory_budget_bytes=None,
+            culling=True,
+            stats=None
+    ):
+        """
+        Рассчитывает яркость прямоугольного участка кадра [row_start:row_stop, col_start:col_stop].
+        Используется для отдельных плиток; состоит из трассировки (_trace_region)
+        и затенения (_shade_gbuffer).
+        Если передан словарь stats, в нем накапливаются счетчики пикселей.
+        """
+        gbuffer = self._trace_region(scene, row_start, row_stop, col_start, col_stop, culling)
+        if stats is not None:
+            stats["pixels_traced"] += gbuffer["pixels_traced"]
+            stats["pixels_hit"] += len(gbuffer["pixel_rows"])
+        return self._shade_gbuffer(
+            scene, gbuffer,
+            ambient_coeff, diffuse_coeff, specular_coeff, shininess,
+            memory_budget_bytes
+        )
+
+    def _trace_region(self, scene, row_start, row_stop, col_start, col_stop, culling=True):
+        """
+        Трассирует первичные лучи участка кадра и возвращает G-буфер - словарь с
+        маской попаданий участка, координатами пикселей-попаданий, точками на сфере,
+        нормалями и векторами к наблюдателю.
+        При culling=True трассируются только пиксели из пролетов _sphere_footprint_spans.
+        """
+        # Пиксели-кандидаты участка (строка, столбец)
+        if culling:
+            span_rows, span_starts, span_stops = self._sphere_footprint_spans(
+                scene, row_start, row_stop, col_start, col_stop
+            )
+            pixel_rows, pixel_cols = self._expand_spans(span_rows, span_starts, span_stops)
+        else:
+            pixel_rows, pixel_cols = np.mgrid[row_start:row_stop, col_start:col_stop]
+            pixel_rows, pixel_cols = pixel_rows.ravel(), pixel_cols.ravel()
+
+        ray_directions = self._generate_primary_rays(scene, pixel_rows + 0.5, pixel_cols + 0.5)
+        ray_hits, points_on_sphere_m, normals = self._intersect_sphere_batch(
+            scene["observer_pos_m"], ray_directions, scene["sphere_center_m"], scene["sphere_radius_m"]
+        )
+
+        hit_rows = pixel_rows[ray_hits]
+        hit_cols = pixel_cols[ray_hits]
+        self.timer.count("pixels_traced", len(pixel_rows))
+        hit_mask = np.zeros((row_stop - row_start, col_stop - col_start), dtype=bool)
+        hit_mask[hit_rows - row_start, hit_cols - col_start] = True
+
+        return {
+            "row_start": row_start,
+            "col_start": col_start,
+            "pixels_traced": len(pixel_rows),
+            "hit_mask": hit_mask,
+            "pixel_rows": hit_rows,
+            "pixel_cols": hit_cols,
+            "points_m": points_on_sphere_m,
+            "normals": normals,
+            "view_vectors": self._normalize_rows(scene["observer_pos_m"] - points_on_sphere_m),
+        }
+
+    @timed_stage("shading")
+    def _shade_gbuffer(
+            self,
+            scene, gbuffer,
+            ambient_coeff, diffuse_coeff, specular_coeff, shininess,
+            memory_budget_bytes=None
+    ):
+        """Затенение по G-буферу участка: возвращает блок яркости формы gbuffer['hit_mask']."""
+        self.timer.count("shading_pairs", len(gbuffer["pixel_rows"]) * len(scene["light_sources_m"]))
+        block = np.zeros(gbuffer["hit_mask"].shape, dtype=np.float32)
+        intensities = self._calculate_blinn_phong_intensity_batch(
+            gbuffer["points_m"],
+            gbuffer["normals"],
+            scene["observer_pos_m"],
+            scene["light_sources_m"],
+            ambient_coeff,
+            diffuse_coeff,
+            specular_coeff,
+            shininess,
+            memory_budget_bytes,
+            view_vectors=gbuffer["view_vectors"]
+        )
+        block[gbuffer["pixel_rows"] - gbuffer["row_start"], gbuffer["pixel_cols"] - gbuffer["col_start"]] = intensities
+        return block
+
+    def _find_edge_pixels(self, brightness_buffer, hit_mask, contrast_threshold):
+        """
+        Отмечает пиксели для сглаживания: на границе попадание/промах (силуэт сферы)
+        и с перепадом яркости относительно соседа больше contrast_threshold * максимум кадра.
+        """
+        refine_mask = np.zeros(hit_mask.shape, dtype=bool)
+        max_brightness = float(np.max(brightness_buffer)) if brightness_buffer.size else 0.0
+        contrast_limit = contrast_threshold * max_brightness
+
+        # Сравнение с соседом снизу (ось 0) и справа (ось 1); отмечаются оба пикселя пары
+        for axis in (0, 1):
+            lead = [slice(None), slice(None)]
+            tail = [slice(None), slice(None)]
+            lead[axis] = slice(None, -1)
+            tail[axis] = slice(1, None)
+            lead, tail = tuple(lead), tuple(tail)
+
+            edges = hit_mask[lead] != hit_mask[tail]
+            if max_brightness > 0:
+                edges |= np.abs(brightness_buffer[lead] - brightness_buffer[tail]) > contrast_limit
+            refine_mask[lead] |= edges
+            refine_mask[tail] |= edges
+        return refine_mask
+
+    @timed_stage("antialiasing")
+    def _refine_pixels(
+            self,
+            scene, brightness_buffer, refine_mask,
+            ambient_coeff, diffuse_coeff, specular_coeff, shininess,
+            samples_per_side, seed, memory_budget_bytes=None
+    ):
+        """
+        Пересчитывает отмеченные пиксели как среднее по samples_per_side x samples_per_side
+        стратифицированным подвыборкам (по одной случайной точке в каждой ячейке сетки пикселя).
+        Промах подвыборки дает нулевую яркость, как и промах пикселя.
+        """
+        pixel_rows, pixel_cols = np.nonzero(refine_mask)
+        num_pixels = len(pixel_rows)
+        if num_pixels == 0:
+            return
+
+        rng = np.random.default_rng(seed)
+        num_samples = samples_per_side * samples_per_side
+        cell_y, cell_x = np.divmod(np.arange(num_samples), samples_per_side)
+        jitter = rng.random((2, num_pixels, num_samples))
+        sample_y = (pixel_rows[:, np.newaxis] + (cell_y + jitter[0]) / samples_per_side).ravel()
+        sample_x = (pixel_cols[:, np.newaxis] + (cell_x + jitter[1]) / samples_per_side).ravel()
+
+        ray_directions = self._generate_primary_rays(scene, sample_y, sample_x)
+        sample_hits, points_on_sphere_m, normals = self._intersect_sphere_batch(
+            scene["observer_pos_m"], ray_directions, scene["sphere_center_m"], scene["sphere_radius_m"]
+        )
+        sample_brightness = np.zeros(len(sample_y))
+        sample_brightness[sample_hits] = self._calculate_blinn_phong_intensity_batch(
+            points_on_sphere_m,
+            normals,
+            scene["observer_pos_m"],
+            scene["light_sources_m"],
+            ambient_coeff,
+            diffuse_coeff,
+            specular_coeff,
+            shininess,
+            memory_budget_bytes
+        )
+        brightness_buffer[pixel_rows, pixel_cols] = sample_brightness.reshape(num_pixels, num_samples).mean(axis=1)
+
+    @timed_stage("culling")
+    def _sphere_footprint_spans(self, scene, row_start, row_stop, col_start, col_stop):
+        """
+        Аналитически находит для каждой строки участка пролет столбцов [start, stop),
+        в котором луч от наблюдателя может пересечь сферу.
+
+        Для строки с фиксированной экранной координатой Y направление луча равно
+        d = (u, v, w), где меняется только u. Прямая пересекает сферу, когда
+        (oc·d)^2 - |d|^2 (|oc|^2 - R^2) >= 0, т.е. A u^2 + B u + C >= 0 -
+        квадратное неравенство по u, корни которого и задают пролет строки.
+        Пролеты расширены на соседние строки и на пиксель по краям, поэтому
+        отсечение консервативно: точный тест пересечения выполняется позже.
+
+        Возвращает массивы (rows, starts, stops) только для непустых строк.
+        """
+        rows = np.arange(row_start, row_stop)
+        full_starts = np.full(len(rows), col_start)
+        full_stops = np.full(len(rows), col_stop)
+
+        oc = scene["observer_pos_m"] - scene["sphere_center_m"]
+        k = np.dot(oc, oc) - scene["sphere_radius_m"] ** 2
+        A = oc[0] ** 2 - k
+        # Наблюдатель внутри сферы или пролеты неограничены - отсечение невозможно
+        if k <= 0 or A >= 0:
+            return rows, full_starts, full_stops
+
+        # Строки участка с запасом в одну строку с каждой стороны
+        padded_rows = np.arange(row_start - 1, row_stop + 1)
+        v = scene["screen_top_y_m"] - (padded_rows + 0.5) * scene["pixel_height_m"] - scene["observer_pos_m"][1]
+        w = scene["screen_z_m"] - scene["observer_pos_m"][2]
+
+        q = oc[1] * v + oc[2] * w
+        B = 2.0 * oc[0] * q
+        C = q * q - k * (v * v + w * w)
+        discriminant = B * B - 4.0 * A * C
+        has_span = discriminant >= 0
+
+        sqrt_discriminant = np.sqrt(np.where(has_span, discriminant, 0.0))
+        # A < 0, поэтому (-B + sqrt) / 2A - меньший корень
+        u_low = (-B + sqrt_discriminant) / (2.0 * A)
+        u_high = (-B - sqrt_discriminant) / (2.0 * A)
+
+        # u = x_экрана - x_наблюдателя -> дробный номер столбца (центр пикселя x имеет x + 0.5)
+        x_offset = scene["observer_pos_m"][0] - scene["screen_left_x_m"]
+        col_low = np.where(has_span, (u_low + x_offset) / scene["pixel_width_m"] - 0.5, np.inf)
+        col_high = np.where(has_span, (u_high + x_offset) / scene["pixel_width_m"] - 0.5, -np.inf)
+
+        # Объединение пролетов строки и ее соседей
+        col_low = np.minimum(np.minimum(col_low[:-2], col_low[1:-1]), col_low[2:])
+        col_high = np.maximum(np.maximum(col_high[:-2], col_high[1:-1]), col_high[2:])
+
+        non_empty = np.isfinite(col_low) & np.isfinite(col_high)
+        starts = np.full(len(rows), col_start)
+        stops = np.full(len(rows), col_start)
+        starts[non_empty] = np.clip(np.ceil(col_low[non_empty]) - 1, col_start, col_stop)
+        stops[non_empty] = np.clip(np.floor(col_high[non_empty]) + 2, col_start, col_stop)
+
+        non_empty &= stops > starts
+        return rows[non_empty], starts[non_empty], stops[non_empty]
+
+    def _expand_spans(self, rows, starts, stops):
+        """Разворачивает пролеты строк в плоские массивы координат пикселей (строка, столбец)."""
+        lengths = stops - starts
+        total = int(lengths.sum())
+        pixel_rows = np.repeat(rows, lengths)
+        # Смещение внутри пролета: сквозной индекс минус начало пролета в плоском массиве
+        span_offsets = np.repeat(np.cumsum(lengths) - lengths, lengths)
+        pixel_cols = np.repeat(starts, lengths) + (np.arange(total) - span_offsets)
+        return pixel_rows, pixel_cols
+
+    def _new_render_stats(self, pixels_total):
+        return {"pixels_total": pixels_total, "pixels_traced": 0, "pixels_hit": 0}
+
+    def _finalize_render_stats(self, stats):
+        """Дополняет счетчики пикселей долями отсеянных и уточненных сглаживанием пикселей."""
+        if stats["pixels_total"] > 0:
+            stats["culled_fraction"] = 1.0 - stats["pixels_traced"] / stats["pixels_total"]
+            stats["aa_refined_fraction"] = stats.get("aa_refined_pixels", 0) / stats["pixels_total"]
+        else:
+            stats["culled_fraction"] = 0.0
+            stats["aa_refined_fraction"] = 0.0
+        return stats
+
+    @timed_stage("ray_generation")
+    def _generate_primary_rays(self, scene, pixel_y, pixel_x):
+        """
+        Рассчитывает нормированные направления лучей от наблюдателя через точки экрана.
+        pixel_y, pixel_x - координаты в пикселях (центр пикселя (y, x) - это (y + 0.5, x + 0.5)).
+        Возвращает массив (N, 3).
+        """
+        targets_m = np.empty((np.size(pixel_x), 3), dtype=np.float64)
+        targets_m[:, 0] = scene["screen_left_x_m"] + pixel_x * scene["pixel_width_m"]
+        targets_m[:, 1] = scene["screen_top_y_m"] - pixel_y * scene["pixel_height_m"]  # Y уменьшается вниз
+        targets_m[:, 2] = scene["screen_z_m"]
+        return self._normalize_rows(targets_m - scene["observer_pos_m"])
+
+    def _normalize_rows(self, vectors):
+        """Нормализует каждую строку массива (N, 3); нулевые векторы остаются без изменений."""
+        norms = np.sqrt(np.einsum("ij,ij->i", vectors, vectors))
+        norms[norms == 0] = 1.0
+        return vectors / norms[:, np.newaxis]
+
+    @timed_stage("intersection")
+    def _intersect_sphere_batch(self, ray_origin_m, ray_directions, sphere_center_m, sphere_radius_m):
+        """
+        Векторизованный аналог _intersect_sphere для массива лучей (N, 3) из одной точки.
+        Возвращает маску попаданий (N,), а также точки пересечения и нормали (M, 3)
+        только для лучей, попавших в сферу.
+        """
+        oc = ray_origin_m - sphere_center_m
+        a = np.einsum("ij,ij->i", ray_directions, ray_directions)
+        b = 2.0 * (ray_directions @ oc)
+        c = np.dot(oc, oc) - sphere_radius_m ** 2
+
+        discriminant = b * b - 4 * a * c
+        hit_mask = discriminant >= 0
+
+        a = a[hit_mask]
+        b = b[hit_mask]
+        sqrt_discriminant = np.sqrt(discriminant[hit_mask])
+        t1 = (-b - sqrt_discriminant) / (2.0 * a)
+        t2 = (-b + sqrt_discriminant) / (2.0 * a)
+
+        # Наименьшее положительное t, как в скалярной версии
+        t = np.where(t1 > self.INTERSECTION_EPSILON, t1,
+                     np.where(t2 > self.INTERSECTION_EPSILON, t2, -1.0))
+        in_front = t >= 0
+        hit_mask[hit_mask] = in_front
+
+        t = t[in_front]
+        intersection_points_m = ray_origin_m + t[:, np.newaxis] * ray_directions[hit_mask]
+        normals = self._normalize_rows(intersection_points_m - sphere_center_m)
+        return hit_mask, intersection_points_m, normals
+
+    def _calculate_blinn_phong_intensity_batch(
+            self,
+            points_on_sphere_m,
+            normals,
+            observer_pos_m,
+            light_sources_m,
+            ambient_coeff,
+            diffuse_coeff,
+            specular_coeff,
+            shininess,
+            memory_budget_bytes=None,
+            light_visibility_fn=None,
+            view_vectors=None
+    ):
+        """
+        Векторизованный аналог _calculate_blinn_phong_intensity для массивов точек и нормалей (M, 3).
+        light_sources_m - таблица (N, 4) [xL, yL, zL, I0] в метрах.
+        Коэффициенты модели могут быть числами или массивами (M,) - материал каждой точки.
+
+        Все источники обрабатываются одновременно (broadcasting по оси источников),
+        а точки - порциями, размер которых подобран так, чтобы временные массивы
+        (порция x N_источников) укладывались в memory_budget_bytes.
+
+        light_visibility_fn(points, normals, light_pos_m) -> bool (K, N), если задана,
+        возвращает видимость источников из точек порции (для теней).
+        view_vectors (M, 3) - заранее рассчитанные векторы к наблюдателю (из G-буфера).
+        """
+        num_points = len(points_on_sphere_m)
+        intensity = np.empty(num_points)
+        intensity[:] = np.multiply(ambient_coeff, self.BASE_AMBIENT_LIGHTING)
+        if num_points == 0 or len(light_sources_m) == 0:
+            return intensity
+
+        light_pos_m = light_sources_m[:, :3]
+        light_intensity_I0 = light_sources_m[:, 3]
+        chunk_size = self._shading_chunk_size(len(light_sources_m), memory_budget_bytes)
+
+        for start in range(0, num_points, chunk_size):
+            stop = min(start + chunk_size, num_points)
+            points = points_on_sphere_m[start:stop]
+            point_normals = normals[start:stop]
+
+            # Вектор от точки на сфере к наблюдателю не зависит от источника: (K, 3)
+            if view_vectors is not None:
+                V = view_vectors[start:stop]
+            else:
+                V = self._normalize_rows(observer_pos_m - points)
+
+            diffuse_factor, specular_factor, attenuation = self._light_factors(
+                points, point_normals, V, light_pos_m
+            )
+
+            contribution = (self._per_point(diffuse_coeff, start, stop) * diffuse_factor
+                            + self._per_point(specular_coeff, start, stop)
+                            * (specular_factor ** self._per_point(shininess, start, stop)))
+            contribution *= attenuation
+            if light_visibility_fn is not None:
+                contribution *= light_visibility_fn(points, point_normals, light_pos_m)
+            intensity[start:stop] += contribution @ light_intensity_I0
+
+        return intensity
+
+    def _light_factors(self, points_m, normals, view_vectors, light_pos_m):
+        """
+        Геометрические множители модели Блинна-Фонга для точек (K, 3) и источников (N, 3):
+        max(0, N·L), max(0, N·H) и ослабление 1/d^2 - массивы (K, N).
+        """
+        # Векторы от точек к источникам: (K, N, 3)
+        to_light = light_pos_m[np.newaxis, :, :] - points_m[:, np.newaxis, :]
+        distance_to_light_m = np.sqrt(np.einsum("knj,knj->kn", to_light, to_light))
+        safe_distance = np.where(distance_to_light_m == 0, 1.0, distance_to_light_m)
+        L = to_light / safe_distance[:, :, np.newaxis]
+
+        # Диффузное отражение
+        diffuse_factor = np.maximum(0.0, np.einsum("kj,knj->kn", normals, L))
+
+        # Зеркальное отражение (Блинн-Фонг), H вычисляется на месте в массиве L
+        H = L
+        H += view_vectors[:, np.newaxis, :]
+        H_norm = np.sqrt(np.einsum("knj,knj->kn", H, H))
+        H_norm[H_norm == 0] = 1.0
+        specular_factor = np.maximum(0.0, np.einsum("kj,knj->kn", normals, H)) / H_norm
+
+        np.maximum(distance_to_light_m, self.MIN_LIGHT_DISTANCE_M, out=distance_to_light_m)
+        attenuation = 1.0 / (distance_to_light_m ** 2)
+        return diffuse_factor, specular_factor, attenuation
+
+    def _per_point(self, value, start, stop):
+        """Число возвращается как есть, массив (M,) - срезом в форме столбца (K, 1)."""
+        if np.ndim(value) == 0:
+            return value
+        return np.asarray(value)[start:stop, np.newaxis]
+
+    def _shading_chunk_size(self, num_lights, memory_budget_bytes=None):
+        """
+        Количество точек в одной порции затенения, при котором временные массивы
+        размером (порция, num_lights) не превышают бюджет памяти.
+        """
+        if memory_budget_bytes is None:
+            memory_budget_bytes = self.SHADING_MEMORY_BUDGET_BYTES
+        bytes_per_point = max(1, num_lights) * self.SHADING_BYTES_PER_PAIR
+        return max(1, int(memory_budget_bytes // bytes_per_point))
+
     def _normalize(self, v):
         """Нормализует вектор. Не зависит от единиц измерения, так как это относительный вектор."""
         norm = np.linalg.norm(v)
@@ -101,7 +961,7 @@ class SphereBrightnessCalculator:
         # Выбираем наименьшее положительное t. Epsilon для борьбы с плавающей точкой
         # Луч должен идти вперед от наблюдателя, поэтому t должно быть положительным
         t = -1.0
-        EPSILON = 0.0001  # Маленькое положительное число, чтобы избежать пересечений "позади" наблюдателя
+        EPSILON = self.INTERSECTION_EPSILON
 
         if t1 > EPSILON:
             t = t1
@@ -132,10 +992,8 @@ class SphereBrightnessCalculator:
         """
         intensity = 0.0
 
-        # Рассеянный свет (Ambient light) - базовая константа
-        # Можно поиграться с этим значением
-        BASE_AMBIENT_LIGHTING = 15.0
-        intensity += ambient_coeff * BASE_AMBIENT_LIGHTING
+        # Рассеянный свет (Ambient light) - базовая константа класса
+        intensity += ambient_coeff * self.BASE_AMBIENT_LIGHTING
 
         for light_source_data in light_sources_data_m:
             light_pos_m = light_source_data[:3]
@@ -158,8 +1016,8 @@ class SphereBrightnessCalculator:
             distance_to_light_m = np.linalg.norm(light_pos_m - point_on_sphere_m)
 
             # Избегаем деления на ноль, если источник света слишком близко
-            if distance_to_light_m < 0.001:  # 1 мм
-                distance_to_light_m = 0.001
+            if distance_to_light_m < self.MIN_LIGHT_DISTANCE_M:  # 1 мм
+                distance_to_light_m = self.MIN_LIGHT_DISTANCE_M
 
             attenuation = 1.0 / (distance_to_light_m ** 2)
 
@@ -168,6 +1026,7 @@ class SphereBrightnessCalculator:
 
         return intensity
 
+    @timed_stage("normalize_brightness_to_image")
     def normalize_brightness_to_image(self, brightness_map):
         """Нормирует значения яркости к диапазону 0-255."""
         max_val = np.max(brightness_map)
@@ -177,82 +1036,166 @@ class SphereBrightnessCalculator:
         normalized_map = (brightness_map / max_val) * 255
         return normalized_map.astype(np.uint8)
 
-    def get_sample_points_info(
+    @timed_stage("tone_map_image")
+    def tone_map_image(self, brightness_map, curve="linear", white_percentile=100.0, gamma=2.2, log_scale=100.0):
+        """
+        Тональная компрессия буфера яркости в 0-255 (см. tone_mapping.ToneMapper):
+        белая точка - процентиль white_percentile яркости сферы, кривая 'linear', 'gamma' или 'log'.
+        При значениях по умолчанию совпадает с normalize_brightness_to_image.
+        """
+        tone_mapper = ToneMapper(curve, white_percentile, gamma=gamma, log_scale=log_scale)
+        return tone_mapper.tone_map(brightness_map)
+
+    def probe_pixels(
             self,
-            brightness_map,
+            pixel_coords,
             screen_width_mm, screen_height_mm,
             img_width_res, img_height_res,
             observer_pos_mm,
             sphere_center_mm, sphere_radius_mm,
             light_sources_data_mm,
             ambient_coeff, diffuse_coeff, specular_coeff, shininess,
-            num_points=3
+            culling=True,
+            memory_budget_bytes=None
     ):
-        sample_points_info = []
+        """
+        Векторизованный опрос пикселей: яркость, мировые координаты и нормали.
 
-        visible_indices = np.argwhere(brightness_map > 0)
+        pixel_coords - массив (K, 2) координат пикселей (x, y).
+        Если в кэше есть G-буфер той же геометрии, точки и нормали берутся из него; иначе все запрошенные пиксели трассируются за один проход.
+        Яркость рассчитывается по центру пикселя (без сглаживания).
 
-        if len(visible_indices) == 0:
-            for _ in range(num_points):
-                sample_points_info.append({
-                    "pixel_coords": (0, 0),
-                    "world_coords": "N/A (сфера не видна/не освещена)",
-                    "brightness": 0.0
-                })
-            return sample_points_info
+        Возвращает словарь массивов:
+            'pixel_coords' (K, 2), 'hit' (K,) bool,
+            'world_coords_mm' (K, 3) и 'normals' (K, 3) - NaN для промахов,
+            'brightness' (K,) - 0 для промахов.
+        """
+        pixel_coords = np.asarray(pixel_coords, dtype=np.int64).reshape(-1, 2)
+        pixel_x, pixel_y = pixel_coords[:, 0], pixel_coords[:, 1]
+        if np.any((pixel_x < 0) | (pixel_x >= img_width_res) | (pixel_y < 0) | (pixel_y >= img_height_res)):
+            raise ValueError("Координаты пикселей выходят за пределы изображения.")
 
-        num_to_sample = min(num_points, len(visible_indices))
-        rng = np.random.default_rng()
-        chosen_indices_idx = rng.choice(len(visible_indices), size=num_to_sample, replace=False)
-        chosen_pixel_coords = visible_indices[chosen_indices_idx]
+        scene = self._prepare_scene(
+            screen_width_mm, screen_height_mm,
+            img_width_res, img_height_res,
+            observer_pos_mm,
+            sphere_center_mm, sphere_radius_mm,
+            light_sources_data_mm
+        )
+        geometry_key = self._geometry_key(
+            screen_width_mm, screen_height_mm,
+            img_width_res, img_height_res,
+            observer_pos_mm,
+            sphere_center_mm, sphere_radius_mm,
+            culling
+        )
 
-        observer_pos_m = observer_pos_mm / 1000.0
-        sphere_center_m = sphere_center_mm / 1000.0
-        sphere_radius_m = sphere_radius_mm / 1000.0
+        gbuffer = self._lookup_gbuffer(scene, geometry_key, count=False)
+        if gbuffer is not None:
+            # Пиксели-попадания G-буфера упорядочены по строкам, поэтому их плоские
+            # индексы отсортированы и поиск выполняется бинарно
+            gbuffer_flat = gbuffer["pixel_rows"] * img_width_res + gbuffer["pixel_cols"]
+            probe_flat = pixel_y * img_width_res + pixel_x
+            positions = np.minimum(np.searchsorted(gbuffer_flat, probe_flat), max(len(gbuffer_flat) - 1, 0))
+            hit = np.zeros(len(pixel_coords), dtype=bool)
+            if len(gbuffer_flat) > 0:
+                hit = gbuffer_flat[positions] == probe_flat
+            positions = positions[hit]
+            points_m = gbuffer["points_m"][positions]
+            normals = gbuffer["normals"][positions]
+            view_vectors = gbuffer["view_vectors"][positions]
+        else:
+            ray_directions = self._generate_primary_rays(scene, pixel_y + 0.5, pixel_x + 0.5)
+            hit, points_m, normals = self._intersect_sphere_batch(
+                scene["observer_pos_m"], ray_directions, scene["sphere_center_m"], scene["sphere_radius_m"]
+            )
+            view_vectors = self._normalize_rows(scene["observer_pos_m"] - points_m)
 
-        light_sources_data_m = []
-        for light_data_mm in light_sources_data_mm:
-            light_pos_m = light_data_mm[:3] / 1000.0
-            light_intensity_I0 = light_data_mm[3]
-            light_sources_data_m.append(np.array([light_pos_m[0], light_pos_m[1], light_pos_m[2], light_intensity_I0]))
+        brightness = np.zeros(len(pixel_coords))
+        brightness[hit] = self._calculate_blinn_phong_intensity_batch(
+            points_m,
+            normals,
+            scene["observer_pos_m"],
+            scene["light_sources_m"],
+            ambient_coeff,
+            diffuse_coeff,
+            specular_coeff,
+            shininess,
+            memory_budget_bytes,
+            view_vectors=view_vectors
+        )
+        world_coords_mm = np.full((len(pixel_coords), 3), np.nan)
+        world_coords_mm[hit] = points_m * 1000.0  # обратно в мм для отображения
+        probe_normals = np.full((len(pixel_coords), 3), np.nan)
+        probe_normals[hit] = normals
 
-        screen_z_m = sphere_center_m[2]  # Плоскость, на которой проецируются пиксели
-        screen_width_m = screen_width_mm / 1000.0
-        screen_height_m = screen_height_mm / 1000.0
-        screen_left_x_m = sphere_center_m[0] - screen_width_m / 2.0
-        screen_top_y_m = sphere_center_m[1] + screen_height_m / 2.0
+        return {
+            "pixel_coords": pixel_coords,
+            "hit": hit,
+            "world_coords_mm": world_coords_mm,
+            "normals": probe_normals,
+            "brightness": brightness,
+        }
+
+    def get_sample_points_info(
+            self,
+            brightness_map,
+            screen_width_mm, screen_height_mm,
+            img_width_res, img_height_res,
+            observer_pos_mm,
+            sphere_center_mm, sphere_radius_mm,
+            light_sources_data_mm,
+            ambient_coeff, diffuse_coeff, specular_coeff, shininess,
+            num_points=3,
+            seed=None,
+            pixel_coords=None,
+            hit_mask=None
+    ):
+        """
+        Информация о случайных видимых точках сферы (или о заданных пикселях pixel_coords (x, y)).
+        seed - зерно выбора точек: при одинаковом seed выбираются одни и те же пиксели.
+        hit_mask - маска попаданий кадра (last_hit_mask): точки выбираются среди пикселей
+        сферы; без нее - среди пикселей с яркостью > 0 (без сглаживания это одно и то же).
+        """
+        sample_points_info = []
 
-        for py, px in chosen_pixel_coords:
-            pixel_x_m = screen_left_x_m + (px + 0.5) * (screen_width_m / img_width_res)
-            pixel_y_m = screen_top_y_m - (py + 0.5) * (screen_height_m / img_height_res)
+        if pixel_coords is None:
+            visible_indices = np.argwhere(hit_mask if hit_mask is not None else brightness_map > 0)
 
-            ray_origin_m = observer_pos_m
-            ray_target_on_screen_m = np.array([pixel_x_m, pixel_y_m, screen_z_m])
-            ray_direction = self._normalize(ray_target_on_screen_m - ray_origin_m)
+            if len(visible_indices) == 0:
+                for _ in range(num_points):
+                    sample_points_info.append({
+                        "pixel_coords": (0, 0),
+                        "world_coords": "N/A (сфера не видна/не освещена)",
+                        "brightness": 0.0
+                    })
+                return sample_points_info
 
-            point_on_sphere_m, normal_at_point = self._intersect_sphere(
-                ray_origin_m, ray_direction, sphere_center_m, sphere_radius_m
-            )
+            num_to_sample = min(num_points, len(visible_indices))
+            rng = np.random.default_rng(seed)
+            chosen_indices_idx = rng.choice(len(visible_indices), size=num_to_sample, replace=False)
+            # argwhere возвращает (y, x), опрос ожидает (x, y)
+            pixel_coords = visible_indices[chosen_indices_idx][:, ::-1]
 
-            intensity = 0.0
-            world_coords_display = "N/A (вне сферы)"
-
-            if point_on_sphere_m is not None:
-                intensity = self._calculate_blinn_phong_intensity(
-                    point_on_sphere_m,
-                    normal_at_point,
-                    observer_pos_m,
-                    light_sources_data_m,
-                    ambient_coeff,
-                    diffuse_coeff,
-                    specular_coeff,
-                    shininess
-                )
-                world_coords_display = point_on_sphere_m * 1000.0  # обратно в мм для отображения
+        probes = self.probe_pixels(
+            pixel_coords,
+            screen_width_mm, screen_height_mm,
+            img_width_res, img_height_res,
+            observer_pos_mm,
+            sphere_center_mm, sphere_radius_mm,
+            light_sources_data_mm,
+            ambient_coeff, diffuse_coeff, specular_coeff, shininess
+        )
+
+        for i, (px, py) in enumerate(probes["pixel_coords"]):
+            if probes["hit"][i]:
+                world_coords_display = probes["world_coords_mm"][i]
+            else:
+                world_coords_display = "N/A (вне сферы)"
 
             sample_points_info.append({
-                "pixel_coords": (px, py),
+                "pixel_coords": (int(px), int(py)),
                 "world_coords": world_coords_display,
-                "brightness": intensity
+                "brightness": float(probes["brightness"][i])
             })
-        return sample_points_info
\ No newline at end of file
+        return sample_points_info
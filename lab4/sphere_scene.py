@@ -0,0 +1,318 @@
+import numpy as np
+
+from sphere_brightness_calculator import SphereBrightnessCalculator
+
+
+class SphereScene:
+    """
+    Сцена из множества сфер с иерархией ограничивающих объемов (BVH).
+
+    Сферы сортируются по коду Мортона центров и группируются в листья по
+    leaf_size сфер; над листьями строится сбалансированное двоичное дерево
+    (неявная нумерация: у узла i потомки 2i + 1 и 2i + 2). Обход дерева
+    выполняется "фронтом": на каждом шаге каждый активный луч снимает со
+    своего стека один узел, поэтому число шагов растет как глубина дерева,
+    т.е. логарифмически от числа сфер, а работа внутри шага векторизована.
+
+    Координаты центров и радиусы задаются в миллиметрах, как и в
+    SphereBrightnessCalculator; внутри все хранится в метрах.
+    materials - массив (N, 4) [Ka, Kd, Ks, shininess] для каждой сферы
+    или None (тогда коэффициенты передаются в render()).
+    """
+
+    DEFAULT_LEAF_SIZE = 4
+    # Количество лучей, обрабатываемых за один проход обхода BVH
+    RAY_CHUNK_SIZE = 65536
+    # Дополнительные байты на пару (точка, источник) при трассировке теневых лучей:
+    # начало, направление (2 x 3 x float64) и стек обхода
+    SHADOW_BYTES_PER_PAIR = 160
+
+    def __init__(self, centers_mm, radii_mm, materials=None, leaf_size=DEFAULT_LEAF_SIZE):
+        centers_m = np.asarray(centers_mm, dtype=np.float64).reshape(-1, 3) / 1000.0
+        radii_m = np.asarray(radii_mm, dtype=np.float64).reshape(-1) / 1000.0
+        if len(radii_m) != len(centers_m):
+            raise ValueError("Количество радиусов должно совпадать с количеством центров сфер.")
+        if len(centers_m) == 0:
+            raise ValueError("Сцена должна содержать хотя бы одну сферу.")
+        if np.any(radii_m <= 0):
+            raise ValueError("Радиусы сфер должны быть положительными.")
+        if materials is not None:
+            materials = np.asarray(materials, dtype=np.float64)
+            if materials.shape != (len(centers_m), 4):
+                raise ValueError("Материалы должны быть массивом (N, 4): Ka, Kd, Ks, shininess.")
+        if leaf_size < 1:
+            raise ValueError("Размер листа (leaf_size) должен быть положительным.")
+
+        self.centers_m = centers_m
+        self.radii_m = radii_m
+        self.materials = materials
+        self.leaf_size = leaf_size
+        self.calculator = SphereBrightnessCalculator()
+        self.last_render_stats = {}
+
+        # Ограничивающая сфера всей сцены (используется для экрана и отсечения)
+        self.bounding_center_m = (np.min(centers_m - radii_m[:, np.newaxis], axis=0)
+                                  + np.max(centers_m + radii_m[:, np.newaxis], axis=0)) / 2.0
+        self.bounding_radius_m = float(np.max(
+            np.linalg.norm(centers_m - self.bounding_center_m, axis=1) + radii_m))
+
+        self._build_bvh()
+
+    @property
+    def num_spheres(self):
+        return len(self.radii_m)
+
+    def _build_bvh(self):
+        """Строит BVH: сортировка по коду Мортона и восходящий расчет AABB узлов."""
+        self._order = np.argsort(self._morton_codes(self.centers_m), kind="stable")
+        self._sorted_centers_m = self.centers_m[self._order]
+        self._sorted_radii_m = self.radii_m[self._order]
+
+        num_leaves = -(-self.num_spheres // self.leaf_size)
+        self._depth = int(np.ceil(np.log2(num_leaves))) if num_leaves > 1 else 0
+        padded_leaves = 1 << self._depth
+        self._first_leaf = padded_leaves - 1
+        num_nodes = 2 * padded_leaves - 1
+
+        self._node_min = np.full((num_nodes, 3), np.inf)
+        self._node_max = np.full((num_nodes, 3), -np.inf)
+        self._node_valid = np.zeros(num_nodes, dtype=bool)
+
+        # Листья: AABB группы из leaf_size подряд идущих сфер
+        sphere_min = self._sorted_centers_m - self._sorted_radii_m[:, np.newaxis]
+        sphere_max = self._sorted_centers_m + self._sorted_radii_m[:, np.newaxis]
+        leaf_starts = np.arange(num_leaves) * self.leaf_size
+        leaf_nodes = self._first_leaf + np.arange(num_leaves)
+        self._node_min[leaf_nodes] = np.minimum.reduceat(sphere_min, leaf_starts, axis=0)
+        self._node_max[leaf_nodes] = np.maximum.reduceat(sphere_max, leaf_starts, axis=0)
+        self._node_valid[leaf_nodes] = True
+
+        # Внутренние узлы, уровень за уровнем снизу вверх
+        for level in range(self._depth - 1, -1, -1):
+            nodes = np.arange((1 << level) - 1, (1 << (level + 1)) - 1)
+            left, right = 2 * nodes + 1, 2 * nodes + 2
+            self._node_min[nodes] = np.minimum(self._node_min[left], self._node_min[right])
+            self._node_max[nodes] = np.maximum(self._node_max[left], self._node_max[right])
+            self._node_valid[nodes] = self._node_valid[left] | self._node_valid[right]
+
+    def _morton_codes(self, points):
+        """30-битные коды Мортона точек (по 10 бит на ось) внутри их AABB."""
+        low = points.min(axis=0)
+        extent = points.max(axis=0) - low
+        extent[extent == 0] = 1.0
+        quantized = np.clip((points - low) / extent * 1023.0, 0, 1023).astype(np.uint64)
+
+        codes = np.zeros(len(points), dtype=np.uint64)
+        for axis in range(3):
+            # Раздвигаем биты: между соседними битами оси вставляем по два нулевых
+            v = quantized[:, axis]
+            v = (v | (v << np.uint64(16))) & np.uint64(0x030000FF)
+            v = (v | (v << np.uint64(8))) & np.uint64(0x0300F00F)
+            v = (v | (v << np.uint64(4))) & np.uint64(0x030C30C3)
+            v = (v | (v << np.uint64(2))) & np.uint64(0x09249249)
+            codes |= v << np.uint64(2 - axis)
+        return codes
+
+    def _traverse(self, ray_origins_m, ray_directions, t_max, any_hit=False):
+        """
+        Обход BVH для лучей (N, 3) с нормированными направлениями.
+        Возвращает (номера сфер (N,) или -1, расстояния t (N,), число шагов обхода).
+        При any_hit=True луч останавливается на первом найденном пересечении (теневые лучи).
+        """
+        num_rays = len(ray_directions)
+        t_best = np.array(t_max, dtype=np.float64)
+        hit_ids = np.full(num_rays, -1, dtype=np.int64)
+        if num_rays == 0:
+            return hit_ids, t_best, 0
+
+        safe_directions = np.where(ray_directions == 0, 1e-30, ray_directions)
+        inv_directions = 1.0 / safe_directions
+
+        stack = np.empty((num_rays, self._depth + 2), dtype=np.int32)
+        stack[:, 0] = 0
+        stack_size = np.ones(num_rays, dtype=np.int32)
+        active = np.arange(num_rays)
+        steps = 0
+
+        while active.size:
+            steps += 1
+            stack_size[active] -= 1
+            nodes = stack[active, stack_size[active]]
+
+            # Тест луча с AABB узла (метод плит)
+            origins = ray_origins_m[active]
+            t0 = (self._node_min[nodes] - origins) * inv_directions[active]
+            t1 = (self._node_max[nodes] - origins) * inv_directions[active]
+            t_near = np.minimum(t0, t1).max(axis=1)
+            t_far = np.maximum(t0, t1).min(axis=1)
+            entered = (self._node_valid[nodes] & (t_near <= t_far) & (t_far >= 0)
+                       & (t_near < t_best[active]))
+            rays = active[entered]
+            nodes = nodes[entered]
+            is_leaf = nodes >= self._first_leaf
+
+            # Внутренние узлы: кладем обоих потомков на стек (левый снимется первым)
+            inner_rays = rays[~is_leaf]
+            inner_nodes = nodes[~is_leaf]
+            top = stack_size[inner_rays]
+            stack[inner_rays, top] = 2 * inner_nodes + 2
+            stack[inner_rays, top + 1] = 2 * inner_nodes + 1
+            stack_size[inner_rays] += 2
+
+            # Листья: проверяем все сферы листа
+            leaf_rays = rays[is_leaf]
+            leaf_first_sphere = (nodes[is_leaf] - self._first_leaf) * self.leaf_size
+            for offset in range(self.leaf_size):
+                spheres = leaf_first_sphere + offset
+                valid = spheres < self.num_spheres
+                ray_ids = leaf_rays[valid]
+                spheres = spheres[valid]
+                t = self._intersect_spheres(ray_origins_m[ray_ids], ray_directions[ray_ids],
+                                            self._sorted_centers_m[spheres], self._sorted_radii_m[spheres])
+                closer = t < t_best[ray_ids]
+                ray_ids = ray_ids[closer]
+                t_best[ray_ids] = t[closer]
+                hit_ids[ray_ids] = self._order[spheres[closer]]
+                if any_hit:
+                    stack_size[ray_ids] = 0
+
+            active = active[stack_size[active] > 0]
+
+        return hit_ids, t_best, steps
+
+    def _intersect_spheres(self, ray_origins_m, ray_directions, centers_m, radii_m):
+        """Попарное пересечение лучей с нормированными направлениями и сфер; inf - нет пересечения."""
+        oc = ray_origins_m - centers_m
+        b = np.einsum("ij,ij->i", oc, ray_directions)
+        c = np.einsum("ij,ij->i", oc, oc) - radii_m ** 2
+        discriminant = b * b - c
+        sqrt_discriminant = np.sqrt(np.maximum(discriminant, 0.0))
+        t1 = -b - sqrt_discriminant
+        t2 = -b + sqrt_discriminant
+
+        epsilon = self.calculator.INTERSECTION_EPSILON
+        t = np.where(t1 > epsilon, t1, np.where(t2 > epsilon, t2, np.inf))
+        t[discriminant < 0] = np.inf
+        return t
+
+    def closest_hit(self, ray_origins_mm, ray_directions):
+        """
+        Ближайшее пересечение лучей со сферами сцены.
+        Возвращает номера сфер (-1 - промах) и расстояния до пересечения в мм (inf - промах).
+        """
+        ray_origins_m = np.asarray(ray_origins_mm, dtype=np.float64).reshape(-1, 3) / 1000.0
+        ray_directions = self.calculator._normalize_rows(
+            np.asarray(ray_directions, dtype=np.float64).reshape(-1, 3))
+        ray_origins_m = np.broadcast_to(ray_origins_m, ray_directions.shape)
+        hit_ids, t, _ = self._traverse(ray_origins_m, ray_directions, np.full(len(ray_directions), np.inf))
+        return hit_ids, t * 1000.0
+
+    def _light_visibility(self, points_m, normals, light_pos_m):
+        """
+        Видимость источников из точек: (K, 3) точек -> bool (K, N_источников).
+        Теневые лучи трассируются только для источников перед поверхностью точки.
+        """
+        to_light = light_pos_m[np.newaxis, :, :] - points_m[:, np.newaxis, :]
+        facing = np.einsum("kj,knj->kn", normals, to_light) > 0
+        visible = np.ones(facing.shape, dtype=bool)
+
+        point_ids, light_ids = np.nonzero(facing)
+        if len(point_ids) == 0:
+            return visible
+
+        # Начало теневого луча немного смещено по нормали, чтобы не пересечь собственную сферу
+        origins = points_m[point_ids] + normals[point_ids] * self.calculator.INTERSECTION_EPSILON
+        directions = light_pos_m[light_ids] - origins
+        distances = np.linalg.norm(directions, axis=1)
+        directions = self.calculator._normalize_rows(directions)
+
+        hit_ids, _, _ = self._traverse(origins, directions, distances, any_hit=True)
+        visible[point_ids, light_ids] = hit_ids < 0
+        self._shadow_rays_traced += len(point_ids)
+        return visible
+
+    def render(
+            self,
+            screen_width_mm, screen_height_mm,
+            img_width_res, img_height_res,
+            observer_pos_mm,
+            light_sources_data_mm,
+            ambient_coeff=0.35, diffuse_coeff=1.0, specular_coeff=0.9, shininess=180.0,
+            shadows=True,
+            memory_budget_bytes=None
+    ):
+        """
+        Рассчитывает буфер яркости сцены по модели Блинна-Фонга.
+
+        Экран расположен так же, как в SphereBrightnessCalculator, но относительно
+        ограничивающей сферы всей сцены: в Z-плоскости ее центра и центрирован по X, Y.
+        Коэффициенты модели используются, если у сцены не заданы материалы.
+        shadows - учитывать затенение источников другими сферами.
+        """
+        bounding_center_mm = self.bounding_center_m * 1000.0
+        bounding_radius_mm = self.bounding_radius_m * 1000.0
+        scene = self.calculator._prepare_scene(
+            screen_width_mm, screen_height_mm,
+            img_width_res, img_height_res,
+            observer_pos_mm,
+            bounding_center_mm, bounding_radius_mm,
+            light_sources_data_mm
+        )
+        observer_pos_m = scene["observer_pos_m"]
+        brightness_buffer = np.zeros((img_height_res, img_width_res), dtype=np.float32)
+
+        if memory_budget_bytes is None:
+            memory_budget_bytes = self.calculator.SHADING_MEMORY_BUDGET_BYTES
+        light_visibility_fn = None
+        if shadows:
+            light_visibility_fn = self._light_visibility
+            # Теневые лучи увеличивают память на пару (точка, источник)
+            shading_bytes = self.calculator.SHADING_BYTES_PER_PAIR
+            memory_budget_bytes = memory_budget_bytes * shading_bytes // (shading_bytes + self.SHADOW_BYTES_PER_PAIR)
+
+        stats = self.calculator._new_render_stats(img_width_res * img_height_res)
+        stats["spheres"] = self.num_spheres
+        stats["bvh_nodes"] = len(self._node_valid)
+        stats["traversal_steps"] = 0
+        self._shadow_rays_traced = 0
+
+        # Отсечение по проекции ограничивающей сферы сцены
+        span_rows, span_starts, span_stops = self.calculator._sphere_footprint_spans(
+            scene, 0, img_height_res, 0, img_width_res
+        )
+        pixel_rows, pixel_cols = self.calculator._expand_spans(span_rows, span_starts, span_stops)
+        stats["pixels_traced"] = len(pixel_rows)
+
+        for start in range(0, len(pixel_rows), self.RAY_CHUNK_SIZE):
+            rows = pixel_rows[start:start + self.RAY_CHUNK_SIZE]
+            cols = pixel_cols[start:start + self.RAY_CHUNK_SIZE]
+            ray_directions = self.calculator._generate_primary_rays(scene, rows + 0.5, cols + 0.5)
+            ray_origins_m = np.broadcast_to(observer_pos_m, ray_directions.shape)
+
+            hit_ids, t, steps = self._traverse(ray_origins_m, ray_directions, np.full(len(rows), np.inf))
+            stats["traversal_steps"] += steps
+            hit = hit_ids >= 0
+            if not np.any(hit):
+                continue
+            hit_ids = hit_ids[hit]
+
+            points_m = observer_pos_m + t[hit, np.newaxis] * ray_directions[hit]
+            normals = self.calculator._normalize_rows(points_m - self.centers_m[hit_ids])
+
+            if self.materials is not None:
+                ambient, diffuse, specular, exponent = self.materials[hit_ids].T
+            else:
+                ambient, diffuse, specular, exponent = ambient_coeff, diffuse_coeff, specular_coeff, shininess
+
+            intensities = self.calculator._calculate_blinn_phong_intensity_batch(
+                points_m, normals, observer_pos_m, scene["light_sources_m"],
+                ambient, diffuse, specular, exponent,
+                memory_budget_bytes,
+                light_visibility_fn=light_visibility_fn
+            )
+            brightness_buffer[rows[hit], cols[hit]] = intensities
+            stats["pixels_hit"] += len(intensities)
+
+        stats["shadow_rays"] = self._shadow_rays_traced
+        self.last_render_stats = self.calculator._finalize_render_stats(stats)
+        return brightness_buffer
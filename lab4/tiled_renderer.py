@@ -0,0 +1,163 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from sphere_brightness_calculator import SphereBrightnessCalculator
+
+# Калькулятор, создаваемый один раз в каждом процессе пула
+_worker_calculator = None
+
+
+def _render_tile(shm_name, buffer_shape, scene, tile, shading_params, memory_budget_bytes, culling):
+    """
+    Рассчитывает одну плитку в процессе пула и записывает ее в общую память.
+    Выполняется в дочернем процессе, поэтому определена на уровне модуля.
+    Возвращает счетчики пикселей плитки.
+    """
+    global _worker_calculator
+    if _worker_calculator is None:
+        _worker_calculator = SphereBrightnessCalculator()
+
+    row_start, row_stop, col_start, col_stop = tile
+    stats = _worker_calculator._new_render_stats((row_stop - row_start) * (col_stop - col_start))
+    block = _worker_calculator._render_region(
+        scene, row_start, row_stop, col_start, col_stop,
+        *shading_params,
+        memory_budget_bytes=memory_budget_bytes,
+        culling=culling,
+        stats=stats
+    )
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    try:
+        output = np.ndarray(buffer_shape, dtype=np.float32, buffer=shm.buf)
+        output[row_start:row_stop, col_start:col_stop] = block
+        del output
+    finally:
+        shm.close()
+    return stats
+
+
+class TiledRenderer:
+    """
+    Плиточный параллельный расчет яркости сферы в пуле процессов.
+
+    Кадр делится на плитки tile_size x tile_size, каждая плитка рассчитывается
+    в отдельном процессе и записывается напрямую в общую память (shared memory),
+    после чего результат копируется в brightness_buffer.
+    Пул процессов создается при первом расчете и переиспользуется; его нужно
+    закрыть через close() (или использовать объект как контекстный менеджер).
+    """
+
+    DEFAULT_TILE_SIZE = 128
+
+    def __init__(self, workers=None, tile_size=DEFAULT_TILE_SIZE):
+        if workers is None:
+            workers = os.cpu_count() or 1
+        if workers < 1:
+            raise ValueError("Количество процессов (workers) должно быть положительным.")
+        if tile_size < 1:
+            raise ValueError("Размер плитки (tile_size) должен быть положительным.")
+
+        self.workers = workers
+        self.tile_size = tile_size
+        self.calculator = SphereBrightnessCalculator()
+        self.last_render_stats = {}
+        self._executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """Останавливает пул процессов."""
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    def split_into_tiles(self, img_width_res, img_height_res):
+        """Возвращает список плиток (row_start, row_stop, col_start, col_stop), покрывающих кадр."""
+        tiles = []
+        for row_start in range(0, img_height_res, self.tile_size):
+            row_stop = min(row_start + self.tile_size, img_height_res)
+            for col_start in range(0, img_width_res, self.tile_size):
+                col_stop = min(col_start + self.tile_size, img_width_res)
+                tiles.append((row_start, row_stop, col_start, col_stop))
+        return tiles
+
+    def calculate_brightness(
+            self,
+            screen_width_mm, screen_height_mm,
+            img_width_res, img_height_res,
+            observer_pos_mm,
+            sphere_center_mm, sphere_radius_mm,
+            light_sources_data_mm,
+            ambient_coeff, diffuse_coeff, specular_coeff, shininess,
+            memory_budget_bytes=None,
+            culling=True
+    ):
+        """
+        Тот же расчет, что и SphereBrightnessCalculator.calculate_brightness,
+        но выполняемый плитками в пуле процессов.
+        """
+        scene = self.calculator._prepare_scene(
+            screen_width_mm, screen_height_mm,
+            img_width_res, img_height_res,
+            observer_pos_mm,
+            sphere_center_mm, sphere_radius_mm,
+            light_sources_data_mm
+        )
+        shading_params = (ambient_coeff, diffuse_coeff, specular_coeff, shininess)
+        tiles = self.split_into_tiles(img_width_res, img_height_res)
+        buffer_shape = (img_height_res, img_width_res)
+        stats = self.calculator._new_render_stats(img_width_res * img_height_res)
+        stats["tiles"] = len(tiles)
+        stats["workers"] = self.workers
+
+        # Одному процессу пул не нужен: рассчитываем участок целиком на месте
+        if self.workers == 1 or len(tiles) <= 1:
+            brightness_buffer = self.calculator._render_region(
+                scene, 0, img_height_res, 0, img_width_res,
+                *shading_params,
+                memory_budget_bytes=memory_budget_bytes,
+                culling=culling,
+                stats=stats
+            )
+            self.last_render_stats = self.calculator._finalize_render_stats(stats)
+            return brightness_buffer
+
+        buffer_size = img_height_res * img_width_res * np.dtype(np.float32).itemsize
+        shm = shared_memory.SharedMemory(create=True, size=max(1, buffer_size))
+        try:
+            shared_output = np.ndarray(buffer_shape, dtype=np.float32, buffer=shm.buf)
+            shared_output.fill(0.0)
+
+            executor = self._get_executor()
+            futures = [
+                executor.submit(_render_tile, shm.name, buffer_shape, scene, tile,
+                                shading_params, memory_budget_bytes, culling)
+                for tile in tiles
+            ]
+            for future in futures:
+                # result() пробрасывает исключения из дочерних процессов
+                tile_stats = future.result()
+                stats["pixels_traced"] += tile_stats["pixels_traced"]
+                stats["pixels_hit"] += tile_stats["pixels_hit"]
+
+            brightness_buffer = shared_output.copy()
+            del shared_output
+        finally:
+            shm.close()
+            shm.unlink()
+
+        self.last_render_stats = self.calculator._finalize_render_stats(stats)
+        return brightness_buffer